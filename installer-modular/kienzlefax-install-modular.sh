@@ -1473,7 +1473,7 @@ COMMON_PACKAGES=(
 )
 FAX_PACKAGES=(
   acl apache2 libapache2-mod-php
-  php php-cli php-sqlite3 php-mbstring sqlite3
+  php php-cli php-sqlite3 php-mbstring php-zip sqlite3
   qpdf ghostscript poppler-utils libtiff-tools
   ocrmypdf tesseract-ocr tesseract-ocr-deu tesseract-ocr-eng
   inotify-tools img2pdf python3-pikepdf unpaper
@@ -2618,7 +2618,7 @@ cat >/etc/asterisk/manager.d/kfx.conf <<EOFCONF
 secret = ${KFX_AMI_SECRET}
 deny=0.0.0.0/0.0.0.0
 permit=127.0.0.1/255.255.255.255
-read = system,call,log,command,reporting
+read = system,call,log,command,reporting,dialplan
 write = system,call,command,reporting,originate
 EOFCONF
 chmod 0644 /etc/asterisk/manager.d/kfx.conf
@@ -2744,6 +2744,11 @@ PRACTICE_NAME=${PRACTICE_NAME_ENV}
 # optional tuning
 KFX_MAX_INFLIGHT=2
 KFX_POST_CALL_COOLDOWN_SEC=20
+
+# Archiv-Ablage (siehe kienzlefax-archive): Dokument einmal je Inhalt speichern,
+# Sendeberichte aelter als N Tage in Monatspakete (0 = aus)
+#KFX_ARCHIVE_DEDUP=1
+#KFX_ARCHIVE_COMPACT_DAYS=90
 EOFENV
 chmod 0600 /etc/default/kienzlefax-worker
 chown root:root /etc/default/kienzlefax-worker
@@ -2950,6 +2955,9 @@ lines = [
     "- /etc/cups/cupsd.conf",
     "- /usr/local/bin/kienzlefax-worker.py",
     "- /usr/local/bin/pdf_with_header.sh",
+    "- /usr/local/lib/kienzlefax/kfx_header.py",
+    "- /usr/local/lib/kienzlefax/kfx_archive.py",
+    "- /usr/local/bin/kienzlefax-archive",
     "- /usr/local/bin/scan-ocr-watch.sh",
     "- /srv/kienzlefax/config/sources.json",
     "",
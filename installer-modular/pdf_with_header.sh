@@ -1,3 +1,166 @@
+sudo mkdir -p /usr/local/lib/kienzlefax
+sudo tee /usr/local/lib/kienzlefax/kfx_header.py >/dev/null <<'PY'
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+kfx_header.py — Kopfzeile fuer Fax-PDFs (Datum | Praxis | Seite x/y)
+
+Wird vom Worker direkt importiert (warme Imports, kein Prozessstart je Job);
+/usr/local/bin/pdf_with_header.sh ist nur noch die CLI dazu.
+
+Alle Overlays eines Dokuments entstehen in EINEM reportlab-Canvas (eine Seite je
+Dokumentseite). Gleiche Seitengroessen/Seitenzahl/Datum (z. B. mehrere Empfaenger
+in derselben Minute) nutzen den Overlay-Cache. Der Cache haelt nur die PDF-Bytes
+(Zugriff unter Lock); jeder Aufruf parst daraus eigene Seitenobjekte, da der Worker
+stamp_pdf aus mehreren Threads aufruft.
+"""
+
+import os
+import sys
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+try:
+    from pypdf import PdfReader, PdfWriter, Transformation
+    from pypdf._page import PageObject
+except ModuleNotFoundError:
+    from PyPDF2 import PdfReader, PdfWriter, Transformation
+    from PyPDF2._page import PageObject
+
+OVERLAY_CACHE_MAX = 32
+
+
+@dataclass(frozen=True)
+class HeaderStyle:
+    practice: str = "KienzleFax"
+    date_fmt: str = "%d.%m.%Y %H:%M"
+    top_offset_mm: float = 4.0     # distance from top edge to text baseline (smaller => higher)
+    header_band_mm: float = 3.0    # slim reserved top band; original content is scaled below it
+    left_margin_mm: float = 12.0
+    right_margin_mm: float = 12.0
+    font_name: str = "Helvetica"
+    font_size: float = 8.0
+
+    @classmethod
+    def from_env(cls, env: Optional[Dict[str, str]] = None) -> "HeaderStyle":
+        env = os.environ if env is None else env
+        d = cls()
+        return cls(
+            practice=env.get("PRACTICE_NAME") or d.practice,
+            date_fmt=env.get("DATE_FMT") or d.date_fmt,
+            top_offset_mm=float(env.get("TOP_OFFSET_MM") or d.top_offset_mm),
+            header_band_mm=float(env.get("HEADER_BAND_MM") or d.header_band_mm),
+            left_margin_mm=float(env.get("LEFT_MARGIN_MM") or d.left_margin_mm),
+            right_margin_mm=float(env.get("RIGHT_MARGIN_MM") or d.right_margin_mm),
+            font_name=env.get("FONT_NAME") or d.font_name,
+            font_size=float(env.get("FONT_SIZE") or d.font_size),
+        )
+
+
+_overlay_cache: Dict[tuple, bytes] = {}
+_overlay_lock = threading.Lock()
+
+
+def make_overlays(sizes: List[Tuple[float, float]], stamp_date: str, style: HeaderStyle) -> list:
+    """
+    One overlay page per document page with a 3-part header:
+      left: date/time, center: practice name, right: page x/y
+    The pages are fresh objects per call (callers merge them into their own writer).
+    """
+    key = (tuple(sizes), stamp_date, style)
+    with _overlay_lock:
+        data = _overlay_cache.pop(key, None)
+        if data is None:
+            data = render_overlays(sizes, stamp_date, style)
+        _overlay_cache[key] = data  # most recently used goes last
+        while len(_overlay_cache) > OVERLAY_CACHE_MAX:
+            _overlay_cache.pop(next(iter(_overlay_cache)))
+    return list(PdfReader(BytesIO(data)).pages)
+
+
+def render_overlays(sizes: List[Tuple[float, float]], stamp_date: str, style: HeaderStyle) -> bytes:
+    """All overlays in one reportlab canvas; returns the PDF bytes."""
+    total_pages = len(sizes)
+    buf = BytesIO()
+    c = canvas.Canvas(buf)
+    for page_no, (page_w, page_h) in enumerate(sizes, start=1):
+        c.setPageSize((page_w, page_h))
+        c.setFont(style.font_name, style.font_size)
+
+        # Compact fax header near the top edge.
+        y = page_h - (style.top_offset_mm * mm)
+        x_left = style.left_margin_mm * mm
+        x_right_edge = page_w - (style.right_margin_mm * mm)
+        right_text = f"Seite {page_no}/{total_pages}"
+
+        c.drawString(x_left, y, stamp_date)
+        w_right = stringWidth(right_text, style.font_name, style.font_size)
+        c.drawString(x_right_edge - w_right, y, right_text)
+        w_center = stringWidth(style.practice, style.font_name, style.font_size)
+        c.drawString((page_w - w_center) / 2.0, y, style.practice)
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def stamp_pdf(in_path: Path, out_path: Path, style: Optional[HeaderStyle] = None,
+              stamp_date: Optional[str] = None) -> int:
+    """Writes in_path with header to out_path; returns the page count."""
+    style = style or HeaderStyle.from_env()
+    if stamp_date is None:
+        stamp_date = datetime.now().strftime(style.date_fmt)
+
+    reader = PdfReader(str(in_path))
+    pages = list(reader.pages)
+    sizes = [(float(p.mediabox.width), float(p.mediabox.height)) for p in pages]
+    overlays = make_overlays(sizes, stamp_date, style)
+
+    writer = PdfWriter()
+    header_band = max(0.0, style.header_band_mm * mm)
+    for page, (w, h), overlay in zip(pages, sizes, overlays):
+        content_h = max(1.0, h - header_band)
+        scale = min(1.0, content_h / h)
+        tx = (w - (w * scale)) / 2.0
+        ty = 0.0
+
+        composed = PageObject.create_blank_page(width=w, height=h)
+        page.add_transformation(Transformation().scale(scale).translate(tx=tx, ty=ty))
+        composed.merge_page(page)
+        composed.merge_page(overlay)
+        writer.add_page(composed)
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with out_path.open("wb") as f:
+        writer.write(f)
+    return len(pages)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2:
+        print("Usage: pdf_with_header.sh INPUT.pdf OUTPUT.pdf", file=sys.stderr)
+        return 2
+    in_path, out_path = Path(argv[0]), Path(argv[1])
+    if not in_path.is_file():
+        print(f"ERROR: input not found: {in_path}", file=sys.stderr)
+        return 2
+    stamp_pdf(in_path, out_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+PY
+
 sudo tee /usr/local/bin/pdf_with_header.sh >/dev/null <<'EOF'
 #!/usr/bin/env bash
 set -euo pipefail
@@ -10,7 +173,8 @@ set -euo pipefail
 #   Center:"<PRACTICE_NAME>"
 #   Right: "Seite X/Y"
 #
-# Customize via env:
+# Thin CLI over /usr/local/lib/kienzlefax/kfx_header.py (the worker imports that
+# module directly). Customize via env:
 #   PRACTICE_NAME="Praxis Dr. Beispiel"
 #   DATE_FMT="%d.%m.%Y %H:%M"
 #   TOP_OFFSET_MM="4"     # distance from top edge to text baseline (smaller => higher)
@@ -25,124 +189,7 @@ if [[ $# -lt 2 ]]; then
   exit 2
 fi
 
-IN="$1"
-OUT="$2"
-
-if [[ ! -f "$IN" ]]; then
-  echo "ERROR: input not found: $IN" >&2
-  exit 2
-fi
-
-PRACTICE_NAME="${PRACTICE_NAME:-KienzleFax}"
-DATE_FMT="${DATE_FMT:-%d.%m.%Y %H:%M}"
-
-TOP_OFFSET_MM="${TOP_OFFSET_MM:-4}"
-HEADER_BAND_MM="${HEADER_BAND_MM:-3}"
-LEFT_MARGIN_MM="${LEFT_MARGIN_MM:-12}"
-RIGHT_MARGIN_MM="${RIGHT_MARGIN_MM:-12}"
-
-FONT_NAME="${FONT_NAME:-Helvetica}"
-FONT_SIZE="${FONT_SIZE:-8}"
-
-python3 - "$IN" "$OUT" "$PRACTICE_NAME" "$DATE_FMT" \
-        "$TOP_OFFSET_MM" "$HEADER_BAND_MM" "$LEFT_MARGIN_MM" "$RIGHT_MARGIN_MM" \
-        "$FONT_NAME" "$FONT_SIZE" <<'PY'
-import sys
-from datetime import datetime
-from pathlib import Path
-from io import BytesIO
-
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import mm
-from reportlab.pdfbase.pdfmetrics import stringWidth
-
-try:
-    from pypdf import PdfReader, PdfWriter, Transformation
-    from pypdf._page import PageObject
-except ModuleNotFoundError:
-    from PyPDF2 import PdfReader, PdfWriter, Transformation
-    from PyPDF2._page import PageObject
-
-in_path = Path(sys.argv[1])
-out_path = Path(sys.argv[2])
-
-practice = sys.argv[3]
-date_fmt = sys.argv[4]
-
-top_offset_mm = float(sys.argv[5])
-header_band_mm = float(sys.argv[6])
-left_margin_mm = float(sys.argv[7])
-right_margin_mm = float(sys.argv[8])
-
-font_name = sys.argv[9]
-font_size = float(sys.argv[10])
-
-reader = PdfReader(str(in_path))
-total_pages = len(reader.pages)
-stamp_date = datetime.now().strftime(date_fmt)
-
-writer = PdfWriter()
-
-def make_overlay(page_w, page_h, page_no, total_pages):
-    """
-    Create a single-page PDF overlay (in memory) with a 3-part header:
-      left: date/time
-      center: practice name
-      right: page x/y
-    """
-    buf = BytesIO()
-    c = canvas.Canvas(buf, pagesize=(page_w, page_h))
-
-    c.setFont(font_name, font_size)
-
-    # Compact fax header near the top edge.
-    y = page_h - (top_offset_mm * mm)
-
-    left_text = stamp_date
-    center_text = practice
-    right_text = f"Seite {page_no}/{total_pages}"
-
-    x_left = left_margin_mm * mm
-    x_right_edge = page_w - (right_margin_mm * mm)
-
-    # Left
-    c.drawString(x_left, y, left_text)
-
-    # Right (right-aligned)
-    w_right = stringWidth(right_text, font_name, font_size)
-    c.drawString(x_right_edge - w_right, y, right_text)
-
-    # Center (centered on page)
-    w_center = stringWidth(center_text, font_name, font_size)
-    c.drawString((page_w - w_center) / 2.0, y, center_text)
-
-    c.showPage()
-    c.save()
-    buf.seek(0)
-    return PdfReader(buf).pages[0]
-
-for idx, page in enumerate(reader.pages, start=1):
-    w = float(page.mediabox.width)
-    h = float(page.mediabox.height)
-
-    header_band = max(0.0, header_band_mm * mm)
-    content_h = max(1.0, h - header_band)
-    scale = min(1.0, content_h / h)
-    tx = (w - (w * scale)) / 2.0
-    ty = 0.0
-
-    composed = PageObject.create_blank_page(width=w, height=h)
-    page.add_transformation(Transformation().scale(scale).translate(tx=tx, ty=ty))
-    composed.merge_page(page)
-
-    overlay = make_overlay(w, h, idx, total_pages)
-    composed.merge_page(overlay)
-    writer.add_page(composed)
-
-out_path.parent.mkdir(parents=True, exist_ok=True)
-with out_path.open("wb") as f:
-    writer.write(f)
-PY
+exec python3 /usr/local/lib/kienzlefax/kfx_header.py "$1" "$2"
 EOF
 
-sudo chmod +x /usr/local/bin/pdf_with_header.sh
+sudo chmod +x /usr/local/bin/pdf_with_header.sh /usr/local/lib/kienzlefax/kfx_header.py
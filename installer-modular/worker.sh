@@ -7,8 +7,8 @@ sudo tee /usr/local/bin/kienzlefax-worker.py >/dev/null <<'PY'
 # -*- coding: utf-8 -*-
 """
 kienzlefax-worker.py — Asterisk-Only Worker (SendFAX)
-Version: 1.3.19
-Stand:  2026-07-07
+Version: 1.3.32
+Stand:  2026-10-17
 Autor:  Dr. Thomas Kienzle
 
 Changelog (komplett):
@@ -101,18 +101,155 @@ Changelog (komplett):
     dial_start nach erfolgreicher Provider-Kapazitaetsreservierung erhoeht.
   - Status DEFERRED bei voller externer Kapazitaet wird nach dem normalen Cooldown
     ohne Verbrauch eines Sendeversuchs in die Queue zurueckgestellt.
+- 1.3.20:
+  - Vorbereitungsstufe getrennt vom Versandslot:
+    Kopfzeilen-PDF (doc_hdr.pdf) und G4-TIFF (doc.tif) werden fuer wartende Queue-Jobs
+    vorab in einem begrenzten Prozesspool erzeugt (KFX_PREPARE_WORKERS, Default 2;
+    0 = wie bisher synchron in submit_job). Der Stand steht in job.json unter "prepare".
+  - Geclaimt werden nur Jobs, deren Dateien fertig sind (oder deren Vorbereitung
+    fehlgeschlagen ist, damit der Fehler im normalen Submit-Pfad sichtbar wird).
+- 1.3.21:
+  - Inhaltsadressierter Render-Cache unter KFX_RENDER_CACHE_DIR (Default BASE/cache/render):
+    Kopfzeilen-PDF (SHA-256 des Quell-PDF + Kopfzeilenparameter + Datumsstempel) und
+    G4-TIFF (SHA-256 des gesendeten PDF + Device/DPI) werden per Hardlink wiederverwendet,
+    z.B. derselbe Brief an mehrere Empfaenger. Groesse begrenzt (KFX_RENDER_CACHE_MAX_MB,
+    Default 512, 0 = aus), LRU-Verdraengung, Hit/Miss-Zaehler im Log.
+  - Der Datumsstempel der Kopfzeile wird vom Worker festgelegt und an pdf_with_header.sh
+    uebergeben, damit Cache-Schluessel und gedruckter Stempel identisch sind.
+- 1.3.22:
+  - Job-Store als austauschbare Schicht (KFX_JOB_STORE):
+    "fs" (Default) liest wie bisher job.json aus queue/processing;
+    "sqlite" fuehrt zusaetzlich einen Index in KFX_JOB_DB (Default BASE/jobs.sqlite, WAL)
+    mit indizierten Spalten status/number/next_try_at. Inflight-Zaehlung, belegte
+    Nummern und faellige Retries sind dann Index-Abfragen; der Claim reserviert den Job
+    transaktional (UPDATE ... RETURNING) vor dem Verzeichnis-rename.
+  - job.json und PDFs bleiben im Dateisystem massgeblich (Webinterface/AGI schreiben direkt);
+    der Index liest nur job.json-Dateien neu, deren stat sich geaendert hat.
+  - Aenderungszaehler meta.change_seq fuer Long-Polling im Webinterface (?ajax=changes).
+- 1.3.23:
+  - Eine dauerhafte AMI-Sitzung statt Connect+Login+Logoff pro Aktion:
+    Originate, Hangup und CoreShowChannels teilen sich einen angemeldeten Client
+    (gepufferter Leser, Antwortzuordnung ueber ActionID, Ping bei Leerlauf
+    > KFX_AMI_PING_SEC, automatisches Neu-Anmelden mit Backoff bis KFX_AMI_BACKOFF_MAX_SEC).
+  - Hangup und CoreShowChannels werden bei abgerissener Sitzung einmal auf einer frischen
+    Sitzung wiederholt; Originate nie (Doppelversand-Schutz).
+- 1.3.24:
+  - Live-Fortschritt ereignisgesteuert statt `asterisk -rx`-Polling:
+    Eine zweite AMI-Sitzung mit Events (Filter auf SendFAX/FAXStatus/FAXSession*/Hangup)
+    fuehrt ein In-Memory-Modell pro Kanal/Job; Seitenstand kommt per AMI-Aktion
+    FAXSessions/FAXSession ueber dieselbe Sitzung (kein Prozessstart).
+  - Jede Aenderung wird sofort in die kompakte Statusdatei BASE/live-status.json geschrieben
+    (wie vom Webinterface gelesen); job.json (live.asterisk_fax) nur bei Aenderung,
+    nicht mehr alle KFX_FAX_LIVE_REFRESH_SEC.
+  - Seitenzahl des TIFF wird direkt aus der IFD-Kette gelesen statt per tiffinfo.
+  - KFX_FAX_LIVE_EVENTS=0 oder keine Event-Sitzung: bisheriges Polling als Rueckfall.
+  - manager.d/kfx.conf braucht dafuer read-Klasse "dialplan" (Installer ergaenzt).
+- 1.3.25:
+  - Sammelsendung (opt-in, KFX_COALESCE=1): beim Claim werden weitere wartende Jobs an
+    dieselbe normalisierte Nummer (created_at innerhalb KFX_COALESCE_WINDOW_SEC, max.
+    KFX_COALESCE_MAX_JOBS Dokumente / KFX_COALESCE_MAX_PAGES Seiten) als BUNDLED mit in
+    processing genommen und in EINEM Anruf gesendet (TIFFs per tiffcp verkettet; jede
+    Kopfzeile behaelt ihre eigene Seitenzaehlung). Ein Anruf = ein Cooldown.
+  - Jeder Job bekommt danach sein eigenes Ergebnis und seinen eigenen Bericht: Dokumente,
+    deren Seiten laut faxpages_sent vollstaendig uebertragen wurden, gelten als OK, auch
+    wenn der Anruf danach abbrach; der Rest folgt dem Anruf (FAILED) oder geht mit dessen
+    Retry-Zeitpunkt einzeln zurueck in die Queue (RETRY/DEFERRED/Abbruch des Leitjobs).
+- 1.3.26:
+  - Retry-Zeitgeber im Speicher (Heap nach Faelligkeit): Jobs in RETRY_WAIT werden beim
+    Claim nicht mehr jede Sekunde geoeffnet und geparst, sondern erst, wenn ihr
+    next_try_at erreicht ist. Aufbau beim Start aus job.json, Pflege bei requeue_retry;
+    ein extern geaenderter Zeitpunkt wird beim Ablauf aus job.json uebernommen.
+  - Backoff je Ursache konfigurierbar: Verzoegerung = Basis x Faktor^(n-1), gedeckelt,
+    mit Jitter (KFX_RETRY_FACTOR, KFX_RETRY_MAX_DELAY_SEC, KFX_RETRY_JITTER; einzelne
+    Ursachen per KFX_RETRY_POLICY="CONGESTION=20:2:600,BUSY=90:1.5:1800").
+    n zaehlt aufeinanderfolgende Retries mit derselben Ursache (retry.streak);
+    Basis ist die Verzoegerung der AGI-Regel. Default KFX_RETRY_FACTOR=1 + JITTER=0 = bisher
+    (feste AGI-Verzoegerung); ein Faktor > 1 verlaengert die Gesamtdauer der AGI-Versuche
+    (30 x CONGESTION mit 20 s: ~10 min, mit Faktor 2 und Deckel 900 s: ~6 h).
+- 1.3.27:
+  - Seitenparalleles Rendern grosser PDFs: ab KFX_RENDER_PARALLEL_MIN_PAGES Seiten
+    (Default 16, 0 = aus) wird das Dokument in zusammenhaengende Seitenbereiche
+    (-dFirstPage/-dLastPage, mind. KFX_RENDER_CHUNK_PAGES Seiten je Teil) zerlegt, die
+    parallel als eigene gs-Prozesse laufen (KFX_RENDER_WORKERS, Default CPUs /
+    KFX_PREPARE_WORKERS). Kleinere Dokumente: ein gs-Aufruf wie bisher.
+  - Die Teil-TIFFs werden ohne Neukodierung zu einem mehrseitigen TIFF verkettet: die
+    G4-Strips und alle Tags werden unveraendert uebernommen, nur Offsets und PageNumber
+    werden neu gesetzt (Ergebnis wie ein einzelner gs-Lauf). Seitenzahl wird geprueft;
+    bei jedem Fehler Rueckfall auf den Ein-Aufruf-Modus.
+- 1.3.28:
+  - Uebertragungsoptimierung (opt-in, KFX_OPTIMIZE=1), vor Kopfzeile und TIFF:
+    * Leerseiten: Analyse mit gs in niedriger Aufloesung (KFX_OPTIMIZE_ANALYSIS_DPI,
+      Default 50), Seiten mit Schwaerzung < KFX_OPTIMIZE_BLANK_INK (Anteil, Default
+      0.0002; Randstreifen ignoriert) werden per qpdf entfernt (doc_opt.pdf).
+      KFX_OPTIMIZE_BLANK=trailing (Default, nur Leerseiten am Ende) | all | off.
+      Die Kopfzeile wird danach gestempelt, "Seite x/y" zaehlt also die gesendeten
+      Seiten. Ein komplett leeres Dokument geht unveraendert raus.
+    * Graustufen werden geschwellt statt gerastert (KFX_OPTIMIZE_THRESHOLD, Grauwert
+      0..1, Default 0.6; 0 = gs-Raster wie bisher).
+    * KFX_OPTIMIZE_DESPECKLE=1: Graustufen-Rendering, Schwelle + Entfernen einzelner
+      Stoerpixel in Python, danach kodiert gs die Bitmap 1:1 mit tiffg4 (gleiches
+      TIFF-Layout wie bisher; kein seitenparalleles Rendern).
+  - job.json["optimize"]: Modus, entfernte Leerseiten und je gesendeter Seite
+    geschaetzte (est_bytes) und tatsaechliche G4-Bytes (bytes) samt Summen.
+- 1.3.29:
+  - Kopfzeile im Prozess: das Modul /usr/local/lib/kienzlefax/kfx_header.py (kommt mit
+    pdf_with_header.sh, KFX_HEADER_MODULE) wird einmal importiert und direkt aufgerufen,
+    statt je Job bash + python3 + pypdf/reportlab neu zu starten. Es wird beim Start
+    geladen, die Prepare-Prozesse erben die warmen Imports.
+  - Overlays eines Dokuments entstehen in einem Canvas-Durchlauf und werden einmal
+    geparst; gleiche Seitengroessen/Seitenzahl/Stempel kommen aus dem Overlay-Cache.
+  - Ohne Modul (oder wenn der Import scheitert): pdf_with_header.sh wie bisher.
+- 1.3.30:
+  - Archiv-Index: /usr/local/lib/kienzlefax/kfx_archive.py (mit worker.sh installiert,
+    KFX_ARCHIVE_MODULE) fuehrt BASE/archive-index.sqlite (KFX_ARCHIVE_DB) mit einer Zeile
+    je Archiv-JSON aus sendeberichte/ und sendefehler/berichte/ (Empfaenger, Nummer,
+    Status, Grund, Seiten, Zeitpunkte, Dateinamen) und FTS5-Volltextsuche.
+  - finalize_ok/finalize_failed tragen ein; beim Start gleicht ein Hintergrund-Thread den
+    Index inkrementell mit den Verzeichnissen ab (neue/geaenderte JSONs nach mtime,
+    verschwundene raus). Die Weboberflaeche liest Listen/Zaehler/Resend-Zuordnung daraus.
+  - CLI: kienzlefax-archive backfill | query | count | find-failure | add | remove.
+- 1.3.31:
+  - Archiv-Ablage (kfx_archive.py, BASE/archive-store): KFX_ARCHIVE_DEDUP=1 legt das
+    gesendete Dokument einmal je Inhalt (sha256) unter objects/ ab; der __OK.pdf enthaelt
+    dann nur die Berichtsseite, job.json["archive_store"] verweist auf das Dokument.
+    Ein Brief an acht Empfaenger liegt so einmal im Archiv statt achtmal.
+  - KFX_ARCHIVE_COMPACT_DAYS=N (Default 0 = aus): der Index-Thread packt einmal taeglich
+    Sendeberichte, die aelter als N Tage sind, in packs/JJJJ-MM.zip (JSON + Berichtsseite)
+    und zerlegt dabei klassische Bericht+Dokument-PDFs. Der Index fuehrt die Pakete mit.
+  - kienzlefax-archive rebuild NAME.json stellt das klassische PDF (Bericht + Dokument)
+    wieder her, compact/gc laufen auch manuell. Sendefehler bleiben unveraendert.
+- 1.3.32:
+  - Metriken wie im HylaFAX-Worker: Zaehler und Latenz-Histogramme je Stufe (queue_wait,
+    prepare, header, submit = AMI-Originate, call = Originate bis Anrufende, finalize),
+    abgeschlossene Jobs je Ergebnis (OK/FAILED/cancelled), Rueckstellungen
+    (kfx_jobs_requeued_total: RETRY bzw. DEFERRED), Queue-Tiefe, Inflight, RETRY_WAIT und
+    Laufzeit je Subprozess (gs, qpdf, tiffcp, tiffinfo, asterisk, Kopfzeilen-Skript).
+    gs-Zeiten aus dem Vorbereitungs-Pool werden mit dem Ergebnis an den Worker gemeldet.
+  - Prometheus-Text unter http://KFX_METRICS_LISTEN/metrics (Default 127.0.0.1:9465,
+    leer = aus), Zusammenfassung per log() alle KFX_METRICS_SUMMARY_SEC (Default 300) s.
 """
 
 import fcntl
+import hashlib
 import json
+import heapq
+import importlib.util
+import multiprocessing
 import os
+import random
 import re
 import shutil
 import socket
+import select
+import sqlite3
+import struct
 import subprocess
 import sys
+import threading
 import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from typing import Any, Dict, Optional, Tuple, List
 
@@ -128,14 +265,38 @@ AMI_PORT = int(os.environ.get("KFX_AMI_PORT", "5038"))
 AMI_USER = os.environ.get("KFX_AMI_USER", "kfx")
 AMI_PASS = os.environ.get("KFX_AMI_PASS", "")
 DIAL_CONTEXT = os.environ.get("KFX_DIAL_CONTEXT", "fax-out")
+AMI_TIMEOUT_SEC = float(os.environ.get("KFX_AMI_TIMEOUT_SEC", "5"))
+AMI_PING_SEC = float(os.environ.get("KFX_AMI_PING_SEC", "30"))
+AMI_BACKOFF_MAX_SEC = float(os.environ.get("KFX_AMI_BACKOFF_MAX_SEC", "30"))
 
 QPDF_BIN = os.environ.get("KFX_QPDF_BIN", "qpdf")
 GS_BIN = os.environ.get("KFX_GS_BIN", "gs")
 PDF_HEADER_SCRIPT = Path(os.environ.get("KFX_PDF_HEADER_SCRIPT", "/usr/local/bin/pdf_with_header.sh"))
+HEADER_MODULE = Path(os.environ.get("KFX_HEADER_MODULE", "/usr/local/lib/kienzlefax/kfx_header.py"))
+ARCHIVE_MODULE = Path(os.environ.get("KFX_ARCHIVE_MODULE", "/usr/local/lib/kienzlefax/kfx_archive.py"))
+# opt-in: documents once per content in the archive store, __OK.pdf = report page only
+ARCHIVE_DEDUP = os.environ.get("KFX_ARCHIVE_DEDUP", "0").strip() == "1"
+# > 0: reports older than N days go into monthly packs (checked once a day)
+ARCHIVE_COMPACT_DAYS = int(os.environ.get("KFX_ARCHIVE_COMPACT_DAYS", "0"))
+ARCHIVE_COMPACT_INTERVAL_SEC = 86400
 
 MAX_INFLIGHT_PROCESSING = int(os.environ.get("KFX_MAX_INFLIGHT", "1"))
 POLL_INTERVAL_SEC = float(os.environ.get("KFX_POLL_INTERVAL_SEC", "1.0"))
 POST_CALL_COOLDOWN_SEC = float(os.environ.get("KFX_POST_CALL_COOLDOWN_SEC", "20.0"))
+
+# opt-in: several queued jobs to the same number go out in one call
+COALESCE = os.environ.get("KFX_COALESCE", "0").strip() == "1"
+COALESCE_WINDOW_SEC = float(os.environ.get("KFX_COALESCE_WINDOW_SEC", "300"))
+COALESCE_MAX_JOBS = int(os.environ.get("KFX_COALESCE_MAX_JOBS", "10"))
+COALESCE_MAX_PAGES = int(os.environ.get("KFX_COALESCE_MAX_PAGES", "60"))
+TIFFCP_BIN = os.environ.get("KFX_TIFFCP_BIN", "tiffcp")
+# retry backoff: delay = base * factor^(n-1), capped, minus up to jitter; base from the AGI rule.
+# Defaults keep the AGI's fixed delay: its attempt limits assume it.
+RETRY_FACTOR = float(os.environ.get("KFX_RETRY_FACTOR", "1.0"))
+RETRY_MAX_DELAY_SEC = float(os.environ.get("KFX_RETRY_MAX_DELAY_SEC", "900"))
+RETRY_JITTER = float(os.environ.get("KFX_RETRY_JITTER", "0"))
+# per cause "REASON=base:factor:cap,..." (empty fields keep the defaults)
+RETRY_POLICY = os.environ.get("KFX_RETRY_POLICY", "")
 ORPHAN_CALL_TIMEOUT_SEC = float(os.environ.get("KFX_ORPHAN_CALL_TIMEOUT_SEC", "120.0"))
 
 # wichtig: Default 3600 wie im funktionierenden System
@@ -144,16 +305,62 @@ AMI_ORIGINATE_WAIT_SEC = int(os.environ.get("KFX_AMI_ORIGINATE_WAIT_SEC", "3600"
 ASTERISK_BIN = os.environ.get("KFX_ASTERISK_BIN", "asterisk")
 TIFFINFO_BIN = os.environ.get("KFX_TIFFINFO_BIN", "tiffinfo")
 FAX_LIVE_REFRESH_SEC = float(os.environ.get("KFX_FAX_LIVE_REFRESH_SEC", "2.0"))
+FAX_LIVE_EVENTS = os.environ.get("KFX_FAX_LIVE_EVENTS", "1").strip() != "0"
+LIVE_STATUS_FILE = Path(os.environ.get("KFX_LIVE_STATUS_FILE", str(BASE / "live-status.json")))
 
 TIFF_DPI = os.environ.get("KFX_TIFF_DPI", "204x196")
 TIFF_DEVICE = os.environ.get("KFX_TIFF_DEVICE", "tiffg4")
 
+PREPARE_WORKERS = int(os.environ.get("KFX_PREPARE_WORKERS", "2"))
+
+# page-parallel gs: documents with >= MIN_PAGES pages are rendered in page ranges
+RENDER_PARALLEL_MIN_PAGES = int(os.environ.get("KFX_RENDER_PARALLEL_MIN_PAGES", "16"))
+RENDER_CHUNK_PAGES = max(1, int(os.environ.get("KFX_RENDER_CHUNK_PAGES", "4")))
+RENDER_WORKERS = int(os.environ.get("KFX_RENDER_WORKERS", "0")) or max(1, (os.cpu_count() or 1) // max(1, PREPARE_WORKERS))
+
+# transmission optimizer: blank pages, threshold instead of dither, despeckle
+OPTIMIZE = os.environ.get("KFX_OPTIMIZE", "0").strip() == "1"
+OPTIMIZE_BLANK = os.environ.get("KFX_OPTIMIZE_BLANK", "trailing").strip().lower()  # trailing | all | off
+OPTIMIZE_BLANK_INK = float(os.environ.get("KFX_OPTIMIZE_BLANK_INK", "0.0002"))
+OPTIMIZE_THRESHOLD = float(os.environ.get("KFX_OPTIMIZE_THRESHOLD", "0.6"))
+OPTIMIZE_DESPECKLE = os.environ.get("KFX_OPTIMIZE_DESPECKLE", "0").strip() == "1"
+OPTIMIZE_ANALYSIS_DPI = int(os.environ.get("KFX_OPTIMIZE_ANALYSIS_DPI", "50"))
+
+RENDER_CACHE_DIR = Path(os.environ.get("KFX_RENDER_CACHE_DIR", str(BASE / "cache" / "render")))
+RENDER_CACHE_MAX_MB = float(os.environ.get("KFX_RENDER_CACHE_MAX_MB", "512"))
+
+# metrics: Prometheus text on http://KFX_METRICS_LISTEN/metrics ("" = off), summary via log()
+METRICS_LISTEN = os.environ.get("KFX_METRICS_LISTEN", "127.0.0.1:9465").strip()
+METRICS_SUMMARY_SEC = float(os.environ.get("KFX_METRICS_SUMMARY_SEC", "300"))
+
+# fs = directory spool only; sqlite = additional WAL index of queue/processing
+JOB_STORE = os.environ.get("KFX_JOB_STORE", "fs").strip().lower()
+JOB_DB_PATH = Path(os.environ.get("KFX_JOB_DB", str(BASE / "jobs.sqlite")))
+
+INFLIGHT_STATES = ("CLAIMED", "SUBMITTED", "PROCESSING", "CALLING", "SENDING", "DEFERRED")
+BUSY_STATES = INFLIGHT_STATES + ("RETRY_WAIT",)
+
+# same defaults as pdf_with_header.sh; part of the header cache key
+HEADER_ENV_KEYS = ("PRACTICE_NAME", "TOP_OFFSET_MM", "HEADER_BAND_MM", "LEFT_MARGIN_MM",
+                   "RIGHT_MARGIN_MM", "FONT_NAME", "FONT_SIZE")
+HEADER_DATE_FMT = os.environ.get("DATE_FMT", "%d.%m.%Y %H:%M")
+
 LOCKFILE = BASE / ".kienzlefax-worker.lock"
 LOG_PREFIX = "kienzlefax-worker"
 _lock_fd: Optional[int] = None
 _next_submit_ts: float = 0.0
 _last_fax_live_ts: float = 0.0
 _tiff_pages_cache: Dict[str, Tuple[float, Optional[int]]] = {}
+_prepare_pool: Optional[ProcessPoolExecutor] = None
+_prepare_futures: Dict[str, Tuple[float, Future]] = {}
+_prepare_done: set[str] = set()
+_render_cache_stats: Dict[str, int] = {"hit": 0, "miss": 0, "evicted": 0}
+_render_cache_logged: int = 0
+_job_store: Optional["FsJobStore"] = None
+_retry_timers: Optional["RetryTimers"] = None
+_ami_client: Optional["AmiClient"] = None
+_fax_events: Optional["AmiEventListener"] = None
+_wake = threading.Event()
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
@@ -212,6 +419,26 @@ def write_json(p: Path, obj: Dict[str, Any]) -> None:
     except Exception:
         pass
 
+def update_job_json(jdir: Path, fn) -> bool:
+    """
+    Read-modify-write of job.json under .job.lock. The web UI writes queue jobs
+    without that lock, so the write is skipped (False) if job.json changed underneath.
+    """
+    jp = jdir / "job.json"
+    lock_fd: Optional[int] = None
+    try:
+        lock_fd = acquire_job_lock(jdir)
+        st = jp.stat()
+        job = read_json(jp)
+        fn(job)
+        st2 = jp.stat()
+        if (st.st_mtime_ns, st.st_ino) != (st2.st_mtime_ns, st2.st_ino):
+            return False
+        write_json(jp, job)
+        return True
+    finally:
+        release_job_lock(lock_fd)
+
 def read_json_best_effort(p: Path) -> Tuple[Dict[str, Any], str]:
     try:
         return read_json(p), ""
@@ -254,8 +481,162 @@ def list_jobdirs(root: Path) -> List[Path]:
     dirs.sort(key=lambda x: x.name)
     return dirs
 
+_HIST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+_LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+class Metrics:
+    """
+    Counters, gauges and cumulative histograms with Prometheus text output.
+    Thread-safe (the HTTP endpoint reads from its own thread). Prepare pool children
+    hand their histograms back with each result (take_hists/merge_hists).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counters: Dict[_LabelKey, float] = {}
+        self.gauges: Dict[_LabelKey, float] = {}
+        # key -> [bucket counts..., +Inf count], sum
+        self.hists: Dict[_LabelKey, Tuple[List[int], float]] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> _LabelKey:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        k = self._key(name, labels)
+        with self._lock:
+            self.counters[k] = self.counters.get(k, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            self.gauges[self._key(name, labels)] = float(value)
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        k = self._key(name, labels)
+        with self._lock:
+            counts, total = self.hists.get(k) or ([0] * (len(_HIST_BUCKETS) + 1), 0.0)
+            for i, b in enumerate(_HIST_BUCKETS):
+                if seconds <= b:
+                    counts[i] += 1
+            counts[-1] += 1
+            self.hists[k] = (counts, total + max(0.0, seconds))
+
+    def take_hists(self) -> Dict[_LabelKey, Tuple[List[int], float]]:
+        with self._lock:
+            hists, self.hists = self.hists, {}
+        return hists
+
+    def merge_hists(self, hists: Dict[_LabelKey, Tuple[List[int], float]]) -> None:
+        with self._lock:
+            for k, (counts, total) in hists.items():
+                cur, cur_total = self.hists.get(k) or ([0] * (len(_HIST_BUCKETS) + 1), 0.0)
+                self.hists[k] = ([a + b for a, b in zip(cur, counts)], cur_total + total)
+
+    @staticmethod
+    def _fmt(name: str, labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+        parts = [f'{k}="{v}"' for k, v in labels]
+        if extra:
+            parts.append(extra)
+        return f"{name}{{{','.join(parts)}}}" if parts else name
+
+    def render(self) -> str:
+        out: List[str] = []
+        with self._lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                seen: set[str] = set()
+                for (name, labels), v in sorted(series.items()):
+                    if name not in seen:
+                        out.append(f"# TYPE {name} {kind}")
+                        seen.add(name)
+                    out.append(f"{self._fmt(name, labels)} {v:g}")
+            seen = set()
+            for (name, labels), (counts, total) in sorted(self.hists.items()):
+                if name not in seen:
+                    out.append(f"# TYPE {name} histogram")
+                    seen.add(name)
+                for b, c in zip(_HIST_BUCKETS, counts):
+                    le = 'le="%g"' % b
+                    out.append(f"{self._fmt(name + '_bucket', labels, le)} {c}")
+                inf = 'le="+Inf"'
+                out.append(f"{self._fmt(name + '_bucket', labels, inf)} {counts[-1]}")
+                out.append(f"{self._fmt(name + '_sum', labels)} {total:.6f}")
+                out.append(f"{self._fmt(name + '_count', labels)} {counts[-1]}")
+        return "\n".join(out) + "\n"
+
+    def summary(self) -> str:
+        with self._lock:
+            g = {name: v for (name, labels), v in self.gauges.items() if not labels}
+            outcomes = {dict(labels).get("outcome", ""): int(v) for (name, labels), v in self.counters.items()
+                        if name == "kfx_jobs_finished_total"}
+            retries = sum(int(v) for (name, labels), v in self.counters.items() if name == "kfx_jobs_requeued_total")
+            stages = []
+            for (name, labels), (counts, total) in sorted(self.hists.items()):
+                if name == "kfx_stage_seconds" and counts[-1]:
+                    stages.append(f"{dict(labels).get('stage')}={total / counts[-1]:.1f}s")
+        return (f"queue={int(g.get('kfx_queue_depth', 0))} inflight={int(g.get('kfx_inflight', 0))} "
+                f"ok={outcomes.get('OK', 0)} failed={outcomes.get('FAILED', 0)} "
+                f"cancelled={outcomes.get('cancelled', 0)} retry={retries} | avg " + (" ".join(stages) or "-"))
+
+METRICS = Metrics()
+_metrics_last_summary: float = 0.0
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+def start_metrics_server() -> None:
+    if not METRICS_LISTEN:
+        return
+    host, _, port = METRICS_LISTEN.rpartition(":")
+    try:
+        srv = ThreadingHTTPServer((host or "127.0.0.1", int(port)), _MetricsHandler)
+    except (OSError, ValueError) as e:
+        log(f"metrics endpoint disabled ({METRICS_LISTEN}): {e}")
+        return
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="metrics", daemon=True).start()
+    log(f"metrics on http://{METRICS_LISTEN}/metrics")
+
+def iso_age_sec(value: Any) -> Optional[float]:
+    t = parse_iso_ts(value)
+    return (datetime.now(timezone.utc) - t).total_seconds() if t is not None else None
+
+def metrics_job_finished(job: Dict[str, Any], outcome: str) -> None:
+    METRICS.inc("kfx_jobs_finished_total", outcome=outcome)
+    age = iso_age_sec(job.get("created_at"))
+    if age is not None:
+        METRICS.observe("kfx_job_total_seconds", age, outcome=outcome)
+
+def metrics_tick() -> None:
+    global _metrics_last_summary
+    METRICS.set("kfx_queue_depth", len(list_jobdirs(QUEUE)))
+    METRICS.set("kfx_processing", len(list_jobdirs(PROC)))
+    METRICS.set("kfx_inflight", count_inflight())
+    METRICS.set("kfx_retry_wait", len(retry_timers()))
+    METRICS.set("kfx_prepare_running", len(_prepare_futures))
+    now = time.monotonic()
+    if now - _metrics_last_summary >= METRICS_SUMMARY_SEC:
+        _metrics_last_summary = now
+        log(f"metrics: {METRICS.summary()}")
+
 def run_cmd(cmd: List[str], *, env: Optional[dict]=None, timeout: Optional[int]=None) -> Tuple[int, str, str]:
-    p = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=timeout)
+    t0 = time.monotonic()
+    try:
+        p = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=timeout)
+    finally:
+        METRICS.observe("kfx_subprocess_seconds", time.monotonic() - t0, binary=Path(cmd[0]).name)
     return p.returncode, (p.stdout or ""), (p.stderr or "")
 
 def _int_or_none(value: Any) -> Optional[int]:
@@ -306,11 +687,36 @@ def _channel_sendfax_file(channel: str) -> str:
             return m.group(1).strip()
     return ""
 
+def _tiff_ifd_count(path: str) -> Optional[int]:
+    # pages = length of the IFD chain (classic TIFF, as written by gs tiffg4)
+    with open(path, "rb") as f:
+        head = f.read(8)
+        bo = {b"II": "<", b"MM": ">"}.get(head[:2])
+        if bo is None or len(head) < 8:
+            return None
+        magic, off = struct.unpack(bo + "HI", head[2:8])
+        if magic != 42:
+            return None
+        n = 0
+        seen: set[int] = set()
+        while off and off not in seen and n < 100000:
+            seen.add(off)
+            f.seek(off)
+            raw = f.read(2)
+            if len(raw) < 2:
+                return None
+            (cnt,) = struct.unpack(bo + "H", raw)
+            f.seek(off + 2 + 12 * cnt)
+            raw = f.read(4)
+            if len(raw) < 4:
+                return None
+            (off,) = struct.unpack(bo + "I", raw)
+            n += 1
+        return n or None
+
 def _tiff_page_count(path: str) -> Optional[int]:
     if not path:
         return None
-    if shutil.which(TIFFINFO_BIN) is None:
-        return None
 
     try:
         st = os.stat(path)
@@ -324,12 +730,17 @@ def _tiff_page_count(path: str) -> Optional[int]:
 
     pages: Optional[int] = None
     try:
-        rc, so, _ = run_cmd([TIFFINFO_BIN, path], timeout=10)
-        if rc == 0:
-            n = sum(1 for line in so.splitlines() if line.startswith("TIFF Directory"))
-            pages = n if n > 0 else None
-    except Exception as e:
-        log(f"fax live: tiffinfo failed for {path}: {e}")
+        pages = _tiff_ifd_count(path)
+    except Exception:
+        pages = None
+    if pages is None and shutil.which(TIFFINFO_BIN) is not None:
+        try:
+            rc, so, _ = run_cmd([TIFFINFO_BIN, path], timeout=10)
+            if rc == 0:
+                n = sum(1 for line in so.splitlines() if line.startswith("TIFF Directory"))
+                pages = n if n > 0 else None
+        except Exception as e:
+            log(f"fax live: tiffinfo failed for {path}: {e}")
 
     _tiff_pages_cache[cache_key] = (time.time(), pages)
     if len(_tiff_pages_cache) > 100:
@@ -388,12 +799,15 @@ def _parse_fax_session_details(text: str) -> Dict[str, Any]:
         "rx_pages": _int_or_none(raw.get("rx_pages")),
     }
 
+# doc.tif: single job; bundle.tif: coalesced call, lives in (and is reported on) the leader's dir
+SEND_TIFF_NAMES = ("doc.tif", "bundle.tif")
+
 def _find_job_for_tiff(tiff_path: str) -> Optional[Path]:
     if not tiff_path:
         return None
     try:
         p = Path(tiff_path)
-        if p.name != "doc.tif":
+        if p.name not in SEND_TIFF_NAMES:
             return None
         jdir = p.parent
         if jdir.parent != PROC:
@@ -471,12 +885,14 @@ def _collect_asterisk_fax_live() -> Dict[str, Dict[str, Any]]:
 
 def step_update_asterisk_fax_live() -> None:
     global _last_fax_live_ts
-    now = time.time()
-    if (now - _last_fax_live_ts) < FAX_LIVE_REFRESH_SEC:
-        return
-    _last_fax_live_ts = now
-
-    live_by_job = _collect_asterisk_fax_live()
+    if _fax_events is not None and _fax_events.connected:
+        live_by_job = FAX_LIVE.take_dirty()
+    else:
+        now = time.time()
+        if (now - _last_fax_live_ts) < FAX_LIVE_REFRESH_SEC:
+            return
+        _last_fax_live_ts = now
+        live_by_job = _collect_asterisk_fax_live()
     if not live_by_job:
         return
 
@@ -499,7 +915,7 @@ def step_update_asterisk_fax_live() -> None:
 
             root_live = job.setdefault("live", {})
             prev = root_live.get("asterisk_fax") if isinstance(root_live.get("asterisk_fax"), dict) else {}
-            connected_at = str(prev.get("connected_at") or "")
+            connected_at = str(prev.get("connected_at") or live.get("connected_at") or "")
             if not connected_at:
                 connected_at = now_iso()
             live["connected_at"] = connected_at
@@ -516,32 +932,558 @@ def step_update_asterisk_fax_live() -> None:
         finally:
             release_job_lock(lock_fd)
 
+def file_sha256(p: Path) -> str:
+    h = hashlib.sha256()
+    with p.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def render_cache_key(kind: str, *parts: Any) -> str:
+    h = hashlib.sha256(kind.encode("utf-8"))
+    for part in parts:
+        h.update(b"\0" + str(part).encode("utf-8"))
+    return f"{kind}-{h.hexdigest()}"
+
+def _render_cache_path(key: str, suffix: str) -> Path:
+    return RENDER_CACHE_DIR / key[-2:] / f"{key}{suffix}"
+
+def _link_or_copy(src: Path, dest: Path) -> None:
+    tmp = dest.with_name(f".{dest.name}.tmp.{os.getpid()}.{time.time_ns()}")
+    try:
+        os.link(str(src), str(tmp))
+    except OSError:
+        shutil.copy2(str(src), str(tmp))
+    os.replace(tmp, dest)
+
+def render_cache_fetch(key: str, suffix: str, dest: Path) -> bool:
+    if RENDER_CACHE_MAX_MB <= 0:
+        return False
+    src = _render_cache_path(key, suffix)
+    try:
+        if not src.is_file():
+            raise FileNotFoundError(str(src))
+        _link_or_copy(src, dest)
+        os.utime(str(src))
+    except OSError:
+        _render_cache_stats["miss"] += 1
+        return False
+    _render_cache_stats["hit"] += 1
+    return True
+
+def render_cache_store(key: str, suffix: str, src: Path) -> None:
+    if RENDER_CACHE_MAX_MB <= 0:
+        return
+    dest = _render_cache_path(key, suffix)
+    try:
+        safe_mkdir(dest.parent)
+        _link_or_copy(src, dest)
+    except OSError as e:
+        log(f"render cache: store failed {dest.name}: {e}")
+        return
+    render_cache_evict()
+
+def render_cache_evict() -> None:
+    # LRU: hits bump mtime, oldest entries go first
+    limit = int(RENDER_CACHE_MAX_MB * 1024 * 1024)
+    entries: List[Tuple[int, int, Path]] = []
+    total = 0
+    try:
+        for p in RENDER_CACHE_DIR.glob("*/*"):
+            if p.name.startswith("."):
+                continue
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, p))
+            total += st.st_size
+    except OSError:
+        return
+    if total <= limit:
+        return
+    for _, size, p in sorted(entries):
+        try:
+            p.unlink()
+        except OSError:
+            continue
+        total -= size
+        _render_cache_stats["evicted"] += 1
+        if total <= limit:
+            break
+
+def log_render_cache_stats(delta: Optional[Dict[str, int]] = None) -> None:
+    global _render_cache_logged
+    s = _render_cache_stats
+    for k, v in (delta or {}).items():
+        s[k] = s.get(k, 0) + int(v)
+    n = s["hit"] + s["miss"]
+    if n - _render_cache_logged >= 50:
+        _render_cache_logged = n
+        log(f"render cache: hits={s['hit']} misses={s['miss']} evicted={s['evicted']}")
+
+_lib_modules: Dict[str, Any] = {}
+
+def lib_module(name: str, path: Path) -> Any:
+    # optional module from /usr/local/lib/kienzlefax, imported once; False if missing/broken
+    if name not in _lib_modules:
+        _lib_modules[name] = False
+        if path.is_file():
+            try:
+                spec = importlib.util.spec_from_file_location(name, str(path))
+                mod = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(mod)
+                _lib_modules[name] = mod
+            except Exception as e:
+                log(f"module {path} not usable: {e}")
+    return _lib_modules[name]
+
+def header_module() -> Any:
+    """
+    kfx_header (False -> pdf_with_header.sh). Called at startup so forked prepare
+    processes inherit the warm imports.
+    """
+    return lib_module("kfx_header", HEADER_MODULE)
+
 def add_header_pdf(pdf: Path) -> Path:
-    if not PDF_HEADER_SCRIPT.exists():
+    mod = header_module()
+    src = HEADER_MODULE if mod else PDF_HEADER_SCRIPT
+    if not src.exists():
         return pdf
     out = pdf.with_name(pdf.stem + "_hdr.pdf")
     try:
-        subprocess.run([str(PDF_HEADER_SCRIPT), str(pdf), str(out)],
-                       check=True, capture_output=True, text=True, timeout=60)
+        # the stamped date is part of the key, so it is fixed here and handed to the stamper
+        stamp = datetime.now().strftime(HEADER_DATE_FMT)
+        st = src.stat()
+        key = render_cache_key("hdr", file_sha256(pdf), stamp, st.st_mtime_ns, st.st_size,
+                               *(os.environ.get(k, "") for k in HEADER_ENV_KEYS))
+        if render_cache_fetch(key, ".pdf", out):
+            return out
+        t0 = time.monotonic()
+        if mod:
+            tmp = out.with_name(f".{out.name}.tmp.{os.getpid()}")
+            try:
+                mod.stamp_pdf(pdf, tmp, mod.HeaderStyle.from_env(), stamp_date=stamp)
+                os.replace(tmp, out)
+            finally:
+                if tmp.exists():
+                    tmp.unlink()
+        else:
+            env = os.environ.copy()
+            env["DATE_FMT"] = stamp.replace("%", "%%")
+            try:
+                subprocess.run([str(PDF_HEADER_SCRIPT), str(pdf), str(out)],
+                               check=True, capture_output=True, text=True, timeout=60, env=env)
+            finally:
+                METRICS.observe("kfx_subprocess_seconds", time.monotonic() - t0, binary=PDF_HEADER_SCRIPT.name)
+        METRICS.observe("kfx_stage_seconds", time.monotonic() - t0, stage="header")
         if out.exists() and out.stat().st_size > 0:
+            render_cache_store(key, ".pdf", out)
             return out
     except Exception as e:
-        log(f"header script failed -> continue without header: {e}")
+        log(f"header failed -> continue without header: {e}")
     return pdf
 
-def pdf_to_tiff_g4(pdf: Path, tif: Path) -> None:
+def pdf_page_count(pdf: Path) -> Optional[int]:
+    try:
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            from PyPDF2 import PdfReader  # type: ignore
+        return len(PdfReader(str(pdf)).pages) or None
+    except Exception:
+        pass
+    # without pypdf: count page objects (misses pages inside compressed object streams)
+    try:
+        n = len(re.findall(rb"/Type\s*/Page(?![a-zA-Z])", pdf.read_bytes()))
+    except Exception:
+        return None
+    return n or None
+
+def _gs_tiff(pdf: Path, tif: Path, first: Optional[int]=None, last: Optional[int]=None,
+             prologue: Optional[List[str]]=None) -> None:
     cmd = [
         GS_BIN,
         "-q","-dNOPAUSE","-dBATCH","-dSAFER",
         f"-sDEVICE={TIFF_DEVICE}",
         f"-r{TIFF_DPI}",
         "-sPAPERSIZE=a4","-dFIXEDMEDIA","-dPDFFitPage",
-        f"-sOutputFile={str(tif)}",
-        str(pdf),
     ]
+    if first is not None:
+        cmd += [f"-dFirstPage={first}", f"-dLastPage={last}"]
+    cmd += [f"-sOutputFile={str(tif)}", *(prologue or []), str(pdf)]
     rc, so, se = run_cmd(cmd)
     if rc != 0 or (not tif.exists()) or tif.stat().st_size == 0:
-        raise RuntimeError(f"ghostscript pdf->tiff failed rc={rc} out={so.strip()} err={se.strip()}")
+        where = f" pages={first}-{last}" if first is not None else ""
+        raise RuntimeError(f"ghostscript pdf->tiff failed{where} rc={rc} out={so.strip()} err={se.strip()}")
+
+_TIFF_TYPE_SIZE = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+def _tiff_read_pages(path: Path) -> Tuple[str, List[Tuple[List[Tuple[int, int, int, bytes]], List[bytes]]]]:
+    """
+    Reads a classic strip-based TIFF into (byte order, [(entries, strips)]) with every
+    tag value resolved to its raw bytes and the strip data copied as-is.
+    """
+    buf = path.read_bytes()
+    bo = {b"II": "<", b"MM": ">"}.get(buf[:2])
+    if bo is None or len(buf) < 8:
+        raise ValueError(f"{path.name}: not a TIFF")
+    magic, off = struct.unpack_from(bo + "HI", buf, 2)
+    if magic != 42:
+        raise ValueError(f"{path.name}: not a classic TIFF")
+    pages = []
+    seen: set[int] = set()
+    while off:
+        if off in seen or off + 2 > len(buf):
+            raise ValueError(f"{path.name}: broken IFD chain")
+        seen.add(off)
+        (cnt,) = struct.unpack_from(bo + "H", buf, off)
+        entries = []
+        for i in range(cnt):
+            tag, typ, count = struct.unpack_from(bo + "HHI", buf, off + 2 + 12 * i)
+            size = _TIFF_TYPE_SIZE.get(typ, 0) * count
+            if not size:
+                raise ValueError(f"{path.name}: unsupported tag type {typ}")
+            voff = off + 2 + 12 * i + 8
+            if size > 4:
+                (voff,) = struct.unpack_from(bo + "I", buf, voff)
+            raw = buf[voff:voff + size]
+            if len(raw) != size:
+                raise ValueError(f"{path.name}: truncated tag {tag}")
+            entries.append((tag, typ, count, raw))
+        (off,) = struct.unpack_from(bo + "I", buf, off + 2 + 12 * cnt)
+
+        tags = {t: (typ, count, raw) for t, typ, count, raw in entries}
+        if 324 in tags or 273 not in tags or 279 not in tags:
+            raise ValueError(f"{path.name}: no strip layout")
+        def values(tag: int) -> List[int]:
+            typ, count, raw = tags[tag]
+            return list(struct.unpack(bo + ("H" if typ == 3 else "I") * count, raw))
+        offs, counts = values(273), values(279)
+        if len(offs) != len(counts):
+            raise ValueError(f"{path.name}: strip count mismatch")
+        strips = [buf[o:o + c] for o, c in zip(offs, counts)]
+        if any(len(s) != c for s, c in zip(strips, counts)):
+            raise ValueError(f"{path.name}: truncated strip")
+        pages.append((entries, strips))
+    if not pages:
+        raise ValueError(f"{path.name}: no pages")
+    return bo, pages
+
+def concat_tiff(parts: List[Path], out: Path) -> int:
+    """
+    Joins single- or multi-page TIFFs into one without decoding: strips and tag values
+    are copied byte for byte, only StripOffsets, the IFD links and PageNumber (as gs
+    numbers pages within one output file) are rewritten. Returns the page count.
+    """
+    bo = ""
+    pages = []
+    for p in parts:
+        pbo, pp = _tiff_read_pages(p)
+        if bo and pbo != bo:
+            raise ValueError("mixed byte order")
+        bo = pbo
+        pages.extend(pp)
+
+    data = bytearray({"<": b"II", ">": b"MM"}[bo] + struct.pack(bo + "HI", 42, 0))
+    link = 4  # where the offset of the next IFD goes
+    for index, (entries, strips) in enumerate(pages):
+        offsets = []
+        for s in strips:
+            offsets.append(len(data))
+            data += s
+            if len(data) % 2:
+                data += b"\0"
+        fields = []
+        for tag, typ, count, raw in entries:
+            if tag == 273:
+                typ, raw = 4, struct.pack(bo + "I" * count, *offsets)
+            elif tag == 297 and typ == 3 and count == 2:
+                raw = struct.pack(bo + "H", index) + raw[2:]
+            if len(raw) > 4:
+                voff = len(data)
+                data += raw
+                if len(data) % 2:
+                    data += b"\0"
+                raw = struct.pack(bo + "I", voff)
+            fields.append(struct.pack(bo + "HHI", tag, typ, count) + raw.ljust(4, b"\0"))
+        ifd = len(data)
+        struct.pack_into(bo + "I", data, link, ifd)
+        data += struct.pack(bo + "H", len(fields)) + b"".join(fields)
+        link = len(data)
+        data += b"\0\0\0\0"
+
+    tmp = out.with_name(out.name + ".tmp")
+    tmp.write_bytes(bytes(data))
+    os.replace(tmp, out)
+    return len(pages)
+
+def _pdf_to_tiff_parallel(pdf: Path, tif: Path, pages: int, prologue: Optional[List[str]]=None) -> None:
+    chunks = min(RENDER_WORKERS * 2, max(1, pages // RENDER_CHUNK_PAGES))
+    step = -(-pages // chunks)
+    ranges = [(a, min(pages, a + step - 1)) for a in range(1, pages + 1, step)]
+    work = tif.parent / f".{tif.name}.parts-{os.getpid()}"
+    shutil.rmtree(work, ignore_errors=True)
+    work.mkdir(parents=True)
+    try:
+        parts = [work / f"{a:05d}.tif" for a, _ in ranges]
+        # gs runs as its own process; threads only wait for it (no nested process pool
+        # inside the prepare pool)
+        with ThreadPoolExecutor(max_workers=min(RENDER_WORKERS, len(ranges))) as ex:
+            for f in [ex.submit(_gs_tiff, pdf, p, a, b, prologue) for p, (a, b) in zip(parts, ranges)]:
+                f.result()
+        n = concat_tiff(parts, tif)
+        if n != pages:
+            raise RuntimeError(f"page count mismatch: {n} rendered, {pages} expected")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+def pdf_to_tiff_g4(pdf: Path, tif: Path) -> None:
+    """
+    PDF -> G4 TIFF. Large documents are rendered in page ranges by parallel gs
+    processes and joined without re-encoding; small ones in a single gs call.
+    With KFX_OPTIMIZE greys are thresholded (and optionally despeckled).
+    """
+    mode = _tiff_render_mode()
+    key = render_cache_key("tif", file_sha256(pdf), TIFF_DEVICE, TIFF_DPI,
+                           *((mode, OPTIMIZE_THRESHOLD) if mode else ()))
+    if render_cache_fetch(key, ".tif", tif):
+        return
+    if mode == "clean":
+        try:
+            _pdf_to_tiff_cleaned(pdf, tif)
+            render_cache_store(key, ".tif", tif)
+            return
+        except Exception as e:
+            log(f"optimize: despeckle failed for {pdf.name}, thresholded gs render: {e}")
+    prologue = _threshold_prologue() if mode and OPTIMIZE_THRESHOLD > 0 else None
+    pages = pdf_page_count(pdf) if RENDER_PARALLEL_MIN_PAGES > 0 and RENDER_WORKERS > 1 else None
+    done = False
+    if pages and pages >= RENDER_PARALLEL_MIN_PAGES:
+        t0 = time.monotonic()
+        try:
+            _pdf_to_tiff_parallel(pdf, tif, pages, prologue)
+            done = True
+            log(f"render: {pdf.name} {pages} pages page-parallel in {time.monotonic() - t0:.1f}s")
+        except Exception as e:
+            log(f"render: page-parallel failed for {pdf.name}, single gs call: {e}")
+    if not done:
+        _gs_tiff(pdf, tif, prologue=prologue)
+    render_cache_store(key, ".tif", tif)
+
+# ----------------------------
+# Transmission optimizer (KFX_OPTIMIZE=1)
+# ----------------------------
+_G4_BITS_PER_EDGE = 4.0  # rough average of a G4 code per colour change (text pages)
+
+def _tiff_dpi() -> Tuple[float, float]:
+    m = re.match(r"\s*(\d+(?:\.\d+)?)(?:\s*x\s*(\d+(?:\.\d+)?))?", TIFF_DPI)
+    if not m:
+        return 204.0, 196.0
+    x = float(m.group(1))
+    return x, float(m.group(2) or x)
+
+def _read_pgm(path: Path) -> Tuple[int, int, bytes]:
+    buf = path.read_bytes()
+    tokens: List[bytes] = []
+    pos = 0
+    while len(tokens) < 4:
+        m = re.compile(rb"\s*(?:#[^\n]*\n\s*)*(\S+)").match(buf, pos)
+        if not m:
+            raise ValueError(f"{path.name}: bad PGM header")
+        tokens.append(m.group(1))
+        pos = m.end()
+    if tokens[0] != b"P5" or int(tokens[3]) > 255:
+        raise ValueError(f"{path.name}: not an 8-bit PGM")
+    w, h = int(tokens[1]), int(tokens[2])
+    data = buf[pos + 1:pos + 1 + w * h]
+    if len(data) != w * h:
+        raise ValueError(f"{path.name}: truncated PGM")
+    return w, h, data
+
+def _gs_pgm_pages(pdf: Path, outdir: Path, dpi: str, first: Optional[int]=None, last: Optional[int]=None) -> List[Path]:
+    cmd = [
+        GS_BIN,
+        "-q","-dNOPAUSE","-dBATCH","-dSAFER",
+        "-sDEVICE=pgmraw",
+        f"-r{dpi}",
+        "-sPAPERSIZE=a4","-dFIXEDMEDIA","-dPDFFitPage",
+    ]
+    if first is not None:
+        cmd += [f"-dFirstPage={first}", f"-dLastPage={last}"]
+    cmd += [f"-sOutputFile={str(outdir / '%05d.pgm')}", str(pdf)]
+    rc, so, se = run_cmd(cmd)
+    pages = sorted(outdir.glob("*.pgm"))
+    if rc != 0 or not pages:
+        raise RuntimeError(f"ghostscript pdf->pgm failed rc={rc} out={so.strip()} err={se.strip()}")
+    return pages
+
+def _bilevel_rows(w: int, h: int, data: bytes, level: float) -> List[int]:
+    # one int per row, bit set = black, MSB = leftmost pixel
+    cut = max(0, min(256, int(level * 255 + 0.5)))
+    table = bytes.maketrans(bytes(range(256)), b"1" * cut + b"0" * (256 - cut))
+    return [int(data[i:i + w].translate(table), 2) for i in range(0, w * h, w)]
+
+def page_ink_stats(w: int, h: int, data: bytes, *, border: float=0.04) -> Dict[str, float]:
+    """
+    Ink coverage inside the page (outer border ignored: scanner shadows, punch holes)
+    and the number of black/white changes per row, which is what G4 pays for.
+    """
+    bx, by = int(w * border), int(h * border)
+    rows = _bilevel_rows(w, h, data, 0.5)
+    mask = ((1 << (w - 2 * bx)) - 1) << bx
+    dark = 0
+    edges = 0
+    for y, r in enumerate(rows):
+        edges += bin(r ^ (r >> 1)).count("1")
+        if by <= y < h - by:
+            dark += bin(r & mask).count("1")
+    inner = max(1, (w - 2 * bx) * (h - 2 * by))
+    return {"ink": dark / inner, "edges": edges}
+
+def analyze_pdf_pages(pdf: Path) -> List[Dict[str, Any]]:
+    """
+    Low-resolution pass over the document: ink coverage per page (blank detection)
+    and an estimate of the encoded G4 size at TIFF_DPI.
+    """
+    adpi = OPTIMIZE_ANALYSIS_DPI
+    _, ydpi = _tiff_dpi()
+    work = pdf.parent / f".{pdf.name}.analyze-{os.getpid()}"
+    shutil.rmtree(work, ignore_errors=True)
+    work.mkdir(parents=True)
+    try:
+        out = []
+        for i, p in enumerate(_gs_pgm_pages(pdf, work, str(adpi)), start=1):
+            w, h, data = _read_pgm(p)
+            st = page_ink_stats(w, h, data)
+            rows = h * ydpi / adpi
+            est = (st["edges"] * ydpi / adpi * _G4_BITS_PER_EDGE + rows) / 8
+            out.append({"source_page": i, "ink": round(st["ink"], 5), "est_bytes": int(est)})
+        return out
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+def blank_pages_to_drop(pages: List[Dict[str, Any]]) -> List[int]:
+    blank = [p["source_page"] for p in pages if p["ink"] < OPTIMIZE_BLANK_INK]
+    if OPTIMIZE_BLANK == "trailing":
+        keep = [p["source_page"] for p in pages if p["source_page"] not in blank]
+        last = max(keep) if keep else 0
+        blank = [n for n in blank if n > last]
+    elif OPTIMIZE_BLANK != "all":
+        return []
+    if len(blank) >= len(pages):
+        return []  # an entirely empty document goes out as it is
+    return blank
+
+def optimize_source_pdf(jobdir: Path, pdf_in: Path) -> Tuple[Path, Optional[Dict[str, Any]]]:
+    """
+    Runs before add_header_pdf, so "Seite x/y" counts the pages actually sent.
+    Returns the PDF to continue with and the report for job.json["optimize"].
+    """
+    if not OPTIMIZE:
+        return pdf_in, None
+    try:
+        pages = analyze_pdf_pages(pdf_in)
+    except Exception as e:
+        log(f"optimize: analysis failed for {jobdir.name}, sending unchanged: {e}")
+        return pdf_in, None
+    drop = blank_pages_to_drop(pages)
+    report: Dict[str, Any] = {"mode": _tiff_render_mode() or "default", "source_pages": len(pages),
+                              "dropped_blank": drop, "pages": [p for p in pages if p["source_page"] not in drop]}
+    if not drop:
+        return pdf_in, report
+    out = jobdir / "doc_opt.pdf"
+    keep = ",".join(str(p["source_page"]) for p in report["pages"])
+    rc, so, se = run_cmd([QPDF_BIN, "--empty", "--pages", str(pdf_in), keep, "--", str(out)])
+    if rc not in (0, 3) or not out.is_file() or out.stat().st_size == 0:
+        log(f"optimize: qpdf page selection failed for {jobdir.name}, sending unchanged: {(se or so).strip()}")
+        report["dropped_blank"] = []
+        report["pages"] = pages
+        return pdf_in, report
+    log(f"optimize: {jobdir.name} drops blank pages {drop} of {len(pages)}")
+    return out, report
+
+def optimize_report_actual(report: Optional[Dict[str, Any]], tif: Path) -> Optional[Dict[str, Any]]:
+    # actual encoded bytes per page = sum of the page's strips in the final TIFF
+    if not report:
+        return report
+    try:
+        _, tpages = _tiff_read_pages(tif)
+    except Exception as e:
+        log(f"optimize: cannot read {tif.name}: {e}")
+        return report
+    for n, (p, (_, strips)) in enumerate(zip(report["pages"], tpages), start=1):
+        p["page"] = n
+        p["bytes"] = sum(len(s) for s in strips)
+    report["sent_pages"] = len(tpages)
+    report["est_bytes"] = sum(int(p.get("est_bytes") or 0) for p in report["pages"])
+    report["bytes"] = sum(int(p.get("bytes") or 0) for p in report["pages"])
+    return report
+
+def _tiff_render_mode() -> str:
+    if not OPTIMIZE:
+        return ""
+    if OPTIMIZE_DESPECKLE:
+        return "clean"
+    return "threshold" if OPTIMIZE_THRESHOLD > 0 else ""
+
+def _threshold_prologue() -> List[str]:
+    # transfer function that maps every grey to pure black/white before halftoning:
+    # grey areas are thresholded instead of dithered
+    return ["-c", f"{{ {OPTIMIZE_THRESHOLD:.3f} lt {{ 0 }} {{ 1 }} ifelse }} settransfer", "-f"]
+
+def _despeckle_rows(rows: List[int]) -> List[int]:
+    # drops black pixels without any black 8-neighbour
+    out = []
+    prev = 0
+    for i, r in enumerate(rows):
+        nxt = rows[i + 1] if i + 1 < len(rows) else 0
+        around = prev | nxt
+        around |= (around << 1) | (around >> 1) | (r << 1) | (r >> 1)
+        out.append(r & around)
+        prev = r
+    return out
+
+def _pdf_to_tiff_cleaned(pdf: Path, tif: Path) -> None:
+    """
+    Renders grey (pgmraw), thresholds and despeckles in Python and lets gs encode the
+    result as a 1:1 bitmap with the tiffg4 device, so the TIFF is laid out exactly
+    like the direct path.
+    """
+    xdpi, ydpi = _tiff_dpi()
+    level = OPTIMIZE_THRESHOLD if OPTIMIZE_THRESHOLD > 0 else 0.5
+    work = tif.parent / f".{tif.name}.clean-{os.getpid()}"
+    shutil.rmtree(work, ignore_errors=True)
+    work.mkdir(parents=True)
+    # grey pages are ~4 MB each at fax resolution: render them a chunk at a time
+    total = pdf_page_count(pdf)
+    ranges = [(a, min(total, a + RENDER_CHUNK_PAGES - 1)) for a in range(1, total + 1, RENDER_CHUNK_PAGES)] if total else [(None, None)]
+    try:
+        ps = work / "clean.ps"
+        with ps.open("wb") as f:
+            f.write(b"%!PS\n")
+            for first, last in ranges:
+                for p in _gs_pgm_pages(pdf, work, TIFF_DPI, first, last):
+                    w, h, data = _read_pgm(p)
+                    p.unlink()
+                    rows = _despeckle_rows(_bilevel_rows(w, h, data, level))
+                    pad = (8 - w % 8) % 8
+                    full = (1 << (w + pad)) - 1
+                    wp, hp = w * 72.0 / xdpi, h * 72.0 / ydpi
+                    f.write((f"<< /PageSize [{wp:.4f} {hp:.4f}] >> setpagedevice\n"
+                             f"gsave {wp:.4f} {hp:.4f} scale\n"
+                             f"{w} {h} 1 [{w} 0 0 -{h} 0 {h}] currentfile image\n").encode("ascii"))
+                    # image samples: 1 = white
+                    f.write(b"".join((full ^ (r << pad)).to_bytes((w + pad) // 8, "big") for r in rows))
+                    f.write(b"\ngrestore showpage\n")
+        cmd = [GS_BIN, "-q", "-dNOPAUSE", "-dBATCH", "-dSAFER",
+               f"-sDEVICE={TIFF_DEVICE}", f"-r{TIFF_DPI}",
+               f"-sOutputFile={str(tif)}", str(ps)]
+        rc, so, se = run_cmd(cmd)
+        if rc != 0 or (not tif.exists()) or tif.stat().st_size == 0:
+            raise RuntimeError(f"ghostscript bitmap->tiff failed rc={rc} out={so.strip()} err={se.strip()}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
 
 def merge_report_and_doc(report_pdf: Path, doc_pdf: Path, out_pdf: Path) -> None:
     cmd = [QPDF_BIN, "--empty", "--pages", str(report_pdf), str(doc_pdf), "--", str(out_pdf)]
@@ -594,6 +1536,114 @@ def retry_due(job: Dict[str, Any]) -> bool:
     except Exception:
         return True
 
+def retry_due_epoch(job: Dict[str, Any]) -> Optional[float]:
+    # None = due now (same rules as retry_due)
+    dt = parse_iso_ts((job.get("retry") or {}).get("next_try_at"))
+    return dt.timestamp() if dt else None
+
+def parse_retry_policy(spec: str) -> Dict[str, Tuple[Optional[float], Optional[float], Optional[float]]]:
+    out: Dict[str, Tuple[Optional[float], Optional[float], Optional[float]]] = {}
+    for item in (spec or "").split(","):
+        reason, _, vals = item.partition("=")
+        reason = reason.strip().upper()
+        if not reason:
+            continue
+        parts = (vals.split(":") + ["", "", ""])[:3]
+        try:
+            out[reason] = tuple(float(p) if p.strip() else None for p in parts)  # type: ignore[assignment]
+        except ValueError:
+            log(f"retry policy: ignoring {item.strip()!r}")
+    return out
+
+_RETRY_POLICY = parse_retry_policy(RETRY_POLICY)
+
+def apply_retry_backoff(job: Dict[str, Any]) -> None:
+    """
+    Recomputes retry.next_try_at from the cause of the retry and how often in a row it
+    occurred. The AGI's fixed per-cause delay is the base.
+    """
+    r = job.setdefault("retry", {})
+    reason = str(r.get("last_reason") or "").strip().upper()
+    streak = int(r.get("streak") or 0) + 1 if r.get("streak_reason") == reason else 1
+    base, factor, cap = _RETRY_POLICY.get(reason, (None, None, None))
+    if base is None:
+        try:
+            base = float(r.get("suggested_delay_sec"))
+        except (TypeError, ValueError):
+            base = 20.0
+    factor = RETRY_FACTOR if factor is None else factor
+    cap = RETRY_MAX_DELAY_SEC if cap is None else cap
+    delay = min(cap, base * factor ** (streak - 1))
+    if RETRY_JITTER > 0:
+        # downwards only, so the cap holds and capped jobs still spread out
+        delay *= random.uniform(1 - min(RETRY_JITTER, 1.0), 1.0)
+    delay = max(1, int(delay))
+    r["streak"] = streak
+    r["streak_reason"] = reason
+    r["delay_sec"] = delay
+    r["next_try_at"] = (datetime.now(timezone.utc) + timedelta(seconds=delay)).replace(microsecond=0).isoformat()
+
+class RetryTimers:
+    """
+    Due times of queued jobs waiting for their retry, as a heap with lazy deletion.
+    claim() skips names that are still pending without opening their job.json; a
+    name is dropped once its time has come and the job is read normally again.
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[float, str]] = []
+        self._due: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def add(self, name: str, due: Optional[float]) -> None:
+        if due is None or due <= time.time():
+            self._due.pop(name, None)
+            return
+        self._due[name] = due
+        heapq.heappush(self._heap, (due, name))
+
+    def discard(self, name: str) -> None:
+        self._due.pop(name, None)
+
+    def expire(self, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        while self._heap and self._heap[0][0] <= now:
+            due, name = heapq.heappop(self._heap)
+            if self._due.get(name) == due:
+                del self._due[name]
+
+    def pending(self, name: str) -> bool:
+        return name in self._due
+
+    def next_due(self) -> Optional[float]:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def rebuild(self) -> None:
+        self._heap.clear()
+        self._due.clear()
+        for jdir in list_jobdirs(QUEUE):
+            try:
+                job = read_json(jdir / "job.json")
+            except Exception:
+                continue
+            if not cancel_requested(job):
+                self.add(jdir.name, retry_due_epoch(job))
+
+def retry_timers() -> RetryTimers:
+    global _retry_timers
+    if _retry_timers is None:
+        _retry_timers = RetryTimers()
+        _retry_timers.rebuild()
+        log(f"retry timers: {len(_retry_timers)} job(s) waiting")
+    return _retry_timers
+
+def job_number(job: Dict[str, Any]) -> str:
+    return normalize_number(((job.get("recipient") or {}).get("number") or ""))
+
 def _st_norm(job: Dict[str, Any]) -> str:
     return str(job.get("status") or "").strip().upper()
 
@@ -608,61 +1658,223 @@ def mark_cancel_handled(job: Dict[str, Any]) -> None:
         job["cancel"] = c
     c["handled_at"] = now_iso()
 
-def count_inflight() -> int:
-    n = 0
-    for jdir in list_jobdirs(PROC):
-        jp = jdir / "job.json"
-        if not jp.exists():
-            continue
+def _claim_rename(jdir: Path, num: str) -> Optional[Path]:
+    target = PROC / jdir.name
+    try:
+        jdir.rename(target)
+        log(f"claimed {jdir.name} (num={num or 'n/a'})")
+        return target
+    except Exception as e:
+        log(f"claim rename failed for {jdir.name}: {e}")
+        return None
+
+class FsJobStore:
+    """Directory spool only: every query reads job.json in queue/processing."""
+    name = "fs"
+
+    def sync(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def _processing_jobs(self):
+        for jdir in list_jobdirs(PROC):
+            jp = jdir / "job.json"
+            if not jp.exists():
+                continue
+            try:
+                yield read_json(jp)
+            except Exception:
+                continue
+
+    def count_inflight(self) -> int:
+        return sum(1 for job in self._processing_jobs() if _st_norm(job) in INFLIGHT_STATES)
+
+    def busy_numbers(self) -> set[str]:
+        busy: set[str] = set()
+        for job in self._processing_jobs():
+            if _st_norm(job) in BUSY_STATES:
+                num = job_number(job)
+                if num:
+                    busy.add(num)
+        return busy
+
+    def claim(self, busy_numbers: set[str]) -> Optional[Path]:
+        timers = retry_timers()
+        timers.expire()
+        for j in list_jobdirs(QUEUE):
+            if timers.pending(j.name):
+                continue
+            jp = j / "job.json"
+            if not jp.exists():
+                continue
+            try:
+                job = read_json(jp)
+            except Exception:
+                continue
+            if not retry_due(job):
+                timers.add(j.name, retry_due_epoch(job))
+                continue
+            if not prepare_claimable(j, job):
+                continue
+            num = job_number(job)
+            if num and num in busy_numbers:
+                continue
+            target = _claim_rename(j, num)
+            if target is not None:
+                return target
+        return None
+
+class SqliteJobStore(FsJobStore):
+    """
+    SQLite (WAL) index over the directory spool. job.json stays authoritative because
+    the web UI and the AGI write it directly; sync() re-reads only job.json files whose
+    stat changed, the queries below are index lookups. meta.change_seq is bumped on
+    every change so the web UI can long-poll it.
+    """
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+          id TEXT PRIMARY KEY,
+          spool TEXT NOT NULL,
+          status TEXT NOT NULL DEFAULT '',
+          number TEXT NOT NULL DEFAULT '',
+          next_try_at REAL,
+          claimable INTEGER NOT NULL DEFAULT 1,
+          stat_key TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(spool, status);
+        CREATE INDEX IF NOT EXISTS idx_jobs_number ON jobs(number);
+        CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs(spool, claimable, next_try_at);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        INSERT OR IGNORE INTO meta(key, value) VALUES ('change_seq', 0);
+    """
+
+    def __init__(self, path: Path):
+        safe_mkdir(path.parent)
+        self.db = sqlite3.connect(str(path), isolation_level=None, timeout=10.0)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+        # rows left in 'claiming' by a crash are corrected by the next sync()
+        self.db.execute("UPDATE jobs SET stat_key = '' WHERE spool = 'claiming'")
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _write(self, fn):
+        self.db.execute("BEGIN IMMEDIATE")
         try:
-            job = read_json(jp)
-        except Exception:
-            continue
-        st = _st_norm(job)
-        if st in ("CLAIMED", "SUBMITTED", "PROCESSING", "CALLING", "SENDING", "DEFERRED"):
-            n += 1
-    return n
+            out = fn()
+            self.db.execute("UPDATE meta SET value = value + 1 WHERE key = 'change_seq'")
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return out
+
+    def change_seq(self) -> int:
+        return int(self.db.execute("SELECT value FROM meta WHERE key = 'change_seq'").fetchone()[0])
+
+    def sync(self) -> None:
+        known = {r[0]: (r[1], r[2]) for r in self.db.execute("SELECT id, spool, stat_key FROM jobs")}
+        seen: set[str] = set()
+        upserts = []
+        for spool, root in (("queue", QUEUE), ("processing", PROC)):
+            for jdir in list_jobdirs(root):
+                jp = jdir / "job.json"
+                try:
+                    st = jp.stat()
+                except OSError:
+                    continue
+                key = f"{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+                seen.add(jdir.name)
+                if known.get(jdir.name) == (spool, key):
+                    continue
+                try:
+                    job = read_json(jp)
+                except Exception:
+                    seen.discard(jdir.name)
+                    continue
+                claimable = spool == "queue" and prepare_claimable(jdir, job)
+                upserts.append((jdir.name, spool, _st_norm(job), job_number(job),
+                                retry_due_epoch(job), int(claimable), key))
+        gone = [(name,) for name in known if name not in seen]
+        if not upserts and not gone:
+            return
+
+        def apply() -> None:
+            self.db.executemany(
+                "INSERT INTO jobs(id, spool, status, number, next_try_at, claimable, stat_key) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+                "spool = excluded.spool, status = excluded.status, number = excluded.number, "
+                "next_try_at = excluded.next_try_at, claimable = excluded.claimable, "
+                "stat_key = excluded.stat_key", upserts)
+            self.db.executemany("DELETE FROM jobs WHERE id = ?", gone)
+        self._write(apply)
+
+    def count_inflight(self) -> int:
+        q = ",".join("?" * len(INFLIGHT_STATES))
+        return int(self.db.execute(
+            f"SELECT COUNT(*) FROM jobs WHERE spool = 'processing' AND status IN ({q})",
+            INFLIGHT_STATES).fetchone()[0])
+
+    def busy_numbers(self) -> set[str]:
+        q = ",".join("?" * len(BUSY_STATES))
+        rows = self.db.execute(
+            f"SELECT DISTINCT number FROM jobs WHERE spool = 'processing' AND number <> '' "
+            f"AND status IN ({q})", BUSY_STATES)
+        return {r[0] for r in rows}
+
+    def _reserve(self, busy_numbers: set[str]) -> Optional[Tuple[str, str]]:
+        busy = sorted(busy_numbers)
+        q = ",".join("?" * len(busy))
+        row = self.db.execute(
+            "UPDATE jobs SET spool = 'claiming' WHERE id = ("
+            " SELECT id FROM jobs WHERE spool = 'queue' AND claimable = 1"
+            " AND (next_try_at IS NULL OR next_try_at <= ?)"
+            f" AND number NOT IN ({q}) ORDER BY id LIMIT 1"
+            ") RETURNING id, number", (time.time(), *busy)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def claim(self, busy_numbers: set[str]) -> Optional[Path]:
+        while True:
+            picked = self._write(lambda: self._reserve(busy_numbers))
+            if picked is None:
+                return None
+            name, num = picked
+            target = _claim_rename(QUEUE / name, num)
+            if target is None:
+                # stays 'claiming' (skipped here); the next sync() puts it back or drops it
+                continue
+            self._write(lambda: self.db.execute(
+                "UPDATE jobs SET spool = 'processing', status = 'CLAIMED', stat_key = '' WHERE id = ?", (name,)))
+            return target
+
+def job_store() -> FsJobStore:
+    global _job_store
+    if _job_store is None:
+        if JOB_STORE == "sqlite":
+            try:
+                _job_store = SqliteJobStore(JOB_DB_PATH)
+            except Exception as e:
+                log(f"job store: sqlite unavailable ({JOB_DB_PATH}): {e}; using fs")
+                _job_store = FsJobStore()
+        else:
+            _job_store = FsJobStore()
+        log(f"job store: {_job_store.name}")
+    return _job_store
+
+def count_inflight() -> int:
+    return job_store().count_inflight()
 
 def get_busy_numbers() -> set[str]:
-    busy: set[str] = set()
-    for jdir in list_jobdirs(PROC):
-        jp = jdir / "job.json"
-        if not jp.exists():
-            continue
-        try:
-            job = read_json(jp)
-        except Exception:
-            continue
-        st = _st_norm(job)
-        if st in ("CLAIMED", "SUBMITTED", "PROCESSING", "CALLING", "SENDING", "DEFERRED", "RETRY_WAIT"):
-            num = normalize_number(((job.get("recipient") or {}).get("number") or ""))
-            if num:
-                busy.add(num)
-    return busy
+    return job_store().busy_numbers()
 
 def claim_next_job_skipping_busy(busy_numbers: set[str]) -> Optional[Path]:
-    for j in list_jobdirs(QUEUE):
-        jp = j / "job.json"
-        if not jp.exists():
-            continue
-        try:
-            job = read_json(jp)
-        except Exception:
-            continue
-        if not retry_due(job):
-            continue
-        num = normalize_number(((job.get("recipient") or {}).get("number") or ""))
-        if num and num in busy_numbers:
-            continue
-        target = PROC / j.name
-        try:
-            j.rename(target)
-            log(f"claimed {j.name} (num={num or 'n/a'})")
-            return target
-        except Exception as e:
-            log(f"claim rename failed for {j.name}: {e}")
-            continue
-    return None
+    return job_store().claim(busy_numbers)
 
 def find_original_pdf_in_jobdir(jobdir: Path) -> Optional[Path]:
     for c in (jobdir / "doc.pdf", jobdir / "source.pdf"):
@@ -740,6 +1952,12 @@ def build_report_pdf(job: Dict[str, Any], out_pdf: Path) -> None:
     if pages_raw:
         c.drawString(50, y, f"Seiten: {pages_raw}")
         y -= 16
+    bdoc = (job.get("bundle") or {}).get("doc") or {}
+    if bdoc:
+        first = int(bdoc.get("first_page") or 1)
+        c.drawString(50, y, f"Sammelsendung: Dokument {bdoc.get('index')}/{bdoc.get('count')}, "
+                            f"Seiten {first}-{first + int(bdoc.get('pages') or 1) - 1} im Anruf von {bdoc.get('leader','')}")
+        y -= 16
     if reason:
         c.drawString(50, y, f"Grund: {reason}")
         y -= 16
@@ -756,149 +1974,620 @@ def build_report_pdf(job: Dict[str, Any], out_pdf: Path) -> None:
             y -= 16
 
     c.setFont("Helvetica", 9)
-    c.drawString(50, 40, f"Erzeugt: {now_iso()}  |  kienzlefax-worker v1.3.19")
+    c.drawString(50, 40, f"Erzeugt: {now_iso()}  |  kienzlefax-worker v1.3.32")
     c.showPage()
     c.save()
 
 class AmiError(Exception):
     pass
 
-def ami_send(sockf, line: str) -> None:
-    sockf.write((line.rstrip("\r\n") + "\r\n").encode("utf-8", errors="ignore"))
+AmiFrame = List[Tuple[str, str]]
 
-def ami_read_response(sockf) -> str:
-    buf = bytearray()
-    while True:
-        line = sockf.readline()
-        if not line:
-            break
-        buf += line
-        if line in (b"\r\n", b"\n"):
-            break
-    return buf.decode("utf-8", errors="replace")
-
-def ami_login(sockf) -> None:
-    ami_send(sockf, "Action: Login")
-    ami_send(sockf, f"Username: {AMI_USER}")
-    ami_send(sockf, f"Secret: {AMI_PASS}")
-    ami_send(sockf, "Events: off")
-    ami_send(sockf, "")
-    r = ami_read_response(sockf)
-    if "Response: Success" not in r:
-        raise AmiError(f"AMI login failed: {r.strip()}")
-
-def ami_logoff(sockf) -> None:
-    try:
-        ami_send(sockf, "Action: Logoff")
-        ami_send(sockf, "")
-        _ = ami_read_response(sockf)
-    except Exception:
-        pass
+def ami_field(frame: AmiFrame, key: str) -> str:
+    for k, v in frame:
+        if k.lower() == key.lower():
+            return v
+    return ""
 
-def ami_core_show_channels() -> str:
-    if not AMI_PASS:
-        raise AmiError("AMI password missing (KFX_AMI_PASS)")
-    s = socket.create_connection((AMI_HOST, AMI_PORT), timeout=5)
-    sockf = s.makefile("rwb", buffering=0)
-    try:
-        _ = sockf.readline()
-        ami_login(sockf)
-        ami_send(sockf, "Action: CoreShowChannels")
-        ami_send(sockf, "ActionID: kfx-core")
-        ami_send(sockf, "")
-        buf = []
-        complete_seen = False
+def ami_frame_text(frame: AmiFrame) -> str:
+    return "".join(f"{k}: {v}\r\n" for k, v in frame) + "\r\n"
+
+class AmiClient:
+    """
+    One persistent, logged-in AMI session shared by all actions.
+    Replies are matched to requests by ActionID, frames for other ActionIDs are
+    skipped. A session idle for AMI_PING_SEC is checked with Ping before use; broken
+    sessions are reopened and logged in again, failed connects back off exponentially
+    up to AMI_BACKOFF_MAX_SEC. All errors surface as AmiError.
+    """
+
+    def __init__(self, host: str, port: int, user: str, secret: str) -> None:
+        self.host = host
+        self.port = port
+        self.user = user
+        self.secret = secret
+        self._sock: Optional[socket.socket] = None
+        self._rf = None
+        self._seq = 0
+        self._last_io = 0.0
+        self._backoff = 1.0
+        self._retry_at = 0.0
+
+    # -- session --
+    def close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._action([("Action", "Logoff")])
+            except Exception:
+                pass
+        self._drop()
+
+    def _drop(self) -> None:
+        for obj in (self._rf, self._sock):
+            try:
+                if obj is not None:
+                    obj.close()
+            except Exception:
+                pass
+        self._rf = None
+        self._sock = None
+
+    def _connect(self) -> None:
+        if not self.secret:
+            raise AmiError("AMI password missing (KFX_AMI_PASS)")
+        now = time.time()
+        if now < self._retry_at:
+            raise AmiError(f"AMI reconnect backoff ({int(self._retry_at - now)}s left)")
+        try:
+            self._sock = socket.create_connection((self.host, self.port), timeout=AMI_TIMEOUT_SEC)
+            self._rf = self._sock.makefile("rb")
+            greeting = self._rf.readline()
+            if not greeting.startswith(b"Asterisk Call Manager"):
+                raise AmiError(f"AMI greeting: {greeting!r}")
+            r = self._action([("Action", "Login"), ("Username", self.user),
+                              ("Secret", self.secret), ("Events", "off")])[0]
+            if ami_field(r, "Response") != "Success":
+                raise AmiError(f"AMI login failed: {ami_frame_text(r).strip()}")
+        except (OSError, AmiError) as e:
+            self._drop()
+            self._retry_at = now + self._backoff
+            self._backoff = min(self._backoff * 2, AMI_BACKOFF_MAX_SEC)
+            if isinstance(e, AmiError):
+                raise
+            raise AmiError(f"AMI connect {self.host}:{self.port}: {e}") from e
+        self._backoff = 1.0
+        log(f"AMI session open ({self.host}:{self.port} user={self.user})")
+
+    def _ensure(self) -> None:
+        if self._sock is not None and time.time() - self._last_io >= AMI_PING_SEC:
+            try:
+                self.ping()
+            except (AmiError, OSError):
+                self._drop()
+        if self._sock is None:
+            self._connect()
+
+    def _read_frame(self) -> AmiFrame:
+        frame: AmiFrame = []
         while True:
-            line = sockf.readline()
-            if not line:
-                break
-            t = line.decode("utf-8", errors="replace")
-            buf.append(t)
-            if "Event: CoreShowChannelsComplete" in t:
-                complete_seen = True
-            if complete_seen and t.strip() == "":
-                break
-        return "".join(buf)
-    finally:
+            raw = self._rf.readline()
+            if not raw:
+                raise AmiError("AMI closed the connection")
+            ln = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            if not ln:
+                if frame:
+                    return frame
+                continue
+            k, _, v = ln.partition(":")
+            frame.append((k.strip(), v.strip()))
+
+    def _action(self, fields: AmiFrame, *, action_id: str = "", until_complete: bool = False) -> List[AmiFrame]:
+        """
+        Sends one action and returns its reply frames: the Response, plus for list
+        actions (until_complete) the events up to "EventList: Complete".
+        """
+        if not action_id:
+            self._seq += 1
+            action_id = f"kfx-{os.getpid()}-{self._seq}"
+        payload = "".join(f"{k}: {v}\r\n" for k, v in fields + [("ActionID", action_id)]) + "\r\n"
         try:
-            ami_logoff(sockf)
-        finally:
-            try: sockf.close()
-            except Exception: pass
-            try: s.close()
-            except Exception: pass
+            self._sock.sendall(payload.encode("utf-8", errors="ignore"))
+        except OSError as e:
+            raise AmiError(f"AMI send failed: {e}") from e
+        frames: List[AmiFrame] = []
+        while True:
+            fr = self._read_frame()
+            if ami_field(fr, "ActionID") != action_id:
+                continue
+            frames.append(fr)
+            self._last_io = time.time()
+            if not until_complete or ami_field(fr, "Response") == "Error":
+                return frames
+            if ami_field(fr, "EventList") == "Complete" and ami_field(fr, "Event"):
+                return frames
+
+    def _retrying(self, fn):
+        # idempotent actions: one retry on a fresh session if the old one went stale
+        self._ensure()
+        try:
+            return fn()
+        except (AmiError, OSError):
+            self._drop()
+            self._ensure()
+            try:
+                return fn()
+            except (AmiError, OSError):
+                self._drop()
+                raise
+
+    # -- actions --
+    def ping(self) -> None:
+        r = self._action([("Action", "Ping")])[0]
+        if ami_field(r, "Response") != "Success":
+            raise AmiError(f"AMI ping: {ami_frame_text(r).strip()}")
+
+    def keepalive(self) -> None:
+        if self._sock is not None and time.time() - self._last_io >= AMI_PING_SEC:
+            try:
+                self.ping()
+            except (AmiError, OSError) as e:
+                log(f"AMI keepalive failed, session dropped: {e}")
+                self._drop()
+
+    def core_show_channels(self) -> str:
+        frames = self._retrying(lambda: self._action([("Action", "CoreShowChannels")], until_complete=True))
+        return "".join(ami_frame_text(fr) for fr in frames)
+
+    def hangup(self, channel: str) -> bool:
+        frames = self._retrying(lambda: self._action([("Action", "Hangup"), ("Channel", channel)]))
+        return ami_field(frames[0], "Response") == "Success"
+
+    def originate(self, fields: AmiFrame, action_id: str) -> AmiFrame:
+        """
+        Not retried: once sent, the call may already be up.
+        """
+        self._ensure()
+        try:
+            return self._action([("Action", "Originate")] + fields, action_id=action_id)[0]
+        except (AmiError, OSError) as e:
+            self._drop()
+            raise AmiError(f"AMI originate outcome unknown: {e}") from e
+
+def ami_client() -> AmiClient:
+    global _ami_client
+    if _ami_client is None:
+        _ami_client = AmiClient(AMI_HOST, AMI_PORT, AMI_USER, AMI_PASS)
+    return _ami_client
+
+def ami_core_show_channels() -> str:
+    return ami_client().core_show_channels()
 
 def ami_hangup_channel(channel: str) -> bool:
-    if not AMI_PASS:
-        raise AmiError("AMI password missing (KFX_AMI_PASS)")
     channel = (channel or "").strip()
     if not channel:
         return False
-    s = socket.create_connection((AMI_HOST, AMI_PORT), timeout=5)
-    sockf = s.makefile("rwb", buffering=0)
-    try:
-        _ = sockf.readline()
-        ami_login(sockf)
-        ami_send(sockf, "Action: Hangup")
-        ami_send(sockf, f"Channel: {channel}")
-        ami_send(sockf, "")
-        r = ami_read_response(sockf)
-        return ("Response: Success" in r)
-    finally:
-        try:
-            ami_logoff(sockf)
-        finally:
-            try: sockf.close()
-            except Exception: pass
-            try: s.close()
-            except Exception: pass
+    return ami_client().hangup(channel)
 
 def ami_originate_local(jobid: str, exten: str, tiff_path: str) -> None:
-    if not AMI_PASS:
-        raise AmiError("AMI password missing (KFX_AMI_PASS)")
-
-    action_id = f"kfx-{jobid}"
     channel = f"Local/{exten}@{DIAL_CONTEXT}/n"
+    r = ami_client().originate([
+        ("Channel", channel),
+        ("Async", "true"),
+        ("Application", "Wait"),
+        ("Data", str(AMI_ORIGINATE_WAIT_SEC)),
+        ("Variable", f"KFX_JOBID={jobid}"),
+        ("Variable", f"KFX_FILE={tiff_path}"),
+    ], action_id=f"kfx-{jobid}")
+    if ami_field(r, "Response") != "Success":
+        raise AmiError(f"AMI originate failed: {ami_frame_text(r).strip()}")
+
+# live fax progress from AMI events
+_AMI_EVENT_FILTERS = ("Application: SendFAX", "Event: FAXStatus", "Event: SendFAX",
+                      "Event: FAXSession", "Event: Hangup")
+
+def _empty_fax_live(channel: str, tiff_path: str) -> Dict[str, Any]:
+    return {
+        "active": True,
+        "updated_at": now_iso(),
+        "connected_at": now_iso(),
+        "channel": channel,
+        "session": None,
+        "operation": "",
+        "state": "",
+        "last_status": "",
+        "ecm_mode": "",
+        "data_rate": None,
+        "image_resolution": "",
+        "page_number": None,
+        "tx_pages": None,
+        "rx_pages": None,
+        "file_name": tiff_path,
+        "total_pages": _tiff_page_count(tiff_path),
+    }
 
-    s = socket.create_connection((AMI_HOST, AMI_PORT), timeout=5)
-    sockf = s.makefile("rwb", buffering=0)
+class FaxLiveModel:
+    """
+    Live state of running SendFAX calls, keyed by channel. Fed by the AMI event
+    thread, drained by the main loop (take_dirty) for job.json. Every change
+    rewrites LIVE_STATUS_FILE right away.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.calls: Dict[str, Dict[str, Any]] = {}   # channel -> {"job": id, "live": {...}}
+        self.dirty: set[str] = set()
+
+    def _by_session(self, session: Optional[int]) -> Optional[Dict[str, Any]]:
+        for call in self.calls.values():
+            if session is not None and call["live"].get("session") == session:
+                return call
+        return None
+
+    def _update(self, call: Dict[str, Any], **fields: Any) -> bool:
+        live = call["live"]
+        fields = {k: v for k, v in fields.items() if v not in ("", None) and live.get(k) != v}
+        if not fields:
+            return False
+        live.update(fields)
+        live["updated_at"] = now_iso()
+        self.dirty.add(call["job"])
+        return True
+
+    def has_active(self) -> bool:
+        with self.lock:
+            return any(c["live"].get("active") for c in self.calls.values())
+
+    def active_sessions(self) -> List[int]:
+        with self.lock:
+            return [c["live"]["session"] for c in self.calls.values()
+                    if c["live"].get("active") and c["live"].get("session") is not None]
+
+    def on_event(self, fr: AmiFrame) -> bool:
+        ev = ami_field(fr, "Event")
+        ch = ami_field(fr, "Channel")
+        with self.lock:
+            if ev == "Newexten" and ami_field(fr, "Application").lower() == "sendfax":
+                tiff_path = ami_field(fr, "AppData").split(",", 1)[0].strip()
+                jp = _find_job_for_tiff(tiff_path)
+                if jp is None or ch in self.calls:
+                    return False
+                self.calls[ch] = {"job": jp.parent.name, "live": _empty_fax_live(ch, tiff_path)}
+                self.dirty.add(jp.parent.name)
+                return True
+            if ev == "FAXSession":
+                call = self._by_session(_int_or_none(ami_field(fr, "SessionNumber")))
+                if call is None:
+                    return False
+                return self._update(call,
+                                    operation=ami_field(fr, "Operation"),
+                                    state=ami_field(fr, "State"),
+                                    ecm_mode=ami_field(fr, "ErrorCorrectionMode"),
+                                    data_rate=_int_or_none(ami_field(fr, "DataRate")),
+                                    image_resolution=ami_field(fr, "ImageResolution"),
+                                    page_number=_int_or_none(ami_field(fr, "PageNumber")),
+                                    tx_pages=_int_or_none(ami_field(fr, "PagesTransmitted")),
+                                    rx_pages=_int_or_none(ami_field(fr, "PagesReceived")))
+            call = self.calls.get(ch)
+            if call is None:
+                return False
+            if ev == "FAXSessionsEntry":
+                return self._update(call,
+                                    session=_int_or_none(ami_field(fr, "SessionNumber")),
+                                    operation=ami_field(fr, "Operation"),
+                                    state=ami_field(fr, "State"))
+            if ev == "FAXStatus":
+                return self._update(call, last_status=ami_field(fr, "Status"))
+            if ev == "SendFAX":
+                return self._update(call,
+                                    tx_pages=_int_or_none(ami_field(fr, "PagesTransferred")),
+                                    data_rate=_int_or_none(ami_field(fr, "TransferRate")),
+                                    image_resolution=ami_field(fr, "Resolution"))
+            if ev == "Hangup":
+                return self._update(call, active=False)
+        return False
+
+    def _elapsed(self, live: Dict[str, Any]) -> Dict[str, Any]:
+        out = dict(live)
+        start = parse_iso_ts(live.get("connected_at"))
+        if start:
+            out["elapsed_sec"] = int((datetime.now(timezone.utc) - start).total_seconds())
+        return out
+
+    def take_dirty(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Changed entries for job.json; finished calls are dropped once handed out.
+        """
+        with self.lock:
+            out = {c["job"]: self._elapsed(c["live"]) for c in self.calls.values() if c["job"] in self.dirty}
+            self.dirty.clear()
+            ended = [ch for ch, c in self.calls.items() if not c["live"].get("active")]
+            for ch in ended:
+                del self.calls[ch]
+        if ended:
+            self.write_status()
+        return out
+
+    def reset(self) -> None:
+        with self.lock:
+            self.calls.clear()
+            self.dirty.clear()
+        self.write_status()
+
+    def write_status(self) -> None:
+        with self.lock:
+            jobs = {c["job"]: {"updated_at": c["live"]["updated_at"], "asterisk_fax": self._elapsed(c["live"])}
+                    for c in self.calls.values()}
+            tmp = LIVE_STATUS_FILE.with_name(f".{LIVE_STATUS_FILE.name}.tmp")
+            try:
+                with tmp.open("w", encoding="utf-8") as f:
+                    json.dump({"updated_at": now_iso(), "jobs": jobs}, f,
+                              ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp, LIVE_STATUS_FILE)
+            except Exception as e:
+                log(f"live status write failed: {e}")
+
+FAX_LIVE = FaxLiveModel()
+
+class AmiEventListener(threading.Thread):
+    """
+    Second AMI session with events on, filtered to what FAX_LIVE needs. While calls
+    are active it also polls FAXSessions/FAXSession on the same session (replies
+    arrive as events). Reconnects with backoff; `connected` tells the main loop
+    whether to fall back to `asterisk -rx` polling.
+    """
+
+    def __init__(self, model: FaxLiveModel) -> None:
+        super().__init__(name="ami-events", daemon=True)
+        self.model = model
+        self.connected = False
+        self._stop_evt = threading.Event()
+        self._backoff = 1.0
+        self._seq = 0
+        self._sock: Optional[socket.socket] = None
+
+    def stop(self) -> None:
+        self._stop_evt.set()
+
+    def run(self) -> None:
+        while not self._stop_evt.is_set():
+            try:
+                self._session()
+            except Exception as e:
+                if self.connected or self._backoff <= 1.0:
+                    log(f"AMI event session: {e}")
+            if self.connected:
+                self.connected = False
+                self.model.reset()
+            self._stop_evt.wait(self._backoff)
+            self._backoff = min(self._backoff * 2, AMI_BACKOFF_MAX_SEC)
+
+    def _send(self, fields: AmiFrame) -> str:
+        self._seq += 1
+        action_id = f"kfx-ev-{self._seq}"
+        payload = "".join(f"{k}: {v}\r\n" for k, v in fields + [("ActionID", action_id)]) + "\r\n"
+        self._sock.sendall(payload.encode("utf-8", errors="ignore"))
+        return action_id
+
+    def _frames(self, buf: bytearray):
+        while True:
+            i = buf.find(b"\r\n\r\n")
+            if i < 0:
+                return
+            block = bytes(buf[:i]).decode("utf-8", errors="replace")
+            del buf[:i + 4]
+            frame: AmiFrame = []
+            for ln in block.split("\r\n"):
+                if ln.strip():
+                    k, _, v = ln.partition(":")
+                    frame.append((k.strip(), v.strip()))
+            if frame:
+                yield frame
+
+    def _recv(self, buf: bytearray, timeout: float) -> None:
+        r, _, _ = select.select([self._sock], [], [], timeout)
+        if r:
+            data = self._sock.recv(65536)
+            if not data:
+                raise AmiError("AMI closed the connection")
+            buf += data
+
+    def _session(self) -> None:
+        if not AMI_PASS:
+            raise AmiError("AMI password missing (KFX_AMI_PASS)")
+        self._sock = socket.create_connection((AMI_HOST, AMI_PORT), timeout=AMI_TIMEOUT_SEC)
+        try:
+            buf = bytearray()
+            deadline = time.time() + AMI_TIMEOUT_SEC
+            while b"\r\n" not in buf:
+                if time.time() > deadline:
+                    raise AmiError("AMI greeting timeout")
+                self._recv(buf, 0.5)
+            greeting, _, rest = bytes(buf).partition(b"\r\n")
+            buf = bytearray(rest)
+            if not greeting.startswith(b"Asterisk Call Manager"):
+                raise AmiError(f"AMI greeting: {greeting!r}")
+
+            pending: Dict[str, str] = {}
+            pending[self._send([("Action", "Login"), ("Username", AMI_USER),
+                                ("Secret", AMI_PASS), ("Events", "call,dialplan")])] = "Login"
+            for flt in _AMI_EVENT_FILTERS:
+                pending[self._send([("Action", "Filter"), ("Operation", "Add"), ("Filter", flt)])] = "Filter"
+            next_poll = 0.0
+            while not self._stop_evt.is_set():
+                self._recv(buf, 0.25)
+                for fr in self._frames(buf):
+                    kind = pending.pop(ami_field(fr, "ActionID"), "")
+                    if kind == "Login":
+                        if ami_field(fr, "Response") != "Success":
+                            raise AmiError(f"AMI login failed: {ami_frame_text(fr).strip()}")
+                        self.connected = True
+                        self._backoff = 1.0
+                        log(f"AMI event session open ({AMI_HOST}:{AMI_PORT})")
+                        continue
+                    if kind == "Filter" and ami_field(fr, "Response") != "Success":
+                        log(f"AMI event filter rejected (all events delivered): {ami_frame_text(fr).strip()}")
+                        continue
+                    self._dispatch(fr)
+                if self.connected and time.time() >= next_poll and self.model.has_active():
+                    next_poll = time.time() + FAX_LIVE_REFRESH_SEC
+                    self._send([("Action", "FAXSessions")])
+        finally:
+            try:
+                self._sock.close()
+            except Exception:
+                pass
+            self._sock = None
+
+    def _dispatch(self, fr: AmiFrame) -> None:
+        changed = self.model.on_event(fr)
+        if ami_field(fr, "Event") == "FAXSessionsEntry":
+            session = _int_or_none(ami_field(fr, "SessionNumber"))
+            if session is not None and session in self.model.active_sessions():
+                self._send([("Action", "FAXSession"), ("SessionNumber", str(session))])
+        if changed:
+            self.model.write_status()
+            _wake.set()
+
+def start_fax_live_events() -> None:
+    global _fax_events
+    if not FAX_LIVE_EVENTS or not AMI_PASS:
+        return
+    _fax_events = AmiEventListener(FAX_LIVE)
+    _fax_events.start()
+
+def prepare_send_files(jobdir: Path, job: Dict[str, Any]) -> Tuple[Path, Path]:
+    ready = _prepare_ready(jobdir, job)
+    if ready is not None:
+        return ready
+    t0 = time.monotonic()
+    pdf_in = find_original_pdf_in_jobdir(jobdir)
+    if not pdf_in:
+        raise RuntimeError("missing doc.pdf/source.pdf")
+    tiff = jobdir / "doc.tif"
+    fresh = (not tiff.exists()) or (tiff.stat().st_size == 0)
+    if fresh:
+        pdf_in, report = optimize_source_pdf(jobdir, pdf_in)
+    elif (jobdir / "doc_opt.pdf").is_file():
+        pdf_in = jobdir / "doc_opt.pdf"
+    pdf_for_archive = add_header_pdf(pdf_in)
+    if fresh:
+        pdf_to_tiff_g4(pdf_for_archive, tiff)
+        report = optimize_report_actual(report, tiff)
+        if report:
+            job["optimize"] = report
+    log_render_cache_stats()
+    METRICS.observe("kfx_stage_seconds", time.monotonic() - t0, stage="prepare")
+    return pdf_for_archive, tiff
+
+def _prepare_artifacts(jobdir_s: str) -> Dict[str, Any]:
+    # runs inside the prepare pool
+    t0 = time.time()
+    stats0 = dict(_render_cache_stats)
+    jobdir = Path(jobdir_s)
+    pdf_in = find_original_pdf_in_jobdir(jobdir)
+    if not pdf_in:
+        raise RuntimeError("missing doc.pdf/source.pdf")
+    pdf_in, report = optimize_source_pdf(jobdir, pdf_in)
+    pdf_for_archive = add_header_pdf(pdf_in)
+    tiff = jobdir / "doc.tif"
+    tmp = jobdir / f".doc.tif.tmp.{os.getpid()}"
     try:
-        _ = sockf.readline()
-        ami_login(sockf)
+        pdf_to_tiff_g4(pdf_for_archive, tmp)
+        report = optimize_report_actual(report, tmp)
+        os.replace(tmp, tiff)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return {
+        "pdf_for_archive": pdf_for_archive.name,
+        "tiff": tiff.name,
+        "duration_sec": round(time.time() - t0, 3),
+        "render_cache": {k: _render_cache_stats[k] - stats0.get(k, 0) for k in _render_cache_stats},
+        "optimize": report,
+        # gs/qpdf/header timings of this process, merged into the main process METRICS
+        "metrics": METRICS.take_hists(),
+    }
 
-        ami_send(sockf, "Action: Originate")
-        ami_send(sockf, f"ActionID: {action_id}")
-        ami_send(sockf, f"Channel: {channel}")
-        ami_send(sockf, "Async: true")
+def _prepare_ready(jobdir: Path, job: Dict[str, Any]) -> Optional[Tuple[Path, Path]]:
+    prep = job.get("prepare") or {}
+    if not isinstance(prep, dict) or prep.get("state") != "ready":
+        return None
+    pdf = jobdir / str(prep.get("pdf_for_archive") or "")
+    tiff = jobdir / str(prep.get("tiff") or "")
+    try:
+        if pdf.is_file() and tiff.is_file() and tiff.stat().st_size > 0:
+            return pdf, tiff
+    except Exception:
+        pass
+    return None
 
-        ami_send(sockf, "Application: Wait")
-        ami_send(sockf, f"Data: {AMI_ORIGINATE_WAIT_SEC}")
+def prepare_claimable(jobdir: Path, job: Dict[str, Any]) -> bool:
+    if PREPARE_WORKERS <= 0:
+        return True
+    if _prepare_ready(jobdir, job) is not None:
+        return True
+    return str((job.get("prepare") or {}).get("state") or "") == "failed"
 
-        ami_send(sockf, f"Variable: KFX_JOBID={jobid}")
-        ami_send(sockf, f"Variable: KFX_FILE={tiff_path}")
-        ami_send(sockf, "")
+def step_prepare() -> None:
+    global _prepare_pool
+    if PREPARE_WORKERS <= 0:
+        return
 
-        r = ami_read_response(sockf)
-        if "Response: Success" not in r:
-            raise AmiError(f"AMI originate failed: {r.strip()}")
-    finally:
+    for name, (started, fut) in list(_prepare_futures.items()):
+        if not fut.done():
+            continue
+        del _prepare_futures[name]
+        jdir = QUEUE / name
+        if not jdir.is_dir():
+            continue
+        prep: Dict[str, Any] = {"started_at": datetime.fromtimestamp(started, timezone.utc).replace(microsecond=0).isoformat(),
+                                "finished_at": now_iso()}
         try:
-            ami_logoff(sockf)
-        finally:
-            try: sockf.close()
-            except Exception: pass
-            try: s.close()
-            except Exception: pass
+            prep.update(fut.result())
+            prep["state"] = "ready"
+            METRICS.merge_hists(prep.pop("metrics", None) or {})
+            METRICS.observe("kfx_stage_seconds", float(prep.get("duration_sec") or 0), stage="prepare")
+            log_render_cache_stats(prep.get("render_cache"))
+        except Exception as e:
+            prep["state"] = "failed"
+            prep["error"] = str(e)
+            log(f"prepare failed {name}: {e}")
+        report = prep.pop("optimize", None)
+        def apply(job: Dict[str, Any]) -> None:
+            job["prepare"] = prep
+            if report:
+                job["optimize"] = report
+        try:
+            if update_job_json(jdir, apply):
+                _prepare_done.add(name)
+                log(f"prepare {prep['state']} {name} ({prep.get('duration_sec', '?')}s)")
+        except Exception as e:
+            log(f"prepare: job.json update failed {name}: {e}")
 
-def prepare_send_files(jobdir: Path, job: Dict[str, Any]) -> Tuple[Path, Path]:
-    pdf_in = find_original_pdf_in_jobdir(jobdir)
-    if not pdf_in:
-        raise RuntimeError("missing doc.pdf/source.pdf")
-    pdf_for_archive = add_header_pdf(pdf_in)
-    tiff = jobdir / "doc.tif"
-    if (not tiff.exists()) or (tiff.stat().st_size == 0):
-        pdf_to_tiff_g4(pdf_for_archive, tiff)
-    return pdf_for_archive, tiff
+    names = set()
+    for jdir in list_jobdirs(QUEUE):
+        names.add(jdir.name)
+        if len(_prepare_futures) >= PREPARE_WORKERS:
+            continue
+        if jdir.name in _prepare_futures or jdir.name in _prepare_done:
+            continue
+        try:
+            job = read_json(jdir / "job.json")
+        except Exception:
+            continue
+        if cancel_requested(job):
+            continue
+        if _prepare_ready(jdir, job) is not None or (job.get("prepare") or {}).get("state") == "failed":
+            _prepare_done.add(jdir.name)
+            continue
+        if _prepare_pool is None:
+            # not forked: the AMI listener/client and archive threads are already running and a
+            # fork could copy one of their locks held; forkserver children import the module fresh
+            # (config comes from the environment)
+            _prepare_pool = ProcessPoolExecutor(max_workers=PREPARE_WORKERS,
+                                                mp_context=multiprocessing.get_context("forkserver"))
+        _prepare_futures[jdir.name] = (time.time(), _prepare_pool.submit(_prepare_artifacts, str(jdir)))
+    _prepare_done.intersection_update(names)
 
 def _attempt_limit_reached(job: Dict[str, Any]) -> bool:
     a = job.get("attempt") or {}
@@ -945,6 +2634,7 @@ def submit_job(jobdir: Path) -> None:
         raise RuntimeError("invalid recipient number")
 
     pdf_for_archive, tiff = prepare_send_files(jobdir, job)
+    tiff = build_bundle_tiff(jobdir, job, tiff)
 
     job["claimed_at"] = job.get("claimed_at") or now_iso()
     job["submitted_at"] = now_iso()
@@ -978,10 +2668,12 @@ def submit_job(jobdir: Path) -> None:
 
     write_json(jp, job)
 
+    t_submit = time.monotonic()
     try:
         ami_originate_local(jobid=str(job.get("job_id") or jobdir.name),
                             exten=number,
                             tiff_path=str(tiff))
+        METRICS.observe("kfx_stage_seconds", time.monotonic() - t_submit, stage="submit")
         log(f"submitted via AMI -> {jobdir.name} exten={number} next_attempt={prev + 1} wait={AMI_ORIGINATE_WAIT_SEC}s")
     except Exception as e:
         job = read_json(jp)
@@ -993,7 +2685,56 @@ def submit_job(jobdir: Path) -> None:
         log(f"submit failed for {jobdir.name}: {e}")
         _next_submit_ts = time.time() + POST_CALL_COOLDOWN_SEC
 
+def archive_index(out_json: Path) -> None:
+    mod = lib_module("kfx_archive", ARCHIVE_MODULE)
+    if not mod:
+        return
+    try:
+        mod.index_file(out_json, base=BASE)
+    except Exception as e:
+        log(f"archive index: {out_json.name} not indexed: {e}")
+
+def archive_index_sync() -> None:
+    # catches up on reports written/moved/deleted while the worker was not indexing,
+    # then (ARCHIVE_COMPACT_DAYS) packs old reports once a day
+    mod = lib_module("kfx_archive", ARCHIVE_MODULE)
+    if not mod:
+        return
+    def run() -> None:
+        try:
+            t0 = time.monotonic()
+            updated, removed = mod.sync(BASE)
+            if updated or removed:
+                log(f"archive index: {updated} updated, {removed} removed ({time.monotonic() - t0:.1f}s)")
+        except Exception as e:
+            log(f"archive index: sync failed: {e}")
+        while ARCHIVE_COMPACT_DAYS > 0:
+            try:
+                s = mod.compact(BASE, ARCHIVE_COMPACT_DAYS, log=lambda m: log(f"archive {m}"))
+                if s["packed"] or s["skipped"]:
+                    log(f"archive compact: {s['packed']} packed, {s['skipped']} skipped")
+            except Exception as e:
+                log(f"archive compact failed: {e}")
+            time.sleep(ARCHIVE_COMPACT_INTERVAL_SEC)
+    threading.Thread(target=run, name="archive-index-sync", daemon=True).start()
+
+def archive_store_doc(doc: Path, job: Dict[str, Any]) -> bool:
+    # ARCHIVE_DEDUP: document into the archive store, reference in the job JSON
+    if not ARCHIVE_DEDUP or not doc.is_file():
+        return False
+    mod = lib_module("kfx_archive", ARCHIVE_MODULE)
+    if not mod:
+        return False
+    try:
+        job["archive_store"] = mod.store_document(doc, base=BASE)
+        return True
+    except Exception as e:
+        job.pop("archive_store", None)
+        log(f"archive store: {doc.name} not stored -> classic PDF: {e}")
+        return False
+
 def finalize_ok(jobdir: Path, job: Dict[str, Any]) -> None:
+    t0 = time.monotonic()
     safe_mkdir(ARCH_OK)
     src = job.get("source") or {}
     base = sanitize_basename(Path(src.get("filename_original") or "fax").stem)
@@ -1007,15 +2748,22 @@ def finalize_ok(jobdir: Path, job: Dict[str, Any]) -> None:
         pdf_for_archive = find_original_pdf_in_jobdir(jobdir) or (jobdir / "doc.pdf")
 
     build_report_pdf(job, report_pdf)
-    merge_report_and_doc(report_pdf, pdf_for_archive, merged_pdf)
+    if archive_store_doc(pdf_for_archive, job):
+        shutil.move(str(report_pdf), str(merged_pdf))
+    else:
+        merge_report_and_doc(report_pdf, pdf_for_archive, merged_pdf)
 
     out_pdf = ARCH_OK / f"{base}__{jobid}__OK.pdf"
     out_json = ARCH_OK / f"{base}__{jobid}.json"
     shutil.move(str(merged_pdf), str(out_pdf))
     write_json(out_json, job)
+    archive_index(out_json)
     log(f"finalize OK -> {out_pdf.name}")
+    METRICS.observe("kfx_stage_seconds", time.monotonic() - t0, stage="finalize")
+    metrics_job_finished(job, "OK")
 
 def finalize_failed(jobdir: Path, job: Dict[str, Any]) -> None:
+    t0 = time.monotonic()
     safe_mkdir(FAIL_OUT)
     try:
         copy_original_to_fail_in(jobdir, job)
@@ -1056,7 +2804,11 @@ def finalize_failed(jobdir: Path, job: Dict[str, Any]) -> None:
     out_json = FAIL_OUT / f"{base}__{jobid}.json"
     shutil.move(str(merged_pdf), str(out_pdf))
     write_json(out_json, job)
+    archive_index(out_json)
     log(f"finalize FAILED -> {out_pdf.name}")
+    METRICS.observe("kfx_stage_seconds", time.monotonic() - t0, stage="finalize")
+    reason = str((job.get("result") or {}).get("reason") or "") if isinstance(job.get("result"), dict) else ""
+    metrics_job_finished(job, "cancelled" if _st_norm(job) == "CANCELLED" or reason == "cancelled" else "FAILED")
 
 def finalize_unreadable_processing_job(jdir: Path, reason: str) -> bool:
     jobid = jdir.name
@@ -1111,13 +2863,18 @@ def finalize_unreadable_processing_job(jdir: Path, reason: str) -> bool:
 
 def requeue_retry(jobdir: Path, job: Dict[str, Any]) -> None:
     job["status"] = "RETRY_WAIT"
+    job.pop("bundle", None)
     job["updated_at"] = now_iso()
     write_json(jobdir / "job.json", job)
 
     target = QUEUE / jobdir.name
     try:
         jobdir.rename(target)
+        retry_timers().add(target.name, retry_due_epoch(job))
         r = job.get("retry") or {}
+        # capacity deferrals do not use up an attempt
+        METRICS.inc("kfx_jobs_requeued_total",
+                    outcome="DEFERRED" if r.get("last_reason") == "EXTERNAL_CAPACITY_FULL" else "RETRY")
         a = job.get("attempt") or {}
         try:
             cur = int(a.get("current") or 0)
@@ -1130,19 +2887,243 @@ def requeue_retry(jobdir: Path, job: Dict[str, Any]) -> None:
     except Exception as e:
         log(f"retry move back to queue failed for {jobdir.name}: {e}")
 
-def finalize_cancelled_queue_job(jdir: Path) -> bool:
-    jp = jdir / "job.json"
-    if not jp.exists():
-        return False
+def coalesce_claimed(jobdir: Path) -> List[str]:
+    """
+    Pulls queued jobs to the same number (created within COALESCE_WINDOW_SEC of the
+    claimed job, prepared, due) into processing as BUNDLED members of the claimed job.
+    Returns the member ids.
+    """
+    if not COALESCE or COALESCE_MAX_JOBS <= 1:
+        return []
+    jp = jobdir / "job.json"
     try:
-        job = read_json(jp)
+        lead = read_json(jp)
+    except Exception:
+        return []
+    number = job_number(lead)
+    if not number or cancel_requested(lead):
+        return []
+    leader_id = str(lead.get("job_id") or jobdir.name)
+    t0 = parse_iso_ts(lead.get("created_at"))
+
+    members: List[str] = []
+    timers = retry_timers()
+    for j in list_jobdirs(QUEUE):
+        if len(members) + 1 >= COALESCE_MAX_JOBS:
+            break
+        if timers.pending(j.name):
+            continue
+        try:
+            job = read_json(j / "job.json")
+        except Exception:
+            continue
+        if job_number(job) != number or cancel_requested(job) or not retry_due(job):
+            continue
+        if _attempt_limit_reached(job) or not prepare_claimable(j, job):
+            continue
+        t = parse_iso_ts(job.get("created_at"))
+        if t0 and t and abs((t - t0).total_seconds()) > COALESCE_WINDOW_SEC:
+            continue
+        target = PROC / j.name
+        try:
+            j.rename(target)
+        except Exception as e:
+            log(f"coalesce: move failed for {j.name}: {e}")
+            continue
+        job["bundle"] = {"leader": leader_id, "prev_status": str(job.get("status") or "")}
+        job["status"] = "BUNDLED"
+        job["claimed_at"] = job.get("claimed_at") or now_iso()
+        job["updated_at"] = now_iso()
+        write_json(target / "job.json", job)
+        members.append(j.name)
+
+    if members:
+        lead["bundle"] = {"members": members}
+        write_json(jp, lead)
+        log(f"coalesce: {leader_id} + {len(members)} job(s) to {number}")
+    return members
+
+def release_bundle_member(name: str) -> None:
+    # back to the queue as it was, e.g. the bundle could not be built or the call was cancelled
+    mdir = PROC / name
+    try:
+        job = read_json(mdir / "job.json")
+        job["status"] = (job.get("bundle") or {}).get("prev_status") or "queued"
+        job.pop("bundle", None)
+        job["updated_at"] = now_iso()
+        write_json(mdir / "job.json", job)
+        mdir.rename(QUEUE / name)
+        log(f"coalesce: {name} back to queue")
     except Exception as e:
-        log(f"queue-cancel: cannot read {jdir.name}: {e}")
-        return False
+        log(f"coalesce: release failed for {name}: {e}")
+
+def build_bundle_tiff(jobdir: Path, job: Dict[str, Any], tiff: Path) -> Path:
+    """
+    Concatenates the leader's TIFF with its members' (tiffcp) and records the page
+    range of every document in job["bundle"]["docs"]. Members that do not fit are
+    released; without members the leader's own TIFF is returned unchanged.
+    """
+    b = job.get("bundle") or {}
+    members = list(b.get("members") or [])
+    if not members:
+        job.pop("bundle", None)
+        return tiff
+
+    leader_id = str(job.get("job_id") or jobdir.name)
+    total = _tiff_page_count(str(tiff)) or 0
+    docs = [{"job_id": leader_id, "pages": total}]
+    parts = [tiff]
+    keep: List[str] = []
+    for name in members:
+        mdir = PROC / name
+        try:
+            mjob = read_json(mdir / "job.json")
+            mpdf, mtiff = prepare_send_files(mdir, mjob)
+            pages = _tiff_page_count(str(mtiff))
+        except Exception as e:
+            log(f"coalesce: {name} not sendable: {e}")
+            release_bundle_member(name)
+            continue
+        if not total or not pages or total + pages > COALESCE_MAX_PAGES:
+            release_bundle_member(name)
+            continue
+        mjob.setdefault("asterisk", {})["pdf_for_archive"] = str(mpdf)
+        write_json(mdir / "job.json", mjob)
+        parts.append(mtiff)
+        docs.append({"job_id": name, "pages": pages})
+        keep.append(name)
+        total += pages
+
+    out = jobdir / "bundle.tif"
+    if keep:
+        try:
+            if out.exists():
+                out.unlink()
+            rc, so, se = run_cmd([TIFFCP_BIN, *[str(p) for p in parts], str(out)], timeout=120)
+            if rc != 0 or not out.is_file():
+                raise RuntimeError(f"tiffcp rc={rc} err={(se or so).strip()}")
+        except Exception as e:
+            log(f"coalesce: bundle for {leader_id} failed, sending alone: {e}")
+            for name in keep:
+                release_bundle_member(name)
+            keep = []
+    if not keep:
+        job.pop("bundle", None)
+        return tiff
+
+    first = 1
+    for d in docs:
+        d["first_page"] = first
+        first += d["pages"]
+    try:
+        attempt_base = int((job.get("attempt") or {}).get("current") or 0)
+    except Exception:
+        attempt_base = 0
+    job["bundle"] = {"members": keep, "docs": docs, "pages": total, "tiff": str(out),
+                     "attempt_base": attempt_base}
+    log(f"coalesce: {leader_id} sends {len(docs)} documents / {total} pages in one call")
+    return out
+
+def _bundle_doc_result(res: Dict[str, Any], doc: Dict[str, Any], sent: Optional[int]) -> Dict[str, Any]:
+    out = dict(res)
+    pages = int(doc["pages"])
+    done = 0 if sent is None else max(0, min(pages, sent - int(doc["first_page"]) + 1))
+    out["faxpages_sent"] = done
+    out["faxpages_total"] = pages
+    out["faxpages_raw"] = f"{done}/{pages}"
+    out["bundle_faxpages_raw"] = res.get("faxpages_raw")
+    return out
 
-    if not cancel_requested(job):
+def settle_bundle(jdir: Path, job: Dict[str, Any], outcome: str) -> bool:
+    """
+    Gives every member of a bundled call its own outcome and report once the call
+    is over. outcome is OK, FAILED, CANCELLED or RETRY (also DEFERRED). Documents
+    whose pages were all transmitted count as OK whatever happened afterwards.
+    Returns True if that is the case for the leader's own document.
+    """
+    b = job.get("bundle") or {}
+    members = list(b.get("members") or [])
+    if not members:
+        return False
+    docs = {d["job_id"]: d for d in b.get("docs") or []}
+    if not docs:
+        # never dialled as a bundle
+        for name in members:
+            release_bundle_member(name)
+        job.pop("bundle", None)
         return False
 
+    leader_id = str(job.get("job_id") or jdir.name)
+    res = job.get("result") if isinstance(job.get("result"), dict) else {}
+    sent = int(b.get("pages") or 0) if outcome == "OK" else _int_or_none(res.get("faxpages_sent"))
+    order = [d["job_id"] for d in b.get("docs") or []]
+
+    def through(jid: str) -> bool:
+        d = docs.get(jid)
+        return bool(d) and sent is not None and int(d["first_page"]) + int(d["pages"]) - 1 <= sent
+
+    def doc_info(jid: str) -> Dict[str, Any]:
+        d = docs[jid]
+        return {"leader": leader_id, "index": order.index(jid) + 1, "count": len(order),
+                "first_page": d["first_page"], "pages": d["pages"]}
+
+    now = now_iso()
+    for name in members:
+        mdir = PROC / name
+        try:
+            mjob = read_json(mdir / "job.json")
+        except Exception as e:
+            log(f"coalesce: member {name} unreadable: {e}")
+            continue
+        if name not in docs:
+            release_bundle_member(name)
+            continue
+        if not through(name) and (outcome == "RETRY" or (outcome == "CANCELLED" and not cancel_requested(mjob))):
+            retry = mjob.setdefault("retry", {})
+            for k in ("next_try_at", "last_reason", "suggested_delay_sec", "streak", "streak_reason", "delay_sec"):
+                if k in (job.get("retry") or {}):
+                    retry[k] = job["retry"][k]
+            try:
+                used = int((job.get("attempt") or {}).get("current") or 0) - int(b.get("attempt_base") or 0)
+                a = mjob.setdefault("attempt", {})
+                a["current"] = int(a.get("current") or 0) + max(0, used)
+            except Exception:
+                pass
+            requeue_retry(mdir, mjob)
+            continue
+
+        if through(name):
+            st = "OK"
+        else:
+            st = "CANCELLED" if (outcome == "CANCELLED" or cancel_requested(mjob)) else "FAILED"
+        mjob["status"] = st
+        mjob["result"] = _bundle_doc_result(res, docs[name], sent)
+        if st == "OK" and outcome != "OK":
+            mjob["result"]["reason"] = "sent_in_bundle"
+        mjob.setdefault("bundle", {})["doc"] = doc_info(name)
+        for k in ("submitted_at", "started_at", "end_time"):
+            mjob[k] = mjob.get(k) or job.get(k) or now
+        mjob["finalized_at"] = now
+        mjob["updated_at"] = now
+        try:
+            write_json(mdir / "job.json", mjob)
+            if st == "OK":
+                finalize_ok(mdir, mjob)
+            else:
+                finalize_failed(mdir, mjob)
+        except Exception as e:
+            log(f"coalesce: finalize {st} exception {name}: {e}")
+        shutil.rmtree(mdir, ignore_errors=True)
+
+    job["bundle"]["doc"] = doc_info(leader_id)
+    job["result"] = _bundle_doc_result(res, docs[leader_id], sent)
+    if through(leader_id) and outcome != "OK":
+        job["result"]["reason"] = "sent_in_bundle"
+        return True
+    return outcome == "OK"
+
+def finalize_cancelled_queue_job(jdir: Path, job: Dict[str, Any]) -> bool:
+    jp = jdir / "job.json"
     now = now_iso()
     mark_cancel_handled(job)
     job["job_id"] = str(job.get("job_id") or jdir.name)
@@ -1173,9 +3154,36 @@ def finalize_cancelled_queue_job(jdir: Path) -> bool:
     log(f"queue-cancel: finalized CANCELLED -> {jdir.name}")
     return True
 
+# queued job -> stat key of the job.json last read and found not cancelled
+_queue_cancel_seen: Dict[str, str] = {}
+
 def step_queue_cancels() -> None:
+    """
+    The UI cancels by rewriting job.json, so a queued job is only re-read when its
+    stat key (ino:mtime_ns:size, as in SqliteJobStore.sync) changed since it was last checked.
+    """
+    seen: Dict[str, str] = {}
     for jdir in list_jobdirs(QUEUE):
-        finalize_cancelled_queue_job(jdir)
+        jp = jdir / "job.json"
+        try:
+            st = jp.stat()
+        except OSError:
+            continue
+        key = f"{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+        if _queue_cancel_seen.get(jdir.name) == key:
+            seen[jdir.name] = key
+            continue
+        try:
+            job = read_json(jp)
+        except Exception as e:
+            log(f"queue-cancel: cannot read {jdir.name}: {e}")
+            continue
+        if not cancel_requested(job):
+            seen[jdir.name] = key
+        elif not finalize_cancelled_queue_job(jdir, job):
+            continue
+    _queue_cancel_seen.clear()
+    _queue_cancel_seen.update(seen)
 
 def mark_orphaned_call_for_retry(jdir: Path, job: Dict[str, Any]) -> bool:
     st = _st_norm(job)
@@ -1335,6 +3343,10 @@ def step_cancel_processing() -> None:
         if not bool(c.get("requested")):
             continue
 
+        # members of a running bundle: settle_bundle() honours the cancel after the call
+        if _st_norm(job) == "BUNDLED":
+            continue
+
         jobid = str(job.get("job_id") or jdir.name)
 
         if str(job.get("status") or "").upper() in ("CANCELLED", "FAILED", "OK"):
@@ -1386,6 +3398,9 @@ def step_cancel_processing() -> None:
 def step_finalize_processing() -> None:
     global _next_submit_ts
     for jdir in list_jobdirs(PROC):
+        if not jdir.is_dir():
+            # bundle member already settled together with its leader
+            continue
         jp = jdir / "job.json"
         if not jp.exists():
             if finalize_unreadable_processing_job(jdir, "job.json missing"):
@@ -1400,6 +3415,13 @@ def step_finalize_processing() -> None:
 
         st = _st_norm(job)
 
+        if st == "BUNDLED":
+            # leader gone without settling (e.g. unreadable job.json): send on its own again
+            leader = str((job.get("bundle") or {}).get("leader") or "")
+            if not leader or not (PROC / leader).is_dir():
+                release_bundle_member(jdir.name)
+            continue
+
         if st == "DEFERRED":
             try:
                 delay = max(1, int(POST_CALL_COOLDOWN_SEC))
@@ -1410,6 +3432,7 @@ def step_finalize_processing() -> None:
                     datetime.now(timezone.utc) + timedelta(seconds=delay)
                 ).replace(microsecond=0).isoformat()
                 job.setdefault("result", {})["reason"] = "EXTERNAL_CAPACITY_FULL"
+                settle_bundle(jdir, job, "RETRY")
                 requeue_retry(jdir, job)
                 log(f"capacity deferred without attempt -> {jdir.name} cooldown={delay}s")
             except Exception as e:
@@ -1421,8 +3444,15 @@ def step_finalize_processing() -> None:
             _next_submit_ts = time.time() + POST_CALL_COOLDOWN_SEC
             continue
 
+        if st in ("OK", "FAILED", "CANCELLED", "RETRY", "RETRY_WAIT"):
+            # originate to call end (dialing + transmission), once per call, not per bundled doc
+            call = iso_age_sec(job.get("submitted_at"))
+            if call is not None:
+                METRICS.observe("kfx_stage_seconds", call, stage="call")
+
         if st == "OK":
             try:
+                settle_bundle(jdir, job, "OK")
                 if not job.get("finalized_at"):
                     job["finalized_at"] = now_iso()
                 job["end_time"] = job.get("end_time") or job["finalized_at"]
@@ -1436,11 +3466,16 @@ def step_finalize_processing() -> None:
 
         if st in ("FAILED", "CANCELLED"):
             try:
+                if settle_bundle(jdir, job, st):
+                    job["status"] = "OK"
                 if not job.get("finalized_at"):
                     job["finalized_at"] = now_iso()
                 job["end_time"] = job.get("end_time") or job["finalized_at"]
                 write_json(jp, job)
-                finalize_failed(jdir, job)
+                if job["status"] == "OK":
+                    finalize_ok(jdir, job)
+                else:
+                    finalize_failed(jdir, job)
             except Exception as e:
                 log(f"finalize FAILED exception {jdir.name}: {e}")
             shutil.rmtree(jdir, ignore_errors=True)
@@ -1455,10 +3490,27 @@ def step_finalize_processing() -> None:
                     base_reason = str((job.get("result") or {}).get("reason") or "RETRY")
                     mx = (job.get("attempt") or {}).get("max", (job.get("retry") or {}).get("max"))
                     job["result"]["reason"] = f"{base_reason} (max attempts reached: {mx})"
+                    if settle_bundle(jdir, job, "FAILED"):
+                        job["status"] = "OK"
                     job["finalized_at"] = job.get("finalized_at") or now_iso()
                     job["end_time"] = job.get("end_time") or job["finalized_at"]
                     write_json(jp, job)
-                    finalize_failed(jdir, job)
+                    if job["status"] == "OK":
+                        finalize_ok(jdir, job)
+                    else:
+                        finalize_failed(jdir, job)
+                    shutil.rmtree(jdir, ignore_errors=True)
+                    _next_submit_ts = time.time() + POST_CALL_COOLDOWN_SEC
+                    continue
+
+                if st == "RETRY":
+                    apply_retry_backoff(job)
+                if settle_bundle(jdir, job, "RETRY"):
+                    job["status"] = "OK"
+                    job["finalized_at"] = job.get("finalized_at") or now_iso()
+                    job["end_time"] = job.get("end_time") or job["finalized_at"]
+                    write_json(jp, job)
+                    finalize_ok(jdir, job)
                     shutil.rmtree(jdir, ignore_errors=True)
                     _next_submit_ts = time.time() + POST_CALL_COOLDOWN_SEC
                     continue
@@ -1472,6 +3524,8 @@ def step_finalize_processing() -> None:
 
 def step_submit() -> None:
     global _next_submit_ts
+    # every loop, cooldown or not: the UI long-polls change_seq and reads the index
+    job_store().sync()
     if time.time() < _next_submit_ts:
         return
 
@@ -1488,6 +3542,10 @@ def step_submit() -> None:
         jp = jdir / "job.json"
         try:
             job = read_json(jp)
+            # since created, or since the retry became due
+            wait = iso_age_sec((job.get("retry") or {}).get("next_try_at") or job.get("created_at"))
+            if wait is not None:
+                METRICS.observe("kfx_stage_seconds", max(0.0, wait), stage="queue_wait")
             job["claimed_at"] = job.get("claimed_at") or now_iso()
             if not job.get("status"):
                 job["status"] = "PROCESSING"
@@ -1500,6 +3558,11 @@ def step_submit() -> None:
         except Exception:
             pass
 
+        try:
+            coalesce_claimed(jdir)
+        except Exception as e:
+            log(f"coalesce exception {jdir.name}: {e}")
+
         try:
             submit_job(jdir)
         except Exception as e:
@@ -1519,16 +3582,33 @@ def step_submit() -> None:
 def main() -> None:
     ensure_dirs()
     acquire_lock()
-    log("started (v1.3.19)")
+    log("started (v1.3.32)")
+    header_module()
+    archive_index_sync()
+    start_metrics_server()
+    start_fax_live_events()
     try:
         while True:
+            ami_client().keepalive()
             step_update_asterisk_fax_live()
             step_queue_cancels()
             step_cancel_processing()
             step_finalize_processing()
+            step_prepare()
             step_submit()
-            time.sleep(POLL_INTERVAL_SEC)
+            metrics_tick()
+            # AMI events wake the loop early so live progress reaches job.json promptly
+            _wake.wait(POLL_INTERVAL_SEC)
+            _wake.clear()
     finally:
+        if _fax_events is not None:
+            _fax_events.stop()
+        if _prepare_pool is not None:
+            _prepare_pool.shutdown(wait=False, cancel_futures=True)
+        if _job_store is not None:
+            _job_store.close()
+        if _ami_client is not None:
+            _ami_client.close()
         release_lock()
 
 if __name__ == "__main__":
@@ -1540,3 +3620,809 @@ if __name__ == "__main__":
 PY
 
 chmod +x /usr/local/bin/kienzlefax-worker.py
+
+# Archiv-Index (Modul fuer Worker + CLI kienzlefax-archive)
+sudo mkdir -p /usr/local/lib/kienzlefax
+sudo tee /usr/local/lib/kienzlefax/kfx_archive.py >/dev/null <<'PY'
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+kfx_archive.py — Index ueber sendeberichte/ und sendefehler/berichte/
+
+SQLite-Datei (Default BASE/archive-index.sqlite, KFX_ARCHIVE_DB) mit einer Zeile je
+Archiv-JSON: Bereich (ok/failed), Dateinamen, Empfaenger, Nummer, Status, Grund,
+Seiten, Zeitpunkte; Volltextsuche per FTS5 (ohne FTS5: LIKE).
+
+Die Worker tragen beim Finalisieren ein (index_file), die Weboberflaeche liest und
+pflegt Verschieben/Loeschen; die Dateien bleiben massgeblich. sync() gleicht den
+Index inkrementell (nach mtime) mit den Verzeichnissen und Monatspaketen ab (= Backfill).
+
+Ablage (BASE/archive-store, KFX_ARCHIVE_STORE):
+  objects/ab/<sha256>.pdf   Dokumente, je Inhalt genau einmal (store_document)
+  packs/JJJJ-MM.zip         verdichtete Sendeberichte eines Monats: JSON + Berichtsseite
+Ein JSON mit "archive_store": {"doc": <sha256>, ...} verweist auf sein Dokument; der
+klassische Bericht+Dokument-PDF entsteht bei Bedarf neu (rebuild_pdf).
+
+CLI: kienzlefax-archive backfill | add FILE.json... | remove FILE.json... |
+     query [--area ok|failed] [--text ...] [--number ...] [--limit N] | count | find-failure NAME.pdf |
+     compact --older-than-days N | rebuild NAME.json [-o OUT.pdf] | gc
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BASE = Path(os.environ.get("KFX_BASE", "/srv/kienzlefax"))
+AREAS = {"ok": Path("sendeberichte"), "failed": Path("sendefehler") / "berichte"}
+PDF_SUFFIXES = ("__OK.pdf", "__FAILED.pdf")
+FTS_COLUMNS = ("recipient_name", "number", "number_digits", "source_file", "status", "reason", "error", "job_id")
+QPDF_BIN = os.environ.get("KFX_QPDF_BIN", "qpdf")
+REPORT_PAGES = 1          # the workers put a single report page in front of the document
+GC_GRACE_SEC = 86400      # objects younger than this are kept (stored, JSON not yet indexed)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS archive (
+  id INTEGER PRIMARY KEY,
+  area TEXT NOT NULL,
+  json_file TEXT NOT NULL,
+  pdf_file TEXT NOT NULL DEFAULT '',
+  job_id TEXT NOT NULL DEFAULT '',
+  status TEXT NOT NULL DEFAULT '',
+  reason TEXT NOT NULL DEFAULT '',
+  error TEXT NOT NULL DEFAULT '',
+  aborted INTEGER NOT NULL DEFAULT 0,
+  recipient_name TEXT NOT NULL DEFAULT '',
+  number TEXT NOT NULL DEFAULT '',
+  number_digits TEXT NOT NULL DEFAULT '',
+  source_file TEXT NOT NULL DEFAULT '',
+  pages TEXT NOT NULL DEFAULT '',
+  created_at TEXT NOT NULL DEFAULT '',
+  end_time TEXT NOT NULL DEFAULT '',
+  end_ts INTEGER NOT NULL DEFAULT 0,
+  json_mtime INTEGER NOT NULL DEFAULT 0,
+  doc_sha256 TEXT NOT NULL DEFAULT '',
+  pack TEXT NOT NULL DEFAULT '',
+  UNIQUE(area, json_file)
+);
+CREATE INDEX IF NOT EXISTS archive_area_end ON archive(area, end_ts DESC);
+CREATE INDEX IF NOT EXISTS archive_number ON archive(number_digits);
+CREATE INDEX IF NOT EXISTS archive_source ON archive(area, source_file);
+"""
+
+FTS_SCHEMA = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS archive_fts USING fts5(
+  {", ".join(FTS_COLUMNS)}, content='archive', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS archive_ai AFTER INSERT ON archive BEGIN
+  INSERT INTO archive_fts(rowid, {", ".join(FTS_COLUMNS)})
+  VALUES (new.id, {", ".join("new." + c for c in FTS_COLUMNS)});
+END;
+CREATE TRIGGER IF NOT EXISTS archive_ad AFTER DELETE ON archive BEGIN
+  INSERT INTO archive_fts(archive_fts, rowid, {", ".join(FTS_COLUMNS)})
+  VALUES ('delete', old.id, {", ".join("old." + c for c in FTS_COLUMNS)});
+END;
+CREATE TRIGGER IF NOT EXISTS archive_au AFTER UPDATE ON archive BEGIN
+  INSERT INTO archive_fts(archive_fts, rowid, {", ".join(FTS_COLUMNS)})
+  VALUES ('delete', old.id, {", ".join("old." + c for c in FTS_COLUMNS)});
+  INSERT INTO archive_fts(rowid, {", ".join(FTS_COLUMNS)})
+  VALUES (new.id, {", ".join("new." + c for c in FTS_COLUMNS)});
+END;
+"""
+
+
+def db_path(base: Optional[Path] = None) -> Path:
+    env = os.environ.get("KFX_ARCHIVE_DB")
+    if env:
+        return Path(env)
+    return Path(base or DEFAULT_BASE) / "archive-index.sqlite"
+
+
+def connect(base: Optional[Path] = None) -> sqlite3.Connection:
+    p = db_path(base)
+    fresh = not p.exists()
+    conn = sqlite3.connect(str(p), timeout=10)
+    conn.row_factory = sqlite3.Row
+    # rollback journal instead of WAL: the web UI (other user) only needs file access
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.executescript(SCHEMA)
+    _migrate(conn)
+    if fts_enabled(conn) is None:
+        try:
+            conn.executescript(FTS_SCHEMA)
+            has_fts = "1"
+        except sqlite3.OperationalError:
+            has_fts = "0"  # sqlite without FTS5: text search falls back to LIKE
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('fts', ?)", (has_fts,))
+        conn.commit()
+    if fresh:
+        try:
+            os.chmod(str(p), 0o666)  # the web UI moves/deletes reports and keeps the index in step
+        except OSError:
+            pass
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    # index files from before the archive store: add the columns in place
+    have = {r[1] for r in conn.execute("PRAGMA table_info(archive)")}
+    for col in ("doc_sha256", "pack"):
+        if col not in have:
+            conn.execute(f"ALTER TABLE archive ADD COLUMN {col} TEXT NOT NULL DEFAULT ''")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive_pack ON archive(pack)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive_doc ON archive(doc_sha256)")
+    conn.commit()
+
+
+def fts_enabled(conn: sqlite3.Connection) -> Optional[bool]:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'fts'").fetchone()
+    return None if row is None else row[0] == "1"
+
+
+def _parse_ts(s: str) -> Optional[int]:
+    s = (s or "").strip()
+    if not s:
+        return None
+    try:
+        return int(datetime.fromisoformat(s.replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return None
+
+
+def _s(v: Any) -> str:
+    return "" if v is None else str(v)
+
+
+def extract_pages(j: Dict[str, Any]) -> str:
+    # same order as extract_pages() in kienzlefax.php
+    r = j.get("result") if isinstance(j.get("result"), dict) else {}
+    if "faxpages_sent" in r or "faxpages_total" in r:
+        sent, total = _s(r.get("faxpages_sent")).strip(), _s(r.get("faxpages_total")).strip()
+        if sent and total:
+            return f"{sent}/{total}"
+        if sent or total:
+            return sent or total
+    if _s(r.get("faxpages_raw")).strip():
+        return _s(r["faxpages_raw"]).strip()
+    if _s(r.get("pages")):
+        return _s(r["pages"])
+    if "npages" in r and "totpages" in r and _s(r["npages"]) and _s(r["totpages"]):
+        return f"{r['npages']}/{r['totpages']}"
+    return _s(j.get("pages"))
+
+
+def is_aborted(j: Dict[str, Any]) -> bool:
+    # same rules as is_aborted_job() in kienzlefax.php
+    c = j.get("cancel") if isinstance(j.get("cancel"), dict) else {}
+    r = j.get("result") if isinstance(j.get("result"), dict) else {}
+    if c.get("requested") and c.get("handled_at"):
+        return True
+    if "aborted" in str(r.get("reason") or "").lower() or "aborted" in str(r.get("status_text") or "").lower():
+        return True
+    try:
+        return bool(c.get("requested")) and int(r.get("statuscode")) == 345
+    except (TypeError, ValueError):
+        return False
+
+
+def record_from_json(area: str, json_path: Path) -> Dict[str, Any]:
+    j = json.loads(json_path.read_text(encoding="utf-8"))
+    st = json_path.stat()
+    stem = json_path.name[:-len(".json")]
+    pdf = next((stem + s for s in PDF_SUFFIXES if (json_path.parent / (stem + s)).is_file()), "")
+    return record_from_data(area, json_path.name, j, pdf, st.st_mtime_ns, int(st.st_mtime))
+
+
+def record_from_data(area: str, json_file: str, j: Any, pdf: str, mtime_ns: int, mtime: int,
+                     pack: str = "") -> Dict[str, Any]:
+    if not isinstance(j, dict):
+        raise ValueError(f"{json_file}: not a job JSON")
+    r = j.get("result") if isinstance(j.get("result"), dict) else {}
+    rec = j.get("recipient") if isinstance(j.get("recipient"), dict) else {}
+    src = j.get("source") if isinstance(j.get("source"), dict) else {}
+    ref = j.get("archive_store") if isinstance(j.get("archive_store"), dict) else {}
+
+    end = str(j.get("end_time") or j.get("completed_at") or j.get("updated_at") or j.get("created_at") or "")
+    error = str(r.get("error_message") or r.get("stderr") or r.get("reason") or r.get("status_text")
+                or j.get("error") or j.get("error_message") or "")
+    number = str(rec.get("number") or "")
+    return {
+        "area": area,
+        "json_file": json_file,
+        "pdf_file": pdf,
+        "job_id": str(j.get("job_id") or ""),
+        "status": str(j.get("status") or ""),
+        "reason": str(r.get("reason") or ""),
+        "error": error,
+        "aborted": 1 if is_aborted(j) else 0,
+        "recipient_name": str(rec.get("name") or ""),
+        "number": number,
+        "number_digits": re.sub(r"\D", "", number),
+        "source_file": os.path.basename(str(src.get("filename_original") or "")),
+        "pages": extract_pages(j),
+        "created_at": str(j.get("created_at") or ""),
+        "end_time": end,
+        "end_ts": _parse_ts(end) or mtime,
+        "json_mtime": mtime_ns,
+        "doc_sha256": str(ref.get("doc") or ""),
+        "pack": pack,
+    }
+
+
+def area_of(json_path: Path, base: Optional[Path] = None) -> Optional[str]:
+    base = Path(base or DEFAULT_BASE)
+    parent = json_path.resolve().parent
+    for area, rel in AREAS.items():
+        if parent == (base / rel).resolve():
+            return area
+    return None
+
+
+def _upsert(conn: sqlite3.Connection, row: Dict[str, Any]) -> None:
+    cols = list(row)
+    conn.execute(
+        f"INSERT INTO archive({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) "
+        f"ON CONFLICT(area, json_file) DO UPDATE SET "
+        + ", ".join(f"{c} = excluded.{c}" for c in cols if c not in ("area", "json_file")),
+        [row[c] for c in cols])
+
+
+def index_file(json_path: Path, base: Optional[Path] = None, conn: Optional[sqlite3.Connection] = None) -> bool:
+    """Adds/updates one archive JSON; False if it lies outside both archive dirs."""
+    json_path = Path(json_path)
+    area = area_of(json_path, base)
+    if area is None:
+        return False
+    own = conn is None
+    conn = conn or connect(base)
+    try:
+        _upsert(conn, record_from_json(area, json_path))
+        conn.commit()
+    finally:
+        if own:
+            conn.close()
+    return True
+
+
+def remove_file(json_path: Path, base: Optional[Path] = None, conn: Optional[sqlite3.Connection] = None) -> int:
+    json_path = Path(json_path)
+    area = area_of(json_path, base)
+    if area is None:
+        return 0
+    own = conn is None
+    conn = conn or connect(base)
+    try:
+        n = conn.execute("DELETE FROM archive WHERE area = ? AND json_file = ?", (area, json_path.name)).rowcount
+        conn.commit()
+    finally:
+        if own:
+            conn.close()
+    return n
+
+
+def sync(base: Optional[Path] = None, conn: Optional[sqlite3.Connection] = None) -> Tuple[int, int]:
+    """
+    Brings the index in line with the directories: new or changed JSONs (by mtime) are
+    (re)read, rows of vanished files dropped. Returns (updated, removed).
+    """
+    base = Path(base or DEFAULT_BASE)
+    own = conn is None
+    conn = conn or connect(base)
+    updated = removed = 0
+    try:
+        for area, rel in AREAS.items():
+            known = {r["json_file"]: r["json_mtime"] for r in
+                     conn.execute("SELECT json_file, json_mtime FROM archive WHERE area = ? AND pack = ''", (area,))}
+            seen = set()
+            d = base / rel
+            try:
+                entries = list(os.scandir(d))
+            except FileNotFoundError:
+                entries = []
+            for e in entries:
+                if not e.name.lower().endswith(".json") or not e.is_file():
+                    continue
+                seen.add(e.name)
+                if known.get(e.name) == e.stat().st_mtime_ns:
+                    continue
+                try:
+                    _upsert(conn, record_from_json(area, Path(e.path)))
+                    updated += 1
+                except (OSError, ValueError) as ex:
+                    print(f"skip {e.path}: {ex}", file=sys.stderr)
+                if updated % 500 == 0:
+                    conn.commit()
+            for name in set(known) - seen:
+                conn.execute("DELETE FROM archive WHERE area = ? AND json_file = ?", (area, name))
+                removed += 1
+        u, r = _sync_packs(base, conn)
+        updated += u
+        removed += r
+        conn.commit()
+    finally:
+        if own:
+            conn.close()
+    return updated, removed
+
+
+def _sync_packs(base: Path, conn: sqlite3.Connection) -> Tuple[int, int]:
+    # a pack is re-read only when its mtime changed (meta 'pack:<name>')
+    pdir = store_dir(base) / "packs"
+    packs = {p.name: p for p in pdir.glob("*.zip")} if pdir.is_dir() else {}
+    updated = removed = 0
+    for (name,) in conn.execute("SELECT DISTINCT pack FROM archive WHERE pack != ''").fetchall():
+        if name not in packs:
+            removed += conn.execute("DELETE FROM archive WHERE pack = ?", (name,)).rowcount
+            conn.execute("DELETE FROM meta WHERE key = ?", ("pack:" + name,))
+    for name, p in sorted(packs.items()):
+        stamp = str(p.stat().st_mtime_ns)
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", ("pack:" + name,)).fetchone()
+        if row is not None and row[0] == stamp:
+            continue
+        members = set()
+        with zipfile.ZipFile(p) as z:
+            names = set(z.namelist())
+            for m in sorted(names):
+                if not m.lower().endswith(".json"):
+                    continue
+                stem = m[:-len(".json")]
+                pdf = next((stem + s for s in PDF_SUFFIXES if stem + s in names), "")
+                mtime = int(datetime(*z.getinfo(m).date_time).timestamp())
+                try:
+                    _upsert(conn, record_from_data("ok", m, json.loads(z.read(m)), pdf, 0, mtime, pack=name))
+                except ValueError as ex:
+                    print(f"skip {name}:{m}: {ex}", file=sys.stderr)
+                    continue
+                members.add(m)
+                updated += 1
+        for (m,) in conn.execute("SELECT json_file FROM archive WHERE pack = ?", (name,)).fetchall():
+            if m not in members:
+                conn.execute("DELETE FROM archive WHERE area = 'ok' AND json_file = ?", (m,))
+                removed += 1
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", ("pack:" + name, stamp))
+    return updated, removed
+
+
+def fts_query(text: str) -> str:
+    # user input -> prefix match of every word, all words required
+    words = re.findall(r"\w+", text or "")
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def query(conn: sqlite3.Connection, *, area: Optional[str] = None, text: str = "", number: str = "",
+          limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+    where, args = [], []
+    if area:
+        where.append("a.area = ?")
+        args.append(area)
+    if number:
+        where.append("a.number_digits LIKE ?")
+        args.append("%" + re.sub(r"\D", "", number) + "%")
+    sql = "SELECT a.* FROM archive a"
+    q = fts_query(text)
+    if q and fts_enabled(conn):
+        sql += " JOIN archive_fts f ON f.rowid = a.id"
+        where.append("archive_fts MATCH ?")
+        args.append(q)
+    elif q:
+        for w in re.findall(r"\w+", text):
+            where.append("(" + " OR ".join(f"a.{c} LIKE ?" for c in FTS_COLUMNS) + ")")
+            args += ["%" + w + "%"] * len(FTS_COLUMNS)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY a.end_ts DESC, a.id DESC LIMIT ? OFFSET ?"
+    args += [int(limit), int(offset)]
+    return [dict(r) for r in conn.execute(sql, args)]
+
+
+def count(conn: sqlite3.Connection, area: Optional[str] = None) -> int:
+    if area:
+        return int(conn.execute("SELECT COUNT(*) FROM archive WHERE area = ?", (area,)).fetchone()[0])
+    return int(conn.execute("SELECT COUNT(*) FROM archive").fetchone()[0])
+
+
+def find_failure_for_pdf(conn: sqlite3.Connection, pdf_name: str) -> Optional[str]:
+    # same matching as find_failure_report_for_resend_pdf() in kienzlefax.php, oldest first
+    stem = pdf_name[:-4] if pdf_name.lower().endswith(".pdf") else pdf_name
+    like = re.sub(r"([\\%_])", r"\\\1", stem + "__JOB-") + "%.json"
+    row = conn.execute(
+        "SELECT json_file FROM archive WHERE area = 'failed' AND "
+        "(json_file = ? OR json_file LIKE ? ESCAPE '\\' OR source_file = ?) "
+        "ORDER BY json_mtime, json_file LIMIT 1", (stem + ".json", like, pdf_name)).fetchone()
+    return row[0] if row else None
+
+
+# ----------------------------
+# Archive store: documents once per content, monthly packs, rebuild on demand
+# ----------------------------
+def store_dir(base: Optional[Path] = None) -> Path:
+    env = os.environ.get("KFX_ARCHIVE_STORE")
+    if env:
+        return Path(env)
+    return Path(base or DEFAULT_BASE) / "archive-store"
+
+
+def object_path(sha: str, base: Optional[Path] = None) -> Path:
+    if not re.fullmatch(r"[0-9a-f]{64}", sha or ""):
+        raise ValueError(f"bad object id: {sha!r}")
+    return store_dir(base) / "objects" / sha[:2] / f"{sha}.pdf"
+
+
+def _mkdirs(p: Path) -> None:
+    # setgid/group-writable like the other spool dirs; the web UI reads for rebuilds
+    for d in reversed([p, *p.parents]):
+        if not d.exists():
+            d.mkdir()
+            try:
+                os.chmod(str(d), 0o2775)
+            except OSError:
+                pass
+
+
+def _qpdf(*args: str) -> str:
+    p = subprocess.run([QPDF_BIN, *args], capture_output=True, text=True, timeout=300)
+    if p.returncode not in (0, 3):  # 3 = succeeded with warnings
+        raise RuntimeError(f"qpdf {args[0]} failed rc={p.returncode} err={p.stderr.strip()}")
+    return p.stdout
+
+
+def page_count(pdf: Path) -> int:
+    return int(_qpdf("--show-npages", str(pdf)).strip())
+
+
+def _sha256_file(p: Path) -> str:
+    h = hashlib.sha256()
+    with p.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def store_document(doc: Path, base: Optional[Path] = None) -> Dict[str, Any]:
+    """
+    Puts doc into the object store (once per content) and returns the reference for
+    job["archive_store"]: {"doc": sha256, "doc_pages": n, "report_pages": 1}.
+    """
+    doc = Path(doc)
+    sha = _sha256_file(doc)
+    dst = object_path(sha, base)
+    if dst.exists():
+        os.utime(str(dst))  # re-referenced: restart the gc grace period
+    else:
+        _mkdirs(dst.parent)
+        tmp = dst.with_name(f".{dst.name}.tmp.{os.getpid()}")
+        try:
+            shutil.copyfile(str(doc), str(tmp))
+            with tmp.open("rb") as f:
+                os.fsync(f.fileno())
+            os.chmod(str(tmp), 0o644)
+            os.replace(tmp, dst)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+    return {"doc": sha, "doc_pages": page_count(doc), "report_pages": REPORT_PAGES}
+
+
+def _split_classic(pdf: Path, work: Path) -> Tuple[Path, Optional[Path], int]:
+    # report page(s) + document of a classic merged PDF; deterministic ids so equal
+    # documents extracted from different reports hash the same
+    n = page_count(pdf)
+    report = work / "report.pdf"
+    _qpdf("--deterministic-id", "--empty", "--pages", str(pdf), f"1-{min(n, REPORT_PAGES)}", "--", str(report))
+    if n <= REPORT_PAGES:
+        return report, None, n
+    body = work / "doc.pdf"
+    _qpdf("--deterministic-id", "--empty", "--pages", str(pdf), f"{REPORT_PAGES + 1}-z", "--", str(body))
+    return report, body, n
+
+
+def _month(ts: int) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y-%m")
+
+
+def _write_pack(pack: Path, members: List[Tuple[str, bytes]]) -> None:
+    # pack rewritten as a whole (tmp + rename): readers never see a half-appended zip
+    _mkdirs(pack.parent)
+    tmp = pack.with_name(f".{pack.name}.tmp.{os.getpid()}")
+    try:
+        if pack.exists():
+            shutil.copyfile(str(pack), str(tmp))
+        with zipfile.ZipFile(str(tmp), "a" if pack.exists() else "w") as z:
+            for name, data in members:
+                kind = zipfile.ZIP_STORED if name.lower().endswith(".pdf") else zipfile.ZIP_DEFLATED
+                z.writestr(name, data, compress_type=kind)
+        with tmp.open("rb") as f:
+            os.fsync(f.fileno())
+        os.chmod(str(tmp), 0o644)
+        os.replace(tmp, pack)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def compact(base: Optional[Path] = None, older_than_days: int = 90, conn: Optional[sqlite3.Connection] = None,
+            log: Callable[[str], None] = print) -> Dict[str, int]:
+    """
+    Moves sendeberichte older than N days into packs/JJJJ-MM.zip: the JSON (with
+    archive_store reference) and the report page; the document goes to the object
+    store, so a letter to eight recipients is kept once. Classic merged PDFs are
+    split (report page | document) on the way.
+    """
+    base = Path(base or DEFAULT_BASE)
+    stats = {"packed": 0, "skipped": 0}
+    sdir = store_dir(base)
+    _mkdirs(sdir)
+    lock_fd = os.open(str(sdir / ".compact.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            log("compact: already running")
+            return stats
+        own = conn is None
+        conn = conn or connect(base)
+        try:
+            _compact(base, older_than_days, conn, log, stats)
+        finally:
+            if own:
+                conn.close()
+    finally:
+        os.close(lock_fd)
+    return stats
+
+
+def _compact(base: Path, older_than_days: int, conn: sqlite3.Connection,
+             log: Callable[[str], None], stats: Dict[str, int]) -> None:
+    sync(base, conn)
+    cutoff = int(time.time()) - int(older_than_days) * 86400
+    adir = base / AREAS["ok"]
+    by_month: Dict[str, List[sqlite3.Row]] = defaultdict(list)
+    for r in conn.execute("SELECT json_file, pdf_file, end_ts FROM archive "
+                          "WHERE area = 'ok' AND pack = '' AND end_ts < ? ORDER BY end_ts", (cutoff,)):
+        by_month[_month(r["end_ts"])].append(r)
+
+    for month, rows in sorted(by_month.items()):
+        pack = store_dir(base) / "packs" / f"{month}.zip"
+        have = set()
+        if pack.exists():
+            with zipfile.ZipFile(str(pack)) as z:
+                have = set(z.namelist())
+        members: List[Tuple[str, bytes]] = []
+        done: List[Tuple[sqlite3.Row, str]] = []
+        with tempfile.TemporaryDirectory(dir=str(store_dir(base))) as tmpd:
+            for r in rows:
+                jp = adir / r["json_file"]
+                pp = adir / r["pdf_file"] if r["pdf_file"] else None
+                if r["json_file"] in have:  # packed before, originals not yet removed
+                    done.append((r, ""))
+                    continue
+                try:
+                    j = json.loads(jp.read_text(encoding="utf-8"))
+                    ref = j.get("archive_store") if isinstance(j.get("archive_store"), dict) else None
+                    report = None
+                    if ref and ref.get("doc"):
+                        # report-only PDF from the worker, document already in the store
+                        if not object_path(str(ref["doc"]), base).is_file():
+                            raise RuntimeError(f"object {ref['doc']} missing")
+                        if pp and pp.is_file():
+                            report = pp.read_bytes()
+                    elif pp and pp.is_file():
+                        work = Path(tmpd) / r["json_file"]
+                        work.mkdir()
+                        rep, body, n = _split_classic(pp, work)
+                        ref = {"report_pages": min(n, REPORT_PAGES)}
+                        if body is not None:
+                            ref.update(store_document(body, base))
+                            if ref["doc_pages"] + REPORT_PAGES != n:
+                                raise RuntimeError(f"split gave {ref['doc_pages']}+{REPORT_PAGES} of {n} pages")
+                        j["archive_store"] = ref
+                        report = rep.read_bytes()
+                    data = (json.dumps(j, ensure_ascii=False, indent=2) + "\n").encode("utf-8")
+                except Exception as ex:
+                    log(f"compact: skip {r['json_file']}: {ex}")
+                    stats["skipped"] += 1
+                    continue
+                members.append((r["json_file"], data))
+                if report is not None:
+                    members.append((r["pdf_file"], report))
+                done.append((r, str((ref or {}).get("doc") or "")))
+        if members:
+            _write_pack(pack, members)
+        # pack is durable: drop the originals, then point the index at the pack
+        for r, doc in done:
+            for name in (r["json_file"], r["pdf_file"]):
+                if name:
+                    try:
+                        (adir / name).unlink()
+                    except FileNotFoundError:
+                        pass
+            conn.execute("UPDATE archive SET pack = ?, doc_sha256 = CASE WHEN ? != '' THEN ? ELSE doc_sha256 END "
+                         "WHERE area = 'ok' AND json_file = ?", (pack.name, doc, doc, r["json_file"]))
+            stats["packed"] += 1
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+                     ("pack:" + pack.name, str(pack.stat().st_mtime_ns) if pack.exists() else ""))
+        conn.commit()
+        if done:
+            log(f"compact: {pack.name} +{len(done)} reports")
+
+
+def load_entry(json_file: str, base: Optional[Path] = None,
+               conn: Optional[sqlite3.Connection] = None) -> Tuple[Dict[str, Any], Optional[bytes]]:
+    """(job JSON, PDF bytes as archived) of a report in sendeberichte/, sendefehler/berichte/ or a pack."""
+    base = Path(base or DEFAULT_BASE)
+    if os.path.basename(json_file) != json_file or not json_file.lower().endswith(".json"):
+        raise ValueError(f"bad name: {json_file!r}")
+    own = conn is None
+    conn = conn or connect(base)
+    try:
+        row = conn.execute("SELECT pdf_file, pack FROM archive WHERE json_file = ? AND pack != '' LIMIT 1",
+                           (json_file,)).fetchone()
+    finally:
+        if own:
+            conn.close()
+    if row is not None:
+        with zipfile.ZipFile(str(store_dir(base) / "packs" / row["pack"])) as z:
+            j = json.loads(z.read(json_file))
+            pdf = z.read(row["pdf_file"]) if row["pdf_file"] else None
+        return j, pdf
+    stem = json_file[:-len(".json")]
+    for rel in AREAS.values():
+        jp = base / rel / json_file
+        if jp.is_file():
+            pdf = next((jp.with_name(stem + s) for s in PDF_SUFFIXES if jp.with_name(stem + s).is_file()), None)
+            return json.loads(jp.read_text(encoding="utf-8")), (pdf.read_bytes() if pdf else None)
+    raise FileNotFoundError(json_file)
+
+
+def rebuild_pdf(json_file: str, out: Path, base: Optional[Path] = None,
+                conn: Optional[sqlite3.Connection] = None) -> None:
+    """Writes the classic report + document PDF of an archived job to out."""
+    j, pdf = load_entry(json_file, base, conn)
+    ref = j.get("archive_store") if isinstance(j.get("archive_store"), dict) else {}
+    if not ref.get("doc"):
+        if pdf is None:
+            raise FileNotFoundError(f"{json_file}: no PDF archived")
+        Path(out).write_bytes(pdf)
+        return
+    obj = object_path(str(ref["doc"]), base)
+    if not obj.is_file():
+        raise FileNotFoundError(f"{json_file}: object {ref['doc']} missing")
+    if pdf is None:
+        shutil.copyfile(str(obj), str(out))
+        return
+    with tempfile.TemporaryDirectory() as tmpd:
+        report = Path(tmpd) / "report.pdf"
+        report.write_bytes(pdf)
+        _qpdf("--empty", "--pages", str(report), str(obj), "--", str(out))
+
+
+def gc(base: Optional[Path] = None, conn: Optional[sqlite3.Connection] = None) -> Tuple[int, int]:
+    """Removes objects no indexed report refers to; returns (files, bytes)."""
+    base = Path(base or DEFAULT_BASE)
+    own = conn is None
+    conn = conn or connect(base)
+    try:
+        sync(base, conn)
+        used = {r[0] for r in conn.execute("SELECT DISTINCT doc_sha256 FROM archive WHERE doc_sha256 != ''")}
+    finally:
+        if own:
+            conn.close()
+    files = size = 0
+    cutoff = time.time() - GC_GRACE_SEC
+    odir = store_dir(base) / "objects"
+    for p in (odir.glob("*/*.pdf") if odir.is_dir() else ()):
+        st = p.stat()
+        if p.stem in used or st.st_mtime > cutoff:
+            continue
+        p.unlink()
+        files += 1
+        size += st.st_size
+    return files, size
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="kienzlefax-archive", description="Index der Sendeberichte/Sendefehler")
+    ap.add_argument("--base", type=Path, default=DEFAULT_BASE)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("backfill", help="Verzeichnisse (inkrementell) einlesen")
+    for name in ("add", "remove"):
+        p = sub.add_parser(name)
+        p.add_argument("files", nargs="+", type=Path)
+    p = sub.add_parser("query")
+    p.add_argument("--area", choices=sorted(AREAS))
+    p.add_argument("--text", default="")
+    p.add_argument("--number", default="")
+    p.add_argument("--limit", type=int, default=50)
+    p.add_argument("--offset", type=int, default=0)
+    p = sub.add_parser("count")
+    p.add_argument("--area", choices=sorted(AREAS))
+    p = sub.add_parser("find-failure")
+    p.add_argument("pdf")
+    p = sub.add_parser("compact", help="alte Sendeberichte in Monatspakete, Dokumente einmal je Inhalt")
+    p.add_argument("--older-than-days", type=int,
+                   default=int(os.environ.get("KFX_ARCHIVE_COMPACT_DAYS") or 90))
+    p = sub.add_parser("rebuild", help="Bericht + Dokument als ein PDF wiederherstellen")
+    p.add_argument("json")
+    p.add_argument("-o", "--out", default="-")
+    sub.add_parser("gc", help="nicht mehr referenzierte Dokumente entfernen")
+    a = ap.parse_args(argv)
+
+    conn = connect(a.base)
+    try:
+        if a.cmd == "backfill":
+            updated, removed = sync(a.base, conn)
+            print(f"updated={updated} removed={removed} total={count(conn)}")
+        elif a.cmd == "add":
+            for f in a.files:
+                if not index_file(f, a.base, conn):
+                    print(f"not in an archive dir: {f}", file=sys.stderr)
+        elif a.cmd == "remove":
+            for f in a.files:
+                remove_file(f, a.base, conn)
+        elif a.cmd == "query":
+            rows = query(conn, area=a.area, text=a.text, number=a.number, limit=a.limit, offset=a.offset)
+            for r in rows:
+                print(json.dumps(r, ensure_ascii=False))
+        elif a.cmd == "count":
+            print(count(conn, a.area))
+        elif a.cmd == "find-failure":
+            hit = find_failure_for_pdf(conn, a.pdf)
+            if hit is None:
+                return 1
+            print(hit)
+        elif a.cmd == "compact":
+            if a.older_than_days < 1:
+                print("compact: --older-than-days must be >= 1", file=sys.stderr)
+                return 2
+            s = compact(a.base, a.older_than_days, conn, log=lambda m: print(m, file=sys.stderr))
+            print(" ".join(f"{k}={v}" for k, v in s.items()))
+        elif a.cmd == "rebuild":
+            try:
+                if a.out == "-":
+                    with tempfile.TemporaryDirectory() as tmpd:
+                        out = Path(tmpd) / "out.pdf"
+                        rebuild_pdf(a.json, out, a.base, conn)
+                        with out.open("rb") as f:
+                            shutil.copyfileobj(f, sys.stdout.buffer)
+                else:
+                    rebuild_pdf(a.json, Path(a.out), a.base, conn)
+            except (OSError, ValueError, RuntimeError, KeyError) as ex:
+                print(f"rebuild: {ex}", file=sys.stderr)
+                return 1
+        elif a.cmd == "gc":
+            files, size = gc(a.base, conn)
+            print(f"removed={files} bytes={size}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+PY
+
+sudo tee /usr/local/bin/kienzlefax-archive >/dev/null <<'EOF'
+#!/usr/bin/env bash
+# Index + Ablage der Sendeberichte/Sendefehler:
+#   backfill | query | count | find-failure | add | remove | compact | rebuild | gc
+exec python3 /usr/local/lib/kienzlefax/kfx_archive.py "$@"
+EOF
+sudo chmod +x /usr/local/bin/kienzlefax-archive /usr/local/lib/kienzlefax/kfx_archive.py
+
+# Bestand einlesen (inkrementell, bei Updates schnell)
+if [[ -d /srv/kienzlefax ]]; then
+  sudo /usr/local/bin/kienzlefax-archive backfill || echo "WARN: Archiv-Index-Backfill fehlgeschlagen" >&2
+fi
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# kienzlefax-asterisk-worker-check.py
+#
+# Prüfungen für den Asterisk-Worker aus installer-modular/worker.sh, ohne Asterisk:
+# der Python-Teil wird aus dem Heredoc geladen, BASE zeigt auf ein Temp-Verzeichnis.
+#
+# AMI-Checks laufen gegen einen lokalen Fake-AMI (Login/Logoff, Ping, CoreShowChannels,
+# Hangup, Originate), der vor jeder Antwort fremde Events und Antworten mit anderer
+# ActionID einstreut und Sessions serverseitig trennen kann.
+#
+# Checks:
+#   bundle-tiff   Live-Status: bundle.tif (gebündelter Anruf) gehört zum Leader-Job
+#   ami-actionid  Antworten werden per ActionID zugeordnet, Events dazwischen übersprungen
+#   ami-relogin   getrennte Session wird neu geöffnet und neu angemeldet
+#   ami-ping      Keepalive per Ping nach AMI_PING_SEC, tote Session wird verworfen
+#   metrics       Subprozess-Zeiten, RETRY/DEFERRED-Rueckstellung, Pool-Histogramme, /metrics
+#
+# Beispiel:
+#   ./kienzlefax-asterisk-worker-check.py
+#   ./kienzlefax-asterisk-worker-check.py --checks bundle-tiff -v
+#
+# Exit-Code 0 = alle gewählten Checks ok.
+#
+
+import argparse
+import importlib.util
+import os
+import re
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import urllib.request
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+WORKER_SH = Path(__file__).with_name("installer-modular") / "worker.sh"
+
+
+class FakeAmi:
+    """
+    Minimal Asterisk Manager Interface on 127.0.0.1 (random port), one thread per session.
+    Every reply is preceded by noise: an unrelated event and a stale reply for another ActionID.
+    """
+
+    CHANNELS = (("PJSIP/trunk-00000001", "JOB-1"), ("Local/0301234@kfx-out-00000001;1", "JOB-1"),
+                ("PJSIP/trunk-00000002", "JOB-2"))
+
+    def __init__(self, user: str = "kfx", secret: str = "check") -> None:
+        self.user = user
+        self.secret = secret
+        self.actions: List[str] = []
+        self.logins = 0
+        self._sessions: List[socket.socket] = []
+        self._mu = threading.Lock()
+
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                fake._session(self.request, self.rfile)
+
+        self._srv = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._srv.daemon_threads = True
+        self.port = self._srv.server_address[1]
+        threading.Thread(target=self._srv.serve_forever, name="fake-ami", daemon=True).start()
+
+    def close(self) -> None:
+        self._srv.shutdown()
+        self._srv.server_close()
+        self.drop_sessions()
+
+    def drop_sessions(self) -> None:
+        """
+        Server side hangs up every open session (Asterisk restart, manager reload).
+        """
+        with self._mu:
+            sessions, self._sessions = self._sessions, []
+        for s in sessions:
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _frame(*fields: Tuple[str, str]) -> bytes:
+        return ("".join(f"{k}: {v}\r\n" for k, v in fields) + "\r\n").encode("utf-8")
+
+    def _session(self, sock: socket.socket, rfile) -> None:
+        with self._mu:
+            self._sessions.append(sock)
+        sock.sendall(b"Asterisk Call Manager/7.0.3\r\n")
+        logged_in = False
+        while True:
+            fields: Dict[str, str] = {}
+            while True:
+                try:
+                    raw = rfile.readline()
+                except OSError:
+                    return
+                if not raw:
+                    return
+                ln = raw.decode("utf-8", errors="replace").strip()
+                if not ln:
+                    break
+                k, _, v = ln.partition(":")
+                fields[k.strip()] = v.strip()
+            if not fields:
+                continue
+            action = fields.get("Action", "")
+            aid = fields.get("ActionID", "")
+            self.actions.append(action)
+            f = self._frame
+            out = f(("Event", "PeerStatus"), ("Privilege", "system,all"), ("Peer", "PJSIP/trunk"))
+            out += f(("Response", "Success"), ("ActionID", aid + "-stale"), ("Message", "not yours"))
+
+            if action == "Login":
+                if fields.get("Username") == self.user and fields.get("Secret") == self.secret:
+                    logged_in = True
+                    self.logins += 1
+                    out += f(("Response", "Success"), ("ActionID", aid), ("Message", "Authentication accepted"))
+                else:
+                    out += f(("Response", "Error"), ("ActionID", aid), ("Message", "Authentication failed"))
+            elif not logged_in:
+                out += f(("Response", "Error"), ("ActionID", aid), ("Message", "Permission denied"))
+            elif action == "Ping":
+                out += f(("Response", "Success"), ("ActionID", aid), ("Ping", "Pong"))
+            elif action == "CoreShowChannels":
+                out += f(("Response", "Success"), ("ActionID", aid), ("EventList", "start"),
+                         ("Message", "Channels will follow"))
+                for ch, acc in self.CHANNELS:
+                    out += f(("Event", "CoreShowChannel"), ("ActionID", aid), ("Channel", ch), ("AccountCode", acc))
+                    out += f(("Event", "Newexten"), ("Channel", ch), ("Application", "SendFAX"))
+                out += f(("Event", "CoreShowChannelsComplete"), ("ActionID", aid + "-stale"), ("EventList", "Complete"))
+                out += f(("Event", "CoreShowChannelsComplete"), ("ActionID", aid), ("EventList", "Complete"),
+                         ("ListItems", str(len(self.CHANNELS))))
+            elif action == "Hangup":
+                known = any(ch == fields.get("Channel") for ch, _ in self.CHANNELS)
+                out += f(("Response", "Success" if known else "Error"), ("ActionID", aid),
+                         ("Message", "Channel Hungup" if known else "No such channel"))
+            elif action == "Originate":
+                out += f(("Response", "Success"), ("ActionID", aid), ("Message", "Originate successfully queued"))
+            elif action == "Logoff":
+                sock.sendall(out + f(("Response", "Goodbye"), ("ActionID", aid)))
+                return
+            else:
+                out += f(("Response", "Error"), ("ActionID", aid), ("Message", "Invalid/unknown command"))
+            # small writes: frames arrive split across reads
+            for i in range(0, len(out), 11):
+                sock.sendall(out[i:i + 11])
+
+
+def extract_worker(worker_sh: Path, out: Path) -> Path:
+    text = worker_sh.read_text(encoding="utf-8")
+    m = re.search(r"sudo tee /usr/local/bin/kienzlefax-worker\.py >/dev/null <<'PY'\n(.*?)\nPY\n", text, re.S)
+    if not m:
+        raise SystemExit(f"worker heredoc not found in {worker_sh}")
+    out.write_text(m.group(1) + "\n", encoding="utf-8")
+    return out
+
+
+def load_worker(work: Path, worker_sh: Path):
+    base = work / "base"
+    base.mkdir()
+    # module-level config is read from the environment at import
+    os.environ.update(KFX_BASE=str(base), KFX_AMI_PASS="check", KFX_AMI_HOST="127.0.0.1", KFX_AMI_PORT="1",
+                      KFX_PDF_HEADER_SCRIPT=str(work / "no-header-script"))
+    path = extract_worker(worker_sh, work / "kienzlefax_asterisk_worker.py")
+    spec = importlib.util.spec_from_file_location("kienzlefax_asterisk_worker", path)
+    w = importlib.util.module_from_spec(spec)
+    sys.modules["kienzlefax_asterisk_worker"] = w
+    spec.loader.exec_module(w)
+    w.ensure_dirs()
+    return w
+
+
+def check_bundle_tiff(w, work: Path) -> None:
+    lead = w.PROC / "JOB-CHECK-LEADER"
+    member = w.PROC / "JOB-CHECK-MEMBER"
+    for d in (lead, member):
+        d.mkdir()
+        w.write_json(d / "job.json", {"job_id": d.name, "status": "CALLING"})
+    w.write_json(lead / "job.json", {"job_id": lead.name, "status": "CALLING",
+                                     "bundle": {"members": [member.name], "tiff": str(lead / "bundle.tif")}})
+
+    assert w._find_job_for_tiff(str(lead / "doc.tif")) == lead / "job.json", "doc.tif -> own job"
+    assert w._find_job_for_tiff(str(lead / "bundle.tif")) == lead / "job.json", "bundle.tif -> leader job"
+    assert w._find_job_for_tiff(str(member / "doc.tif")) == member / "job.json", "member doc.tif -> member job"
+    assert w._find_job_for_tiff(str(lead / "other.tif")) is None, "unknown file name"
+    assert w._find_job_for_tiff(str(w.QUEUE / lead.name / "bundle.tif")) is None, "outside processing/"
+
+
+def ami_client_for(w, fake: FakeAmi):
+    return w.AmiClient("127.0.0.1", fake.port, fake.user, fake.secret)
+
+
+def ami_check(fn: Callable) -> Callable:
+    def run(w, work: Path) -> None:
+        fake = FakeAmi()
+        try:
+            fn(w, fake)
+        finally:
+            fake.close()
+    return run
+
+
+@ami_check
+def check_ami_actionid(w, fake: FakeAmi) -> None:
+    c = ami_client_for(w, fake)
+    text = c.core_show_channels()
+    chans = re.findall(r"^Channel: (.+?)\r?$", text, re.M)
+    assert chans == [ch for ch, _ in FakeAmi.CHANNELS], chans
+    assert "stale" not in text and "PeerStatus" not in text and "Newexten" not in text
+    assert text.rstrip().endswith(f"ListItems: {len(FakeAmi.CHANNELS)}")
+
+    assert c.hangup(FakeAmi.CHANNELS[0][0]) is True
+    assert c.hangup("PJSIP/unknown-0001") is False
+    r = c.originate([("Channel", "Local/0301234@kfx-out/n")], action_id="kfx-JOB-9")
+    assert w.ami_field(r, "ActionID") == "kfx-JOB-9" and w.ami_field(r, "Response") == "Success"
+    assert fake.logins == 1
+    c.close()
+    assert fake.actions[-1] == "Logoff"
+
+
+@ami_check
+def check_ami_relogin(w, fake: FakeAmi) -> None:
+    c = ami_client_for(w, fake)
+    c.core_show_channels()
+    fake.drop_sessions()
+    assert c.hangup(FakeAmi.CHANNELS[0][0]) is True
+    assert fake.logins == 2, "dropped session is logged in again"
+
+    fake.drop_sessions()
+    try:
+        c.originate([("Channel", "Local/0301234@kfx-out/n")], action_id="kfx-JOB-9")
+        raise AssertionError("originate on a dead session must not succeed")
+    except w.AmiError as e:
+        assert "outcome unknown" in str(e), e
+    assert fake.actions.count("Originate") == 0, "originate is not retried"
+    c.core_show_channels()
+    assert fake.logins == 3
+
+    bad = w.AmiClient("127.0.0.1", fake.port, fake.user, "wrong")
+    try:
+        bad.hangup(FakeAmi.CHANNELS[0][0])
+        raise AssertionError("login with a wrong secret must fail")
+    except w.AmiError as e:
+        assert "login failed" in str(e), e
+    c.close()
+
+
+@ami_check
+def check_ami_ping(w, fake: FakeAmi) -> None:
+    saved = w.AMI_PING_SEC
+    w.AMI_PING_SEC = 0.2
+    try:
+        c = ami_client_for(w, fake)
+        c.keepalive()
+        assert fake.actions == [], "no session yet, nothing to keep alive"
+        c.core_show_channels()
+        c.keepalive()
+        assert "Ping" not in fake.actions, "no ping while the session is fresh"
+        time.sleep(0.3)
+        c.keepalive()
+        assert fake.actions[-1] == "Ping"
+
+        time.sleep(0.3)
+        fake.drop_sessions()
+        c.keepalive()
+        assert c._sock is None, "failed ping drops the session"
+        c.core_show_channels()
+        assert fake.logins == 2
+
+        # idle session is pinged before the next action
+        time.sleep(0.3)
+        n = len(fake.actions)
+        c.hangup(FakeAmi.CHANNELS[0][0])
+        assert fake.actions[n:] == ["Ping", "Hangup"], fake.actions[n:]
+        c.close()
+    finally:
+        w.AMI_PING_SEC = saved
+
+
+def check_metrics(w, work: Path) -> None:
+    w.METRICS = w.Metrics()
+    w.run_cmd([sys.executable, "-c", "pass"])
+    assert w.METRICS.hists[("kfx_subprocess_seconds", (("binary", Path(sys.executable).name),))][0][-1] == 1
+
+    for i, reason in enumerate(("CONGESTION", "EXTERNAL_CAPACITY_FULL", "BUSY")):
+        jdir = w.PROC / f"JOB-CHECK-RETRY-{i}"
+        jdir.mkdir()
+        w.requeue_retry(jdir, {"job_id": jdir.name, "status": "RETRY", "retry": {"last_reason": reason}})
+        assert (w.QUEUE / jdir.name).is_dir()
+    requeued = {dict(labels)["outcome"]: v for (name, labels), v in w.METRICS.counters.items()
+                if name == "kfx_jobs_requeued_total"}
+    assert requeued == {"RETRY": 2, "DEFERRED": 1}, requeued
+    assert "retry=3" in w.METRICS.summary()
+
+    # prepare pool child -> main process
+    child = w.Metrics()
+    child.observe("kfx_subprocess_seconds", 2.0, binary="gs")
+    w.METRICS.merge_hists(child.take_hists())
+    w.METRICS.merge_hists({("kfx_subprocess_seconds", (("binary", "gs"),)): ([0] * len(w._HIST_BUCKETS) + [1], 4.0)})
+    counts, total = w.METRICS.hists[("kfx_subprocess_seconds", (("binary", "gs"),))]
+    assert (counts[-1], total) == (2, 6.0) and not child.hists
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    w.METRICS_LISTEN = f"127.0.0.1:{port}"
+    w.start_metrics_server()
+    body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode()
+    assert 'kfx_jobs_requeued_total{outcome="RETRY"} 2' in body
+    assert 'kfx_subprocess_seconds_count{binary="gs"} 2' in body
+
+
+CHECKS: Dict[str, Callable] = {
+    "bundle-tiff": check_bundle_tiff,
+    "ami-actionid": check_ami_actionid,
+    "ami-relogin": check_ami_relogin,
+    "ami-ping": check_ami_ping,
+    "metrics": check_metrics,
+}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Checks für den Asterisk-Worker (installer-modular/worker.sh)")
+    ap.add_argument("--checks", default=",".join(CHECKS), help=f"Komma-Liste aus {', '.join(CHECKS)}")
+    ap.add_argument("--worker-sh", type=Path, default=WORKER_SH)
+    ap.add_argument("-v", "--verbose", action="store_true", help="Worker-Log und Tracebacks zeigen")
+    args = ap.parse_args()
+
+    names = [n.strip() for n in args.checks.split(",") if n.strip()]
+    unknown = [n for n in names if n not in CHECKS]
+    if unknown:
+        ap.error(f"unbekannte Checks: {', '.join(unknown)}")
+
+    failed = 0
+    with tempfile.TemporaryDirectory(prefix="kfx-check-") as tmp:
+        work = Path(tmp)
+        w = load_worker(work, args.worker_sh)
+        if not args.verbose:
+            w.log = lambda msg: None
+        for name in names:
+            cdir = work / name
+            cdir.mkdir()
+            try:
+                CHECKS[name](w, cdir)
+                print(f"ok    {name}")
+            except Exception as e:
+                failed += 1
+                print(f"FAIL  {name}: {e or type(e).__name__}")
+                if args.verbose:
+                    traceback.print_exc()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# kienzlefax-worker-bench.py
+#
+# Replay-Benchmark für kienzlefax-worker.py ohne Modem/HylaFAX:
+# sendfax, faxstat, faxrm und doneq werden durch lokale Simulatoren ersetzt
+# (JID-Vergabe, `faxstat -sal`-Tabelle, q<jid>-Dateien nach Wahl-/Sendezeit
+# mit konfigurierbarer Fehlerquote). Synthetische Lasten werden gegen die
+# Schritte der Hauptschleife (step_queue_cancels / step_processing / step_submit)
+# abgespielt.
+#
+# --engine async spielt dieselben Lasten gegen AsyncEngine (asyncio-Kern) ab.
+#
+# --nodes N prüft den Cluster-Betrieb: N Worker-Prozesse (--node-id node0..) teilen sich
+# BASE, jeder mit eigenem HylaFAX-Simulator (eigene doneq, eigener JID-Zähler ab 1, d.h.
+# kollidierende JIDs). Geprüft wird N Jobs -> N sendfax-Aufrufe -> N Berichte (genau ein
+# Finalize je Job) und dass DONEQ_RELAY danach leer ist; sonst Exit-Code 1. Nur steady
+# und many-to-one.
+#
+# Ausgabe je Last: Jobs/min, p50/p99 claim->submit-Latenz, CPU je Job
+# (Worker-Prozess + Kindprozesse, d.h. inkl. Forks der Simulatoren und Finalize-Pool).
+#
+# Lasten:
+#   steady        alle Jobs auf einmal, viele Empfänger
+#   burst-cancel  wie steady, zusätzlich Abbruch-Schübe (Queue + Processing)
+#   many-to-one   90 % der Jobs an eine Nummer
+#
+# Beispiel:
+#   ./kienzlefax-worker-bench.py --jobs 1000 --inflight 8
+#   ./kienzlefax-worker-bench.py --workloads many-to-one --tx-sec 0.2 --fail-rate 0.1
+#   ./kienzlefax-worker-bench.py --nodes 2 --jobs 200
+#
+# Benötigt wie der Worker reportlab + pypdf (oder qpdf) für das Finalisieren.
+#
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+WORKER_PATH = Path(__file__).with_name("kienzlefax-worker.py")
+WORKLOADS = ("steady", "burst-cancel", "many-to-one")
+CLUSTER_WORKLOADS = ("steady", "many-to-one")
+
+SENDFAX_SIM = """#!/bin/sh
+num=""
+while [ $# -gt 0 ]; do
+  case "$1" in
+    -d) num="$2"; shift 2 ;;
+    *) shift ;;
+  esac
+done
+exec 9>"{sim}/jid.lock"
+flock 9
+jid=$(( $(cat "{sim}/jid" 2>/dev/null || echo 0) + 1 ))
+echo "$jid" > "{sim}/jid"
+exec 9>&-
+echo "$num" > "{sim}/jobs/$jid"
+echo "request id is $jid (group id $jid) for host localhost (1 file)"
+"""
+
+FAXSTAT_SIM = """#!/bin/sh
+cat "{sim}/sendq.txt" 2>/dev/null || echo "JID  Pri S  Owner Number       Pages Dials     TTS Status"
+"""
+
+FAXRM_SIM = """#!/bin/sh
+for jid; do :; done
+touch "{sim}/jobs/$jid.killed"
+echo "Job $jid removed."
+"""
+
+
+def minimal_pdf() -> bytes:
+    objs = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out)
+
+
+class FaxSim:
+    """
+    State of the simulated HylaFAX: sendfax drops sim/jobs/<jid> (number),
+    faxrm drops <jid>.killed; tick() advances dialing -> sending -> doneq.
+    """
+
+    def __init__(self, root: Path, *, dial_sec: float, tx_sec: float, fail_rate: float, seed: int) -> None:
+        self.root = root
+        self.jobs = root / "jobs"
+        self.doneq = root / "doneq"
+        self.bin = root / "bin"
+        for p in (self.jobs, self.doneq, self.bin):
+            p.mkdir(parents=True, exist_ok=True)
+        self.dial_sec = dial_sec
+        self.tx_sec = tx_sec
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self._seen: Dict[int, float] = {}
+        for name, text in (("sendfax", SENDFAX_SIM), ("faxstat", FAXSTAT_SIM), ("faxrm", FAXRM_SIM)):
+            p = self.bin / name
+            p.write_text(text.format(sim=root), encoding="utf-8")
+            p.chmod(0o755)
+
+    def _drop_doneq(self, jid: int, statuscode: int, status: str) -> None:
+        tmp = self.doneq / f".q{jid}.tmp"
+        tmp.write_text(
+            f"statuscode:{statuscode}\nstatus:{status}\nnpages:{1 if statuscode == 0 else 0}\n"
+            f"totpages:1\nsignalrate:14400 bit/s\ncsi:SIM\ncommid:{jid:09d}\n",
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.doneq / f"q{jid}")
+
+    def tick(self) -> None:
+        now = time.monotonic()
+        rows = []
+        for p in self.jobs.iterdir():
+            if p.name.endswith(".killed"):
+                continue
+            jid = int(p.name)
+            t0 = self._seen.setdefault(jid, now)
+            if (self.jobs / f"{jid}.killed").exists():
+                self._drop_doneq(jid, 1, "Job aborted by request")
+            elif now - t0 >= self.dial_sec + self.tx_sec:
+                if self.rng.random() < self.fail_rate:
+                    self._drop_doneq(jid, 1, "Busy signal detected")
+                else:
+                    self._drop_doneq(jid, 0, "")
+            else:
+                state = "R" if now - t0 >= self.dial_sec else "S"
+                number = p.read_text(encoding="utf-8").strip()
+                rows.append(f"{jid:<4} 127 {state}  faxworker {number:<12} 0:1 1:12 0:00 -")
+                continue
+            p.unlink()
+            try:
+                (self.jobs / f"{jid}.killed").unlink()
+            except FileNotFoundError:
+                pass
+            self._seen.pop(jid, None)
+        tmp = self.root / ".sendq.tmp"
+        tmp.write_text("JID  Pri S  Owner Number       Pages Dials     TTS Status\n" + "\n".join(rows) + "\n",
+                       encoding="utf-8")
+        os.replace(tmp, self.root / "sendq.txt")
+
+
+def import_worker():
+    spec = importlib.util.spec_from_file_location("kienzlefax_worker", WORKER_PATH)
+    w = importlib.util.module_from_spec(spec)
+    # the finalize pool pickles functions by module name
+    sys.modules["kienzlefax_worker"] = w
+    spec.loader.exec_module(w)
+    return w
+
+
+if __name__ == "__mp_main__":
+    # finalize pool: the forkserver imports this script as __mp_main__; its children unpickle
+    # kienzlefax_worker.* and get the overrides below through the pool initializer
+    import_worker()
+
+
+def load_worker(base: Path, sim: FaxSim, args: argparse.Namespace):
+    w = import_worker()
+
+    w.BASE = base
+    w.QUEUE = base / "queue"
+    w.PROC = base / "processing"
+    w.ARCH_OK = base / "sendeberichte"
+    w.FAIL_IN = base / "sendefehler" / "eingang"
+    w.FAIL_OUT = base / "sendefehler" / "berichte"
+    w.LOCKFILE = base / ".kienzlefax-worker.lock"
+    w.LIVE_STATUS_FILE = base / "live-status.json"
+    w.PROFILE_FILE = base / "recipient-profiles.json"
+    w.HYLAFAX_DONEQ = sim.doneq
+    w.SEND_FAX_BIN = str(sim.bin / "sendfax")
+    w.FAXSTAT_BIN = str(sim.bin / "faxstat")
+    w.FAXRM_BIN = str(sim.bin / "faxrm")
+    w.HYLAFAX_NATIVE_CLIENT = False
+    w.METRICS_LISTEN = None
+    w.MAX_INFLIGHT_PROCESSING = args.inflight
+    if args.cancel_postwait is not None:
+        w.CANCEL_POSTWAIT_SEC = args.cancel_postwait
+    if not args.header:
+        w.PDF_HEADER_SCRIPT = base / "no-header-script"
+    w.POLL_INTERVAL_SEC = args.tick
+    w.ensure_dirs()
+    return w
+
+
+def enqueue(w, workload: str, n: int, rng: random.Random) -> None:
+    doc = minimal_pdf()
+    for i in range(n):
+        if workload == "many-to-one" and rng.random() < 0.9:
+            number = "0301111111"
+        else:
+            number = f"0302{rng.randrange(200):06d}"
+        name = f"JOB-BENCH-{i:06d}"
+        stage = w.BASE / f".{name}"
+        stage.mkdir()
+        (stage / "doc.pdf").write_bytes(doc)
+        w.write_json(stage / "job.json", {
+            "job_id": name,
+            "created_at": w.now_iso(),
+            "status": "queued",
+            "recipient": {"name": "Bench", "number": number},
+            "source": {"src": "bench", "filename_original": f"{name}.pdf"},
+            "options": {"ecm": True, "resolution": "fine"},
+        })
+        stage.rename(w.QUEUE / name)
+
+
+def cancel_burst(w, rng: random.Random, k: int) -> int:
+    live = [p for root in (w.QUEUE, w.PROC) for p in w.list_jobdirs(root)]
+    done = 0
+    for jdir in rng.sample(live, min(k, len(live))):
+        jp = jdir / "job.json"
+        try:
+            job = json.loads(jp.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        job.setdefault("cancel", {})["requested"] = True
+        tmp = jdir / ".job.json.bench"
+        tmp.write_text(json.dumps(job), encoding="utf-8")
+        try:
+            os.replace(tmp, jp)
+            done += 1
+        except FileNotFoundError:
+            pass
+    return done
+
+
+def cpu_seconds() -> float:
+    s = resource.getrusage(resource.RUSAGE_SELF)
+    c = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return s.ru_utime + s.ru_stime + c.ru_utime + c.ru_stime
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    v = sorted(values)
+    return v[min(len(v) - 1, int(round(q * (len(v) - 1))))]
+
+
+def time_claims(w) -> list[float]:
+    """
+    Wraps claim_next_job/submit_job; the returned list collects claim->submit latencies.
+    """
+    claimed_at: Dict[str, float] = {}
+    latencies: list[float] = []
+    claim_next_job = w.claim_next_job
+    submit_job = w.submit_job
+
+    def timed_claim(load):
+        jdir = claim_next_job(load)
+        if jdir is not None:
+            claimed_at[jdir.name] = time.perf_counter()
+        return jdir
+
+    def timed_submit(jdir):
+        submit_job(jdir)
+        t = claimed_at.pop(jdir.name, None)
+        if t is not None:
+            latencies.append(time.perf_counter() - t)
+
+    w.claim_next_job = timed_claim
+    w.submit_job = timed_submit
+    return latencies
+
+
+def finished_outcomes(w) -> Dict[str, int]:
+    return {dict(labels).get("outcome", ""): int(v) for (name, labels), v in w.METRICS.counters.items()
+            if name == "kfx_jobs_finished_total"}
+
+
+def run_workload(workload: str, args: argparse.Namespace, work: Path) -> Dict[str, Any]:
+    if args.nodes > 1:
+        return run_cluster(workload, args, work)
+    root = work / workload
+    sim = FaxSim(root / "sim", dial_sec=args.dial_sec, tx_sec=args.tx_sec,
+                 fail_rate=args.fail_rate, seed=args.seed)
+    w = load_worker(root / "base", sim, args)
+    rng = random.Random(args.seed)
+    latencies = time_claims(w)
+
+    enqueue(w, workload, args.jobs, rng)
+
+    cancelled = 0
+    iterations = 0
+    t_wall = time.monotonic()
+    cpu0 = cpu_seconds()
+    deadline = t_wall + args.timeout
+
+    def between_steps() -> bool:
+        nonlocal cancelled, iterations
+        iterations += 1
+        if workload == "burst-cancel" and iterations % args.burst_every == 0:
+            cancelled += cancel_burst(w, rng, args.burst_size)
+        if not w.list_jobdirs(w.QUEUE) and not w.list_jobdirs(w.PROC):
+            return False
+        return time.monotonic() <= deadline
+
+    if args.engine == "async":
+        async def drive() -> None:
+            engine = w.AsyncEngine(None)
+            task = asyncio.create_task(engine.run())
+            try:
+                while True:
+                    sim.tick()
+                    engine.wake()
+                    if not between_steps():
+                        break
+                    await asyncio.sleep(args.tick)
+            finally:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        asyncio.run(drive())
+    else:
+        while True:
+            sim.tick()
+            w.step_queue_cancels()
+            w.step_processing()
+            w.step_submit()
+            w.prune_job_index()
+            if not between_steps():
+                break
+            time.sleep(args.tick)
+    wall = time.monotonic() - t_wall
+    w.shutdown_finalize_pool()
+    cpu = cpu_seconds() - cpu0
+
+    left = len(w.list_jobdirs(w.QUEUE)) + len(w.list_jobdirs(w.PROC))
+    finished = args.jobs - left
+    outcomes = finished_outcomes(w)
+    return {
+        "workload": workload,
+        "jobs": args.jobs,
+        "finished": finished,
+        "timed_out": left > 0,
+        "cancel_requests": cancelled,
+        "wall_sec": round(wall, 2),
+        "jobs_per_min": round(finished / wall * 60.0, 1) if wall > 0 else 0.0,
+        "claim_submit_p50_ms": round(percentile(latencies, 0.50) * 1000.0, 2),
+        "claim_submit_p99_ms": round(percentile(latencies, 0.99) * 1000.0, 2),
+        "cpu_ms_per_job": round(cpu / max(1, finished) * 1000.0, 2),
+        "outcomes": outcomes,
+    }
+
+
+def cluster_node(index: int, root: Path, args: argparse.Namespace, deadline: float) -> None:
+    """
+    One cluster node (separate process): own simulator, shared BASE, the serial main loop
+    with step_cluster. Writes its numbers to root/node<index>.json.
+    """
+    sim = FaxSim(root / f"sim{index}", dial_sec=args.dial_sec, tx_sec=args.tx_sec,
+                 fail_rate=args.fail_rate, seed=args.seed + index)
+    w = load_worker(root / "base", sim, args)
+    w.CLUSTER_NODE_ID = f"node{index}"
+    w.DONEQ_RELAY = w.BASE / "doneq-relay"
+    w.LIVE_STATUS_FILE = w.BASE / f"live-status.{w.CLUSTER_NODE_ID}.json"
+    latencies = time_claims(w)
+    threading.Thread(target=w.lease_heartbeat_loop, name="lease-heartbeat", daemon=True).start()
+    cpu0 = cpu_seconds()
+    try:
+        while True:
+            sim.tick()
+            w.step_cluster()
+            w.step_queue_cancels()
+            w.step_processing()
+            w.step_submit()
+            w.prune_job_index()
+            if not w.list_jobdirs(w.QUEUE) and not w.list_jobdirs(w.PROC):
+                break
+            if time.time() > deadline:
+                break
+            time.sleep(args.tick)
+    finally:
+        w.shutdown_finalize_pool()
+        w.release_all_leases()
+    (root / f"node{index}.json").write_text(json.dumps({
+        "latencies": latencies,
+        "cpu": cpu_seconds() - cpu0,
+        "outcomes": finished_outcomes(w),
+    }), encoding="utf-8")
+
+
+def run_cluster(workload: str, args: argparse.Namespace, work: Path) -> Dict[str, Any]:
+    """
+    --nodes N: enqueues once into the shared BASE, runs N node processes until the spool is
+    empty and checks jobs == sendfax calls == reports.
+    """
+    root = work / workload
+    sim = FaxSim(root / "sim0", dial_sec=args.dial_sec, tx_sec=args.tx_sec,
+                 fail_rate=args.fail_rate, seed=args.seed)
+    w = load_worker(root / "base", sim, args)
+    enqueue(w, workload, args.jobs, random.Random(args.seed))
+
+    t_wall = time.monotonic()
+    deadline = time.time() + args.timeout
+    # spawn: fresh interpreters, like separate worker services
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=cluster_node, args=(i, root, args, deadline), name=f"node{i}")
+             for i in range(args.nodes)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    wall = time.monotonic() - t_wall
+
+    latencies: list[float] = []
+    cpu = 0.0
+    outcomes: Dict[str, int] = {}
+    for i, p in enumerate(procs):
+        try:
+            r = json.loads((root / f"node{i}.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise SystemExit(f"node{i} exited with {p.exitcode} without result")
+        latencies += r["latencies"]
+        cpu += r["cpu"]
+        for k, v in r["outcomes"].items():
+            outcomes[k] = outcomes.get(k, 0) + v
+
+    sendfax = sum(int((root / f"sim{i}" / "jid").read_text()) for i in range(args.nodes)
+                  if (root / f"sim{i}" / "jid").exists())
+    reports = len(list(w.ARCH_OK.glob("*__OK.pdf"))) + len(list(w.FAIL_OUT.glob("*__FAILED.pdf")))
+    relay_left = len(list(w.DONEQ_RELAY.glob("*/q*"))) if w.DONEQ_RELAY.exists() else 0
+    left = len(w.list_jobdirs(w.QUEUE)) + len(w.list_jobdirs(w.PROC))
+    finished = args.jobs - left
+    return {
+        "workload": workload,
+        "nodes": args.nodes,
+        "jobs": args.jobs,
+        "finished": finished,
+        "timed_out": left > 0,
+        "cancel_requests": 0,
+        "wall_sec": round(wall, 2),
+        "jobs_per_min": round(finished / wall * 60.0, 1) if wall > 0 else 0.0,
+        "claim_submit_p50_ms": round(percentile(latencies, 0.50) * 1000.0, 2),
+        "claim_submit_p99_ms": round(percentile(latencies, 0.99) * 1000.0, 2),
+        "cpu_ms_per_job": round(cpu / max(1, finished) * 1000.0, 2),
+        "outcomes": outcomes,
+        "sendfax_calls": sendfax,
+        "reports": reports,
+        "relay_left": relay_left,
+        # one finalize per job: a second one would overwrite the report under the same name
+        "cluster_ok": (left == 0 and sendfax == args.jobs and reports == args.jobs
+                       and sum(outcomes.values()) == args.jobs and relay_left == 0),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Replay benchmark for kienzlefax-worker.py (simulated HylaFAX)")
+    ap.add_argument("--workloads", default=None, help=f"comma separated: {', '.join(WORKLOADS)}")
+    ap.add_argument("--jobs", type=int, default=1000)
+    ap.add_argument("--engine", choices=("serial", "async"), default="serial")
+    ap.add_argument("--inflight", type=int, default=8, help="MAX_INFLIGHT_PROCESSING (simulated lines)")
+    ap.add_argument("--nodes", type=int, default=1, help="cluster check: worker processes with own HylaFAX sim")
+    ap.add_argument("--dial-sec", type=float, default=0.02)
+    ap.add_argument("--tx-sec", type=float, default=0.05)
+    ap.add_argument("--fail-rate", type=float, default=0.05)
+    ap.add_argument("--tick", type=float, default=0.01, help="sleep between main loop iterations")
+    ap.add_argument("--burst-every", type=int, default=50, help="burst-cancel: iterations between bursts")
+    ap.add_argument("--burst-size", type=int, default=20, help="burst-cancel: jobs cancelled per burst")
+    ap.add_argument("--cancel-postwait", type=float, default=None, help="override CANCEL_POSTWAIT_SEC")
+    ap.add_argument("--header", action="store_true", help="run PDF_HEADER_SCRIPT as configured")
+    ap.add_argument("--timeout", type=float, default=900.0, help="per workload")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", action="store_true", help="print results as JSON lines")
+    ap.add_argument("--verbose", action="store_true", help="keep worker log output on stdout")
+    ap.add_argument("--keep", action="store_true", help="keep the temporary spool")
+    args = ap.parse_args()
+
+    allowed = CLUSTER_WORKLOADS if args.nodes > 1 else WORKLOADS
+    workloads = [x.strip() for x in (args.workloads or ",".join(allowed)).split(",") if x.strip()]
+    for wl in workloads:
+        if wl not in allowed:
+            ap.error(f"unknown workload{' for --nodes' if args.nodes > 1 else ''}: {wl}")
+
+    work = Path(tempfile.mkdtemp(prefix="kfx-bench-"))
+    saved_stdout: Optional[int] = None
+    if not args.verbose:
+        # worker and finalize pool log to fd 1
+        sys.stdout.flush()
+        saved_stdout = os.dup(1)
+        logf = os.open(str(work / "worker.log"), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.dup2(logf, 1)
+        os.close(logf)
+
+    def report(line: str) -> None:
+        if saved_stdout is not None:
+            os.write(saved_stdout, (line + "\n").encode("utf-8"))
+        else:
+            print(line, flush=True)
+
+    failed = False
+    try:
+        for wl in workloads:
+            r = run_workload(wl, args, work)
+            sys.stdout.flush()
+            failed = failed or r.get("cluster_ok") is False
+            if args.json:
+                report(json.dumps(r, sort_keys=True))
+            else:
+                cluster = ""
+                if "cluster_ok" in r:
+                    cluster = (f" | {r['nodes']} nodes: {r['sendfax_calls']} sendfax, {r['reports']} reports,"
+                               f" {r['relay_left']} relay files left{'' if r['cluster_ok'] else ' (MISMATCH)'}")
+                report(
+                    f"{r['workload']:<13} {r['finished']}/{r['jobs']} jobs in {r['wall_sec']}s"
+                    f"{' (TIMEOUT)' if r['timed_out'] else ''} | {r['jobs_per_min']} jobs/min"
+                    f" | claim->submit p50 {r['claim_submit_p50_ms']} ms p99 {r['claim_submit_p99_ms']} ms"
+                    f" | cpu {r['cpu_ms_per_job']} ms/job | {r['outcomes']}{cluster}"
+                )
+    finally:
+        if saved_stdout is not None:
+            sys.stdout.flush()
+            os.dup2(saved_stdout, 1)
+            os.close(saved_stdout)
+        if args.keep:
+            print(f"spool kept: {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
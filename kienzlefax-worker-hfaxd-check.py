@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# kienzlefax-worker-hfaxd-check.py
+#
+# Prüfungen für HylaFaxClient (kienzlefax-worker.py) gegen einen lokalen Fake-hfaxd:
+# FTP-artiges Client-Protokoll mit USER/PASS, TYPE, PASV, JOBFMT + LIST sendq,
+# STOT, JNEW/JPARM/JSUBM und JKILL. Jobs und hochgeladene Dokumente liegen im
+# Speicher; Störungen (Login-Sperre, Session-Abbruch, verlorene JSUBM-Antwort)
+# werden pro Check eingeschaltet.
+#
+# Checks:
+#   login       Anmeldung, falsches Passwort
+#   list        JOBFMT wird gesendet, LIST sendq wird wie `faxstat -sal` geparst
+#   submit      STOT + JNEW/JPARM/JSUBM, Dokument und Parameter kommen an
+#   kill        JKILL, unbekannte JID
+#   reconnect   abgebrochene Session wird neu aufgebaut, Backoff bei Login-Sperre
+#   lost-jsubm  JSUBM gesendet, Antwort verloren -> HylaFaxSubmitUnknown (Job existiert)
+#
+# Beispiel:
+#   ./kienzlefax-worker-hfaxd-check.py
+#   ./kienzlefax-worker-hfaxd-check.py --checks submit,lost-jsubm -v
+#
+# Exit-Code 0 = alle gewählten Checks ok.
+#
+
+import argparse
+import importlib.util
+import re
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import traceback
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+WORKER_PATH = Path(__file__).with_name("kienzlefax-worker.py")
+
+# JOBFMT letters the worker asks for (see _HYLAFAX_JOBFMT)
+JOBFMT_FIELDS = {"j": "jid", "i": "pri", "a": "state", "o": "owner", "e": "number",
+                 "P": "pages", "D": "dials", "z": "tts", "s": "status"}
+
+
+class FakeHfaxd:
+    """
+    In-memory hfaxd on 127.0.0.1 (random port). One thread per session.
+    """
+
+    def __init__(self, user: str = "faxworker", password: str = "secret") -> None:
+        self.user = user
+        self.password = password
+        self.jobs: Dict[int, Dict[str, Any]] = {}
+        self.docs: Dict[str, bytes] = {}
+        self.commands: List[str] = []
+        self.connects = 0
+        self.logins = 0
+        self.quit = threading.Event()  # set once a session got QUIT
+        # fault injection
+        self.refuse = False            # greet with 421 and hang up
+        self.lose_jsubm_reply = False  # create the job on JSUBM, then hang up without a reply
+        self._next_jid = 100
+        self._next_doc = 1
+        self._sessions: List[socket.socket] = []
+        self._mu = threading.Lock()
+
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                fake._session(self.request, self.rfile, self.wfile)
+
+        self._srv = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._srv.daemon_threads = True
+        self.port = self._srv.server_address[1]
+        threading.Thread(target=self._srv.serve_forever, name="fake-hfaxd", daemon=True).start()
+
+    def close(self) -> None:
+        self._srv.shutdown()
+        self._srv.server_close()
+        self.drop_sessions()
+
+    def drop_sessions(self) -> None:
+        """
+        Server side hangs up every open session (hfaxd restart, idle timeout).
+        """
+        with self._mu:
+            sessions, self._sessions = self._sessions, []
+        for s in sessions:
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def add_job(self, number: str, state: str = "S", status: str = "") -> int:
+        with self._mu:
+            jid = self._next_jid
+            self._next_jid += 1
+            self.jobs[jid] = {"jid": str(jid), "pri": "127", "state": state, "owner": self.user,
+                              "number": number, "pages": "0:1", "dials": "0:12", "tts": "0:00",
+                              "status": status, "params": {}}
+        return jid
+
+    # -- protocol --
+    def _session(self, sock: socket.socket, rfile, wfile) -> None:
+        def reply(line: str) -> None:
+            wfile.write((line + "\r\n").encode("utf-8"))
+            wfile.flush()
+
+        with self._mu:
+            self.connects += 1
+            self._sessions.append(sock)
+        if self.refuse:
+            reply("421 Service not available, closing control connection.")
+            return
+        reply("220 fake hfaxd (HylaFAX (tm) Version 6.0.7) server ready.")
+
+        user: Optional[str] = None
+        logged_in = False
+        pasv: Optional[socket.socket] = None
+        jobfmt = ""
+        job: Optional[Dict[str, Any]] = None
+
+        def data_conn() -> Optional[socket.socket]:
+            nonlocal pasv
+            if pasv is None:
+                reply("425 Cannot open data connection: use PASV first.")
+                return None
+            pasv.settimeout(5)
+            conn, _ = pasv.accept()
+            pasv.close()
+            pasv = None
+            return conn
+
+        while True:
+            try:
+                raw = rfile.readline()
+            except OSError:
+                return
+            if not raw:
+                return
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            self.commands.append(line)
+            cmd, _, arg = line.partition(" ")
+            cmd = cmd.upper()
+
+            if cmd == "QUIT":
+                self.quit.set()
+                reply("221 Goodbye.")
+                return
+            if cmd == "USER":
+                user = arg
+                reply(f"331 Password required for {arg}.")
+                continue
+            if cmd == "PASS":
+                if user == self.user and arg == self.password:
+                    logged_in = True
+                    self.logins += 1
+                    reply(f"230 User {user} logged in.")
+                else:
+                    reply("530 Login incorrect.")
+                continue
+            if not logged_in:
+                reply("530 Please login with USER and PASS.")
+                continue
+
+            if cmd == "TYPE":
+                reply(f"200 Type set to {arg}.")
+            elif cmd == "PASV":
+                pasv = socket.socket()
+                pasv.bind(("127.0.0.1", 0))
+                pasv.listen(1)
+                p = pasv.getsockname()[1]
+                reply(f"227 Entering Passive Mode (127,0,0,1,{p // 256},{p % 256})")
+            elif cmd == "JOBFMT":
+                jobfmt = arg.strip('"')
+                reply("200 Job format string set.")
+            elif cmd == "LIST":
+                if arg != "sendq":
+                    reply(f"550 {arg}: No such directory.")
+                    continue
+                conn = data_conn()
+                if conn is None:
+                    continue
+                reply("150 Opening new data connection for \"sendq\".")
+                with self._mu:
+                    rows = [re.sub(r"%(\w)", lambda m: str(j.get(JOBFMT_FIELDS.get(m.group(1), ""), "")), jobfmt)
+                            for j in self.jobs.values()]
+                conn.sendall("".join(r + "\n" for r in rows).encode("utf-8"))
+                conn.close()
+                reply("226 Transfer complete.")
+            elif cmd == "STOT":
+                conn = data_conn()
+                if conn is None:
+                    continue
+                with self._mu:
+                    name = f"docq/doc{self._next_doc}.pdf"
+                    self._next_doc += 1
+                reply(f"150 FILE: {name} (Opening new data connection).")
+                chunks = []
+                while True:
+                    b = conn.recv(65536)
+                    if not b:
+                        break
+                    chunks.append(b)
+                conn.close()
+                self.docs[name] = b"".join(chunks)
+                reply(f"226 Transfer complete (FILE: {name}).")
+            elif cmd == "JNEW":
+                jid = self.add_job("", state="?")
+                job = self.jobs[jid]
+                reply(f"200 New job created: jobid: {jid} groupid: {jid}.")
+            elif cmd == "JPARM":
+                if job is None:
+                    reply("503 No job: use JNEW first.")
+                    continue
+                key, _, value = arg.partition(" ")
+                value = value.strip('"')
+                key = key.upper()
+                if key == "DOCUMENT" and value not in self.docs:
+                    reply(f"550 {value}: No such file.")
+                    continue
+                job["params"][key] = value
+                if key == "DIALSTRING":
+                    job["number"] = value
+                reply(f"213 {key} set.")
+            elif cmd == "JSUBM":
+                if job is None or not job["number"] or "DOCUMENT" not in job["params"]:
+                    reply("503 Job not ready: DIALSTRING and DOCUMENT required.")
+                    continue
+                job["state"] = "P"
+                jid = int(job["jid"])
+                job = None
+                if self.lose_jsubm_reply:
+                    return
+                reply(f"200 Job {jid} submitted.")
+            elif cmd == "JKILL":
+                with self._mu:
+                    found = self.jobs.pop(int(arg), None) if arg.isdigit() else None
+                if found is None:
+                    reply(f"504 Unknown job {arg}.")
+                else:
+                    reply(f"200 Job {arg} killed.")
+            else:
+                reply(f"500 {cmd}: Command not recognized.")
+
+
+def load_worker():
+    spec = importlib.util.spec_from_file_location("kienzlefax_worker", WORKER_PATH)
+    w = importlib.util.module_from_spec(spec)
+    sys.modules["kienzlefax_worker"] = w
+    spec.loader.exec_module(w)
+    w.HYLAFAX_TIMEOUT_SEC = 5
+    return w
+
+
+def client_for(w, fake: FakeHfaxd, password: Optional[str] = None):
+    return w.HylaFaxClient("127.0.0.1", fake.port, fake.user, fake.password if password is None else password)
+
+
+def expect_error(exc_type, fn, match: str = "") -> Exception:
+    try:
+        fn()
+    except exc_type as e:
+        assert match in str(e), f"expected {match!r} in {e!r}"
+        return e
+    raise AssertionError(f"{exc_type.__name__} not raised")
+
+
+def check_login(w, fake: FakeHfaxd, work: Path) -> None:
+    c = client_for(w, fake)
+    assert c.list_sendq() == {}
+    assert fake.logins == 1 and f"USER {fake.user}" in fake.commands
+    c.list_sendq()
+    assert fake.connects == 1, "session is reused"
+    c.close()
+    # close() does not wait for the reply; the session thread may still be reading
+    assert fake.quit.wait(5.0), "QUIT on close"
+    assert fake.commands[-1] == "QUIT"
+
+    bad = client_for(w, fake, password="wrong")
+    expect_error(w.HylaFaxError, bad.list_sendq, "login failed")
+    assert fake.logins == 1
+
+
+def check_list(w, fake: FakeHfaxd, work: Path) -> None:
+    jid = fake.add_job("0301234567", state="R", status="Sending page 2 of 3")
+    c = client_for(w, fake)
+    rows = c.list_sendq()
+    c.close()
+    assert f'JOBFMT "{w._HYLAFAX_JOBFMT}"' in fake.commands
+    assert set(rows) == {jid}
+    row = rows[jid]
+    assert set(row) == {"jid", "pri", "state", "owner", "number", "pages", "dials", "tts", "status"}
+    assert (row["state"], row["number"], row["status"]) == ("R", "0301234567", "Sending page 2 of 3"), row
+
+
+def check_submit(w, fake: FakeHfaxd, work: Path) -> None:
+    doc = work / "doc.pdf"
+    doc.write_bytes(b"%PDF-1.4\n" + bytes(range(256)) * 64 + b"\n%%EOF\n")
+    c = client_for(w, fake)
+    jid, text = c.submit("0301234567", doc, {"MAXDIALS": "3"})
+    job = fake.jobs[jid]
+    assert job["number"] == "0301234567" and job["state"] == "P"
+    assert job["params"]["MAXDIALS"] == "3" and job["params"]["NOTIFY"] == "none"
+    assert fake.docs[job["params"]["DOCUMENT"]] == doc.read_bytes(), "uploaded document differs"
+    assert "TYPE I" in fake.commands
+    assert c.list_sendq()[jid]["number"] == "0301234567"
+    c.close()
+
+
+def check_kill(w, fake: FakeHfaxd, work: Path) -> None:
+    jid = fake.add_job("0301234567")
+    c = client_for(w, fake)
+    assert "killed" in c.kill(jid)
+    assert jid not in fake.jobs
+    expect_error(w.HylaFaxError, lambda: c.kill(jid), "JKILL")
+    c.close()
+
+
+def check_reconnect(w, fake: FakeHfaxd, work: Path) -> None:
+    c = client_for(w, fake)
+    c.list_sendq()
+    fake.drop_sessions()
+    c.list_sendq()
+    assert (fake.connects, fake.logins) == (2, 2), "stale session is replaced once"
+
+    fake.drop_sessions()
+    fake.refuse = True
+    expect_error(w.HylaFaxError, c.list_sendq, "greeting")
+    assert c._backoff == 2.0
+    connects = fake.connects
+    expect_error(w.HylaFaxError, c.list_sendq, "backoff")
+    assert fake.connects == connects, "no connect attempt during backoff"
+
+    fake.refuse = False
+    c._retry_at = 0.0  # skip the wait
+    c.list_sendq()
+    assert c._backoff == 1.0, "backoff reset after a successful login"
+    c.close()
+
+
+def check_lost_jsubm(w, fake: FakeHfaxd, work: Path) -> None:
+    doc = work / "doc.pdf"
+    doc.write_bytes(b"%PDF-1.4\n%%EOF\n")
+    c = client_for(w, fake)
+    fake.lose_jsubm_reply = True
+    expect_error(w.HylaFaxSubmitUnknown, lambda: c.submit("0301234567", doc))
+    assert [j for j in fake.jobs.values() if j["number"] == "0301234567"], "job exists on the server"
+    assert fake.commands.count("JSUBM") == 1, "JSUBM is not repeated"
+
+    fake.lose_jsubm_reply = False
+    assert len(c.list_sendq()) == 1, "next operation opens a new session"
+    c.close()
+
+
+CHECKS: Dict[str, Callable] = {
+    "login": check_login,
+    "list": check_list,
+    "submit": check_submit,
+    "kill": check_kill,
+    "reconnect": check_reconnect,
+    "lost-jsubm": check_lost_jsubm,
+}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Checks für HylaFaxClient gegen einen Fake-hfaxd")
+    ap.add_argument("--checks", default=",".join(CHECKS), help=f"Komma-Liste aus {', '.join(CHECKS)}")
+    ap.add_argument("-v", "--verbose", action="store_true", help="Worker-Log und Tracebacks zeigen")
+    args = ap.parse_args()
+
+    names = [n.strip() for n in args.checks.split(",") if n.strip()]
+    unknown = [n for n in names if n not in CHECKS]
+    if unknown:
+        ap.error(f"unbekannte Checks: {', '.join(unknown)}")
+
+    w = load_worker()
+    if not args.verbose:
+        w.log = lambda msg: None
+    failed = 0
+    with tempfile.TemporaryDirectory(prefix="kfx-hfaxd-") as tmp:
+        for name in names:
+            work = Path(tmp) / name
+            work.mkdir()
+            fake = FakeHfaxd()
+            try:
+                CHECKS[name](w, fake, work)
+                print(f"ok    {name}")
+            except Exception as e:
+                failed += 1
+                print(f"FAIL  {name}: {e or type(e).__name__}")
+                if args.verbose:
+                    traceback.print_exc()
+            finally:
+                fake.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # kienzlefax-worker.py
-# Version 1.2.4
+# Version 1.2.19
 #
 # Changes (minimal, agreed):
 # 1) Live-Status-Felder aus `faxstat -sal` in job.json:
@@ -18,17 +18,139 @@
 #
 # 2) Lock reboot-sicher: statt "Lockfile existiert" wird ein Kernel-Lock via flock genutzt.
 #    Die Datei darf existieren; blockiert nur, wenn ein Prozess den Lock hält.
-
+#
+# 3) Job-Index im Speicher: job.json wird pro Jobordner (Name) nur noch neu geparst,
+#    wenn sich (mtime_ns, size, inode) geändert hat. Alle Schritte eines Ticks lesen
+#    denselben geparsten Stand; unveränderte Jobs kosten nur noch ein stat().
+#
+# 4) Ereignisgesteuerte Hauptschleife via inotify (ctypes, keine Zusatzmodule):
+#    queue/, processing/, die Jobordner und HYLAFAX_DONEQ werden beobachtet.
+#    Eine neue doneq/q<jid> finalisiert gezielt genau diesen Job. Ohne inotify
+#    (oder USE_INOTIFY = False) bleibt das bisherige Polling aktiv.
+#
+# 5) HylaFAX-Client-Protokoll nativ (hfaxd, Port 4559): eine angemeldete Sitzung
+#    bleibt offen (Reconnect mit Backoff) und ersetzt faxstat/sendfax/faxrm-Forks
+#    für Statusliste, Submit und Abbruch. Bei Protokollfehlern wird auf die
+#    CLI-Programme zurückgefallen (HYLAFAX_NATIVE_CLIENT = False erzwingt die CLI).
+#
+# 6) Metriken: Zähler und Latenz-Histogramme je Stufe (queue_wait, header, submit,
+#    dialing, transmission, finalize) und Ergebnis (OK/FAILED/cancelled), Queue-Tiefe,
+#    Inflight und Laufzeit je Subprozess (sendfax, faxstat, qpdf, ...).
+#    Prometheus-Text unter http://METRICS_LISTEN/metrics, Zusammenfassung per log()
+#    alle METRICS_SUMMARY_SEC Sekunden.
+#
+# 7) Finalisieren ohne qpdf-Fork: Sendebericht wird im Speicher erzeugt und per pypdf
+#    in einem Durchgang vor das Dokument gesetzt; das Archiv-PDF wird direkt am Zielort
+#    geschrieben (Tmp-Datei + rename). Mehrere fertige Jobs (z.B. nach einem Ausfall)
+#    werden parallel in einem Prozess-Pool (FINALIZE_WORKERS) finalisiert.
+#    qpdf bleibt Fallback, falls pypdf fehlt oder ein Dokument nicht lesen kann.
+#
+# 8) Scheduler statt "erster freier Ordner": FIFO je Empfängernummer, Round-Robin über
+#    Empfänger, Prioritäten urgent/normal/bulk (options.priority, gewichtet nach
+#    PRIORITY_WEIGHTS, damit bulk nicht verhungert) und Kapazität je Leitung/Modem
+#    (options.line, LINE_CAPACITY; Versand via sendfax -h line@host bzw. JPARM MODEM).
+#    Die Struktur wird inkrementell nachgeführt: mit inotify nur für die Jobs, die ein
+#    Ereignis (queue/, processing/, job.json) bzw. der eigene Claim/Submit/Finalize
+#    betrifft; der volle Abgleich (Stat-Scan beider Verzeichnisse) läuft alle
+#    SCHED_RECONCILE_SEC Sekunden, nach einem inotify-Überlauf, ohne inotify und im
+#    Cluster-Betrieb (NFS meldet Änderungen anderer Rechner nicht). Eine Entscheidung
+#    ist O(1) in der Queue-Länge.
+#
+# 9) Live-Status ohne Schreibverstärkung: Fortschritt/Wahlversuche aus faxstat gehen in
+#    eine kompakte Statusdatei (LIVE_STATUS_FILE, alle aktiven Jobs, nur bei Änderung
+#    geschrieben), die die Weboberfläche beim Polling einliest. job.json wird nur noch
+#    bei einem Zustandswechsel (live.state) neu geschrieben.
+#
+# 10) asyncio-Engine (ASYNC_ENGINE = True): Abbrüche, faxstat-Abfrage, Submit und
+#    Finalisieren laufen als eigenständige Tasks je Job, blockierende Arbeit in Threads
+#    bzw. im Finalize-Pool, begrenzt je Ressource (ASYNC_LIMITS). Die Wartezeit nach
+#    faxrm ist ein Timer statt time.sleep(); inotify hängt per add_reader an der Loop.
+#    qpdf hat ein Timeout (QPDF_TIMEOUT_SEC). ASYNC_ENGINE = False = serielle Schleife.
+#
+# 11) Empfängerprofile (PROFILE_FILE): je Nummer Erfolgsquote, letzte gute Signalrate,
+#    Datenformat/ECM und Sekunden je Seite aus den doneq-Dateien. Nummern, die wiederholt
+#    während der Übertragung abbrechen, werden mit ECM aus, Normalauflösung und
+#    gedeckelter Rate gesendet (sendfax -E/-l/-B bzw. JPARM); job.json bekommt eine
+#    Sendedauer-/Fertig-Schätzung ("eta").
+#
+# 12) Kürzeste erwartete Leitungsbelegung zuerst: innerhalb einer Prioritätsklasse wird
+#    nicht mehr reihum, sondern der Empfänger mit der kleinsten erwarteten Sendedauer
+#    (Seitenzahl x Sekunden/Seite aus dem Empfängerprofil) bedient. Wartezeit wird
+#    gutgeschrieben (SCHED_AGING_FACTOR), damit große Sendungen nicht verhungern.
+#    Seitenzahl und Schätzung hält der Scheduler im Speicher; job.json eines Jobs in
+#    queue/ schreibt der Worker nicht (das Web-UI setzt dort cancel.requested ohne Lock),
+#    job.json["eta"] entsteht erst nach dem Claim. Für die Weboberfläche stehen Position,
+#    erwarteter Start und Fertig-Zeitpunkt wartender Jobs (Scheduler-Reihenfolge gegen
+#    die Leitungen, laufende Jobs zuerst) unter "queue" in LIVE_STATUS_FILE, neu
+#    berechnet bei Änderungen der Queue, spätestens alle QUEUE_FORECAST_SEC Sekunden.
+#
+# 13) Job-Leases statt globalem Lock: jede Aktion an einem Job (Claim+Submit, Finalisieren,
+#    Abbruch) hält ein flock auf <jobdir>/.job.lock (wie acquire_job_lock der AGI); beim
+#    Claim steht zusätzlich job.json["lease"] (owner, expires_at). Damit können mehrere
+#    Worker am selben Spool laufen, z.B. je Modem einer (--role submit --lines ttyS0)
+#    und ein eigener Finalisierer (--role finalize). Beim Start werden Jobs, deren Worker
+#    zwischen Claim und Submit abgestürzt ist, in die Queue zurückgelegt.
+#    Nach dem Claim-Rename wird processing/ neu geprüft: hat ein anderer Worker inzwischen
+#    dieselbe Nummer geclaimt oder die Leitung gefüllt (MAX_INFLIGHT_PROCESSING bzw.
+#    LINE_CAPACITY gelten so über alle Prozesse), geht der Job in die Queue zurück
+#    (kfx_claim_conflicts_total).
+#
+# 14) Cluster-Betrieb (--node-id bzw. CLUSTER_NODE_ID): mehrere Rechner teilen sich BASE
+#    (NFS/CIFS). flock und rename sind dort nicht verlässlich, daher sind Leases Dateien
+#    <jobdir>/.lease.<token>, exklusiv angelegt (O_EXCL); der Token steigt je Übernahme
+#    (Fencing, steht auch in job.json["lease"]). Der Halter zählt im Lease einen
+#    Heartbeat-Zähler ("beat") hoch; ein anderer Knoten übernimmt erst, wenn er selbst
+#    CLUSTER_LEASE_TTL_SEC lang (eigene monotone Uhr) keinen neuen Zählerstand gesehen hat.
+#    Uhren der Knoten und mtimes des Servers spielen keine Rolle. Das gemeinsame BASE muss
+#    ohne Attribut-Cache gemountet sein (NFS: actimeo=0 oder noac), sonst sieht ein Knoten
+#    Heartbeats und neue Lease-Dateien verspätet; die TTL liegt deshalb weit über
+#    Heartbeat-Intervall + acregmax. Vor dem Senden wird geprüft, ob der eigene Token noch
+#    der neueste ist. doneq-Dateien
+#    eigener Jobs werden nach DONEQ_RELAY/<node>/ kopiert; Live-Status, faxrm und die
+#    Übergabe gehören dem sendenden Knoten (job.json["hylafax"]["node"]).
+#
+# 15) Kopfzeile im Prozess: ist /usr/local/lib/kienzlefax/kfx_header.py vorhanden (kommt
+#    mit pdf_with_header.sh), wird es einmal importiert und direkt aufgerufen statt
+#    pro Job bash + python3 + pypdf/reportlab zu starten. Sonst das Script wie bisher.
+#
+# 16) Archiv-Index: ist /usr/local/lib/kienzlefax/kfx_archive.py vorhanden (Asterisk:
+#    installer-modular/worker.sh; HylaFAX: README-installation.md 9.4 Schritt 5b), wird jedes geschriebene Archiv-/Fehler-JSON in
+#    BASE/archive-index.sqlite eingetragen (FTS5); beim Start gleicht ein Thread den
+#    Index mit sendeberichte/ und sendefehler/berichte/ ab. kienzlefax.php nutzt ihn
+#    statt Verzeichnisscans.
+#
+# 17) Archiv-Ablage (ARCHIVE_DEDUP = True): das gesendete Dokument kommt einmal je Inhalt
+#    nach BASE/archive-store/objects, der __OK.pdf enthält nur die Berichtsseite und
+#    job.json["archive_store"] den Verweis. ARCHIVE_COMPACT_DAYS > 0 packt täglich ältere
+#    Sendeberichte in Monatspakete; kienzlefax-archive rebuild stellt das klassische PDF her.
+
+import asyncio
+import argparse
+import ctypes
+import ctypes.util
 import fcntl
+import copy
+import heapq
+import importlib.util
+import io
 import json
+import multiprocessing
 import os
 import re
+import select
 import shutil
+import socket
+import struct
 import subprocess
 import sys
+import threading
 import time
-from dataclasses import dataclass
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from typing import Any, Dict, Optional, Tuple
 
@@ -51,26 +173,101 @@ FAXSTAT_BIN = "faxstat"
 FAX_HOST = "localhost"
 FAXUSER = "faxworker"
 
+# native hfaxd client protocol (instead of forking the CLI tools)
+HYLAFAX_NATIVE_CLIENT = True
+HYLAFAX_PORT = 4559
+FAXPASS = ""
+HYLAFAX_TIMEOUT_SEC = 10
+HYLAFAX_BACKOFF_MAX_SEC = 60.0
+
 PDF_HEADER_SCRIPT = Path("/usr/local/bin/pdf_with_header.sh")  # optional
+PDF_HEADER_MODULE = Path("/usr/local/lib/kienzlefax/kfx_header.py")  # optional, preferred
+ARCHIVE_INDEX_MODULE = Path("/usr/local/lib/kienzlefax/kfx_archive.py")  # optional
+ARCHIVE_DEDUP = False  # True: document once per content in the archive store, __OK.pdf = report page
+ARCHIVE_COMPACT_DAYS = 0  # > 0: reports older than N days into monthly packs (checked daily)
+ARCHIVE_COMPACT_INTERVAL_SEC = 86400
 QPDF_BIN = "qpdf"
+QPDF_TIMEOUT_SEC = 120
 
 # concurrency knobs
 MAX_INFLIGHT_PROCESSING = 2
+# asyncio engine (False = serial loop); per-resource task limits
+ASYNC_ENGINE = True
+ASYNC_LIMITS = {"submit": 2, "cancel": 4, "finalize": 4}
+# scheduling: options.priority in job.json, weighted round-robin between the classes
+PRIORITIES = ("urgent", "normal", "bulk")
+PRIORITY_WEIGHTS = {"urgent": 4, "normal": 2, "bulk": 1}
+# shortest expected transmission first: seconds of expected line time credited
+# per second waited (0 = pure SETF, large = FIFO by age)
+SCHED_AGING_FACTOR = 1.0
+# with inotify the scheduler follows spool events; full stat-scan reconcile this often
+SCHED_RECONCILE_SEC = 60.0
+# expected start of queued jobs in LIVE_STATUS_FILE: recomputed at least this often
+QUEUE_FORECAST_SEC = 30.0
+# options.line (HylaFAX modem) -> max jobs in flight on it; unlisted lines use MAX_INFLIGHT_PROCESSING
+LINE_CAPACITY: Dict[str, int] = {}
 POLL_INTERVAL_SEC = 1.0
+USE_INOTIFY = True
+IDLE_RESCAN_SEC = 30.0
 FAXSTAT_REFRESH_SEC = 2.0
 FINALIZE_TIMEOUT_SEC = 60 * 30
+# parallel finalize (report + merge) when several jobs complete at once; <= 1 = inline
+FINALIZE_WORKERS = 4
 SEND_TIMEOUT_SEC = 30
 FAXRM_TIMEOUT_SEC = 30
 CANCEL_POSTWAIT_SEC = 3
 
-# lockfile (reboot-safe via flock)
-LOCKFILE = BASE / ".kienzlefax-worker.lock"
+# compact live progress of all processing jobs (read by the web UI poll)
+LIVE_STATUS_FILE = BASE / "live-status.json"
+
+# per-number transmission profiles (learned from doneq)
+PROFILE_FILE = BASE / "recipient-profiles.json"
+PROFILE_DEGRADE_AFTER = 2  # failed transfers in a row before ECM off / low res
+PROFILE_DEGRADE_DAYS = 30  # keep the safer options that long after they worked
+PROFILE_SEC_PER_PAGE = 40.0  # default until a number has a successful call
+PROFILE_DIAL_SEC = 30.0
+
+# metrics (None disables the HTTP endpoint)
+METRICS_LISTEN: Optional[Tuple[str, int]] = ("127.0.0.1", 9465)
+METRICS_SUMMARY_SEC = 300.0
+
+# per-job leases: flock on <jobdir>/JOB_LOCK_NAME; lease metadata in job.json on claim
+JOB_LOCK_NAME = ".job.lock"
+LEASE_TTL_SEC = 600
+# clustered spool (several nodes on one shared BASE); None = single node, flock leases
+CLUSTER_NODE_ID: Optional[str] = None
+# a lease is taken over after its heartbeat counter stood still this long on the observer's
+# monotonic clock; well above CLUSTER_HEARTBEAT_SEC + NFS attribute cache (acregmax 60 s)
+CLUSTER_LEASE_TTL_SEC = 180.0
+CLUSTER_HEARTBEAT_SEC = 15.0
+# doneq files of jobs a node submitted are copied to DONEQ_RELAY/<node>/q<jid>
+DONEQ_RELAY = BASE / "doneq-relay"
+# what this process does (see --role / --lines); None = every line
+WORKER_ROLES = ("submit", "finalize")
+SUBMIT_LINES: Optional[set[str]] = None
 
 LOG_PREFIX = "kienzlefax-worker"
 
-_lock_fd: Optional[int] = None
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# job dir name -> lease held by this process
+_leases: Dict[str, "HeldLease"] = {}
+# heartbeat writes vs. release (heartbeat thread / main loop)
+_lease_beat_lock = threading.Lock()
+# (job dir name, token) -> (last heartbeat counter seen, monotonic time it was first seen)
+_lease_seen: Dict[Tuple[str, int], Tuple[Any, float]] = {}
 _last_faxstat_ts: float = 0.0
 _last_faxstat_rows: Dict[int, Dict[str, str]] = {}
+# job dir name -> ((mtime_ns, size, inode) of job.json, parsed job)
+_job_index: Dict[str, Tuple[Tuple[int, int, int], Dict[str, Any]]] = {}
+# hylafax jid -> job dir name (filled while indexing)
+_jid_index: Dict[int, str] = {}
+# job dir name -> live dict as last written to LIVE_STATUS_FILE
+_live_status: Dict[str, Dict[str, Any]] = {}
+# queued job dir name -> {"eta": ...} forecast, the "queue" part of LIVE_STATUS_FILE
+_live_queue: Dict[str, Dict[str, Any]] = {}
+_forecast_at: Optional[float] = None  # monotonic time of the last queue forecast
+_profiles: Optional["RecipientProfiles"] = None
+_hylafax_client: Optional["HylaFaxClient"] = None
 
 
 # ----------------------------
@@ -109,6 +306,21 @@ def normalize_number(num: str) -> str:
     num = re.sub(r"\D+", "", num)
     return num
 
+def remove_jobdir(jdir: Path) -> None:
+    """
+    Moves the job dir out of the spool in one rename, then deletes it. A plain rmtree
+    removes the lease files first; another worker could take a fresh lease in the
+    half-deleted dir and finalize the job a second time.
+    """
+    gone = BASE / f".removed.{jdir.name}.{os.getpid()}"
+    try:
+        os.rename(jdir, gone)
+    except FileNotFoundError:
+        return
+    except OSError:
+        gone = jdir
+    shutil.rmtree(gone, ignore_errors=True)
+
 def list_jobdirs(root: Path) -> list[Path]:
     if not root.exists():
         return []
@@ -116,6 +328,218 @@ def list_jobdirs(root: Path) -> list[Path]:
     dirs.sort(key=lambda x: x.name)
     return dirs
 
+# ----------------------------
+# Metrics
+# ----------------------------
+_HIST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+_LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+class Metrics:
+    """
+    Counters, gauges and cumulative histograms with Prometheus text output.
+    Thread-safe (the HTTP endpoint reads from its own thread).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counters: Dict[_LabelKey, float] = {}
+        self.gauges: Dict[_LabelKey, float] = {}
+        # key -> [bucket counts..., +Inf count], sum
+        self.hists: Dict[_LabelKey, Tuple[list[int], float]] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> _LabelKey:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        k = self._key(name, labels)
+        with self._lock:
+            self.counters[k] = self.counters.get(k, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            self.gauges[self._key(name, labels)] = float(value)
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        k = self._key(name, labels)
+        with self._lock:
+            counts, total = self.hists.get(k) or ([0] * (len(_HIST_BUCKETS) + 1), 0.0)
+            for i, b in enumerate(_HIST_BUCKETS):
+                if seconds <= b:
+                    counts[i] += 1
+            counts[-1] += 1
+            self.hists[k] = (counts, total + max(0.0, seconds))
+
+    @staticmethod
+    def _fmt(name: str, labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+        parts = [f'{k}="{v}"' for k, v in labels]
+        if extra:
+            parts.append(extra)
+        return f"{name}{{{','.join(parts)}}}" if parts else name
+
+    def render(self) -> str:
+        out: list[str] = []
+        with self._lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                seen: set[str] = set()
+                for (name, labels), v in sorted(series.items()):
+                    if name not in seen:
+                        out.append(f"# TYPE {name} {kind}")
+                        seen.add(name)
+                    out.append(f"{self._fmt(name, labels)} {v:g}")
+            seen = set()
+            for (name, labels), (counts, total) in sorted(self.hists.items()):
+                if name not in seen:
+                    out.append(f"# TYPE {name} histogram")
+                    seen.add(name)
+                for b, c in zip(_HIST_BUCKETS, counts):
+                    le = 'le="%g"' % b
+                    out.append(f"{self._fmt(name + '_bucket', labels, le)} {c}")
+                inf = 'le="+Inf"'
+                out.append(f"{self._fmt(name + '_bucket', labels, inf)} {counts[-1]}")
+                out.append(f"{self._fmt(name + '_sum', labels)} {total:.6f}")
+                out.append(f"{self._fmt(name + '_count', labels)} {counts[-1]}")
+        return "\n".join(out) + "\n"
+
+    def summary(self) -> str:
+        with self._lock:
+            g = {name: v for (name, labels), v in self.gauges.items() if not labels}
+            outcomes = {dict(labels).get("outcome", ""): int(v) for (name, labels), v in self.counters.items()
+                        if name == "kfx_jobs_finished_total"}
+            stages = []
+            for (name, labels), (counts, total) in sorted(self.hists.items()):
+                if name == "kfx_stage_seconds" and counts[-1]:
+                    stages.append(f"{dict(labels).get('stage')}={total / counts[-1]:.1f}s")
+        return (f"queue={int(g.get('kfx_queue_depth', 0))} inflight={int(g.get('kfx_inflight', 0))} "
+                f"ok={outcomes.get('OK', 0)} failed={outcomes.get('FAILED', 0)} "
+                f"cancelled={outcomes.get('cancelled', 0)} | avg " + (" ".join(stages) or "-"))
+
+METRICS = Metrics()
+_metrics_last_summary: float = 0.0
+# hylafax jid -> monotonic time the job was first seen running (faxstat state R)
+_first_running: Dict[int, float] = {}
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+def start_metrics_server() -> None:
+    if not METRICS_LISTEN:
+        return
+    try:
+        srv = ThreadingHTTPServer(METRICS_LISTEN, _MetricsHandler)
+    except OSError as e:
+        log(f"metrics endpoint disabled ({METRICS_LISTEN[0]}:{METRICS_LISTEN[1]}): {e}")
+        return
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="metrics", daemon=True).start()
+    log(f"metrics on http://{METRICS_LISTEN[0]}:{METRICS_LISTEN[1]}/metrics")
+
+def iso_age_sec(value: Any) -> Optional[float]:
+    try:
+        t = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        if t.tzinfo is None:
+            t = t.astimezone()
+        return (datetime.now(timezone.utc) - t).total_seconds()
+    except Exception:
+        return None
+
+def metrics_job_finished(job: Dict[str, Any], outcome: str) -> None:
+    METRICS.inc("kfx_jobs_finished_total", outcome=outcome)
+    age = iso_age_sec(job.get("created_at"))
+    if age is not None:
+        METRICS.observe("kfx_job_total_seconds", age, outcome=outcome)
+    try:
+        jid = int((job.get("hylafax") or {}).get("jid"))
+    except Exception:
+        return
+    t_run = _first_running.pop(jid, None)
+    if t_run is not None:
+        METRICS.observe("kfx_stage_seconds", time.monotonic() - t_run, stage="transmission")
+
+def metrics_tick() -> None:
+    global _metrics_last_summary
+    METRICS.set("kfx_queue_depth", len(list_jobdirs(QUEUE)))
+    METRICS.set("kfx_processing", len(list_jobdirs(PROC)))
+    METRICS.set("kfx_inflight", count_inflight())
+    now = time.monotonic()
+    if now - _metrics_last_summary >= METRICS_SUMMARY_SEC:
+        _metrics_last_summary = now
+        log(f"metrics: {METRICS.summary()}")
+
+
+# ----------------------------
+# Job index (resident job.json cache)
+# ----------------------------
+def _job_stat_key(jp: Path) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = jp.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def read_job_cached(jdir: Path) -> Optional[Dict[str, Any]]:
+    """
+    Returns the parsed job.json of a job dir from the resident index.
+    The file is only parsed again if (mtime_ns, size, inode) changed; a claim
+    rename queue/ -> processing/ keeps the inode and therefore stays a hit.
+    The returned dict is shared: read-only use, read_json() for read-modify-write.
+    """
+    jp = jdir / "job.json"
+    key = _job_stat_key(jp)
+    if key is None:
+        _job_index.pop(jdir.name, None)
+        return None
+    hit = _job_index.get(jdir.name)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    try:
+        job = read_json(jp)
+    except Exception:
+        _job_index.pop(jdir.name, None)
+        return None
+    _job_index[jdir.name] = (key, job)
+    try:
+        _jid_index[int((job.get("hylafax") or {}).get("jid"))] = jdir.name
+    except Exception:
+        pass
+    return job
+
+def snapshot_jobs(root: Path) -> list[Tuple[Path, Dict[str, Any]]]:
+    """
+    [(jobdir, job)] for all readable jobs under root, sorted by dir name.
+    """
+    out: list[Tuple[Path, Dict[str, Any]]] = []
+    for jdir in list_jobdirs(root):
+        job = read_job_cached(jdir)
+        if job is not None:
+            out.append((jdir, job))
+    return out
+
+def prune_job_index() -> None:
+    """
+    Drops index entries of jobs that left queue/ and processing/.
+    """
+    alive = {p.name for root in (QUEUE, PROC) for p in list_jobdirs(root)}
+    for name in list(_job_index):
+        if name not in alive:
+            del _job_index[name]
+    for jid, name in list(_jid_index.items()):
+        if name not in alive:
+            del _jid_index[jid]
+
 def parse_sendfax_jid(out: str, err: str) -> Optional[int]:
     m = re.search(r"request id is\s+(\d+)", out or "")
     if m:
@@ -126,36 +550,118 @@ def parse_sendfax_jid(out: str, err: str) -> Optional[int]:
     return None
 
 def run_cmd(cmd: list[str], *, env: Optional[dict]=None, timeout: Optional[int]=None) -> Tuple[int, str, str]:
-    p = subprocess.run(
-        cmd,
-        env=env,
-        capture_output=True,
-        text=True,
-        timeout=timeout,
-    )
+    t0 = time.monotonic()
+    try:
+        p = subprocess.run(
+            cmd,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+    finally:
+        METRICS.observe("kfx_subprocess_seconds", time.monotonic() - t0, binary=Path(cmd[0]).name)
     return p.returncode, (p.stdout or ""), (p.stderr or "")
 
+_lib_modules: Dict[str, Any] = {}
+
+def lib_module(name: str, path: Path) -> Any:
+    # optional module from /usr/local/lib/kienzlefax, imported once; False if missing/broken
+    if name not in _lib_modules:
+        _lib_modules[name] = False
+        if path.is_file():
+            try:
+                spec = importlib.util.spec_from_file_location(name, str(path))
+                mod = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(mod)
+                _lib_modules[name] = mod
+            except Exception as e:
+                log(f"module {path} not usable: {e}")
+    return _lib_modules[name]
+
+def header_module() -> Any:
+    # kfx_header; False -> pdf_with_header.sh
+    return lib_module("kfx_header", PDF_HEADER_MODULE)
+
+def archive_index(out_json: Path) -> None:
+    mod = lib_module("kfx_archive", ARCHIVE_INDEX_MODULE)
+    if not mod:
+        return
+    try:
+        mod.index_file(out_json, base=BASE)
+    except Exception as e:
+        log(f"archive index: {out_json.name} not indexed: {e}")
+
+def archive_index_sync() -> None:
+    # catches up on reports written/moved/deleted while nothing was indexing,
+    # then (ARCHIVE_COMPACT_DAYS) packs old reports once a day
+    mod = lib_module("kfx_archive", ARCHIVE_INDEX_MODULE)
+    if not mod:
+        return
+    def run() -> None:
+        try:
+            t0 = time.monotonic()
+            updated, removed = mod.sync(BASE)
+            if updated or removed:
+                log(f"archive index: {updated} updated, {removed} removed ({time.monotonic() - t0:.1f}s)")
+        except Exception as e:
+            log(f"archive index: sync failed: {e}")
+        while ARCHIVE_COMPACT_DAYS > 0:
+            try:
+                s = mod.compact(BASE, ARCHIVE_COMPACT_DAYS, log=lambda m: log(f"archive {m}"))
+                if s["packed"] or s["skipped"]:
+                    log(f"archive compact: {s['packed']} packed, {s['skipped']} skipped")
+            except Exception as e:
+                log(f"archive compact failed: {e}")
+            time.sleep(ARCHIVE_COMPACT_INTERVAL_SEC)
+    threading.Thread(target=run, name="archive-index-sync", daemon=True).start()
+
+def archive_store_doc(doc: Path, job: Dict[str, Any]) -> bool:
+    # ARCHIVE_DEDUP: document into the archive store, reference in the job JSON
+    if not ARCHIVE_DEDUP or not doc.is_file():
+        return False
+    mod = lib_module("kfx_archive", ARCHIVE_INDEX_MODULE)
+    if not mod:
+        return False
+    try:
+        job["archive_store"] = mod.store_document(doc, base=BASE)
+        return True
+    except Exception as e:
+        job.pop("archive_store", None)
+        log(f"archive store: {doc.name} not stored -> classic PDF: {e}")
+        return False
+
 def add_header(pdf: Path) -> Path:
-    if not PDF_HEADER_SCRIPT.exists():
+    mod = header_module()
+    if not mod and not PDF_HEADER_SCRIPT.exists():
         return pdf
     out = pdf.with_name(pdf.stem + "_hdr.pdf")
+    t0 = time.monotonic()
     try:
-        subprocess.run(
-            [str(PDF_HEADER_SCRIPT), str(pdf), str(out)],
-            check=True,
-            capture_output=True,
-            text=True,
-            timeout=60,
-        )
+        if mod:
+            mod.stamp_pdf(pdf, out)
+        else:
+            subprocess.run(
+                [str(PDF_HEADER_SCRIPT), str(pdf), str(out)],
+                check=True,
+                capture_output=True,
+                text=True,
+                timeout=60,
+            )
         if out.exists() and out.stat().st_size > 0:
             return out
     except Exception as e:
-        log(f"header script failed -> sending without header: {e}")
+        log(f"header failed -> sending without header: {e}")
+    finally:
+        dt = time.monotonic() - t0
+        if not mod:
+            METRICS.observe("kfx_subprocess_seconds", dt, binary=PDF_HEADER_SCRIPT.name)
+        METRICS.observe("kfx_stage_seconds", dt, stage="header")
     return pdf
 
 def merge_report_and_doc(report_pdf: Path, doc_pdf: Path, out_pdf: Path) -> None:
     cmd = [QPDF_BIN, "--empty", "--pages", str(report_pdf), str(doc_pdf), "--", str(out_pdf)]
-    rc, so, se = run_cmd(cmd)
+    rc, so, se = run_cmd(cmd, timeout=QPDF_TIMEOUT_SEC)
     if rc != 0:
         raise RuntimeError(f"qpdf merge failed rc={rc} out={so.strip()} err={se.strip()}")
 
@@ -221,72 +727,340 @@ def parse_faxstat_sal(text: str) -> Dict[int, Dict[str, str]]:
         }
     return rows
 
-def has_active_hylafax_jobs() -> bool:
+# ----------------------------
+# HylaFAX client protocol (hfaxd)
+# ----------------------------
+class HylaFaxError(Exception):
+    pass
+
+# same columns as `faxstat -sal`, "|" separated (status last, may contain spaces)
+_HYLAFAX_JOBFMT = "%j|%i|%a|%o|%e|%P|%D|%z|%s"
+
+class HylaFaxClient:
     """
-    Only poll faxstat if at least one processing job has a JID and is not finalized.
+    One persistent, authenticated hfaxd session (FTP-like client protocol).
+    Broken sessions are reconnected lazily; failed connects back off exponentially
+    up to HYLAFAX_BACKOFF_MAX_SEC. All errors surface as HylaFaxError.
     """
-    for jdir in list_jobdirs(PROC):
-        jp = jdir / "job.json"
-        if not jp.exists():
-            continue
+
+    def __init__(self, host: str, port: int, user: str, password: str = "") -> None:
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self._sock: Optional[socket.socket] = None
+        self._rf = None
+        self._backoff = 1.0
+        self._retry_at = 0.0
+        # one session, one command at a time (the async engine calls from threads)
+        self._lock = threading.RLock()
+
+    # -- session --
+    def close(self) -> None:
+        with self._lock:
+            if self._sock is not None:
+                try:
+                    self._sock.sendall(b"QUIT\r\n")
+                except Exception:
+                    pass
+            self._drop()
+
+    def _drop(self) -> None:
+        for obj in (self._rf, self._sock):
+            try:
+                if obj is not None:
+                    obj.close()
+            except Exception:
+                pass
+        self._rf = None
+        self._sock = None
+
+    def _connect(self) -> None:
+        now = time.time()
+        if now < self._retry_at:
+            raise HylaFaxError(f"hfaxd reconnect backoff ({int(self._retry_at - now)}s left)")
         try:
-            job = read_json(jp)
-        except Exception:
+            self._sock = socket.create_connection((self.host, self.port), timeout=HYLAFAX_TIMEOUT_SEC)
+            self._rf = self._sock.makefile("rb")
+            code, text = self._reply()
+            if code != 220:
+                raise HylaFaxError(f"hfaxd greeting: {code} {text}")
+            code, text = self._cmd(f"USER {self.user}")
+            if code == 331:
+                code, text = self._cmd(f"PASS {self.password}")
+            if code != 230:
+                raise HylaFaxError(f"hfaxd login failed: {code} {text}")
+        except (OSError, HylaFaxError) as e:
+            self._drop()
+            self._retry_at = now + self._backoff
+            self._backoff = min(self._backoff * 2, HYLAFAX_BACKOFF_MAX_SEC)
+            if isinstance(e, HylaFaxError):
+                raise
+            raise HylaFaxError(f"hfaxd connect {self.host}:{self.port}: {e}") from e
+        self._backoff = 1.0
+        log(f"hfaxd session open ({self.host}:{self.port} user={self.user})")
+
+    def _ensure(self) -> None:
+        if self._sock is None:
+            self._connect()
+
+    def _reply(self) -> Tuple[int, str]:
+        lines: list[str] = []
+        code: Optional[int] = None
+        while True:
+            raw = self._rf.readline()
+            if not raw:
+                raise HylaFaxError("hfaxd closed the connection")
+            ln = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            lines.append(ln)
+            if code is None:
+                if len(ln) < 3 or not ln[:3].isdigit():
+                    raise HylaFaxError(f"hfaxd bad reply: {ln!r}")
+                code = int(ln[:3])
+                if ln[3:4] != "-":
+                    break
+            elif ln[:3] == str(code) and ln[3:4] == " ":
+                break
+        return code, "\n".join(lines)
+
+    def _cmd(self, line: str) -> Tuple[int, str]:
+        try:
+            self._sock.sendall((line + "\r\n").encode("utf-8"))
+        except OSError as e:
+            raise HylaFaxError(f"hfaxd send failed: {e}") from e
+        return self._reply()
+
+    def _expect(self, line: str, *ok: int) -> str:
+        code, text = self._cmd(line)
+        if code not in ok:
+            raise HylaFaxError(f"{line.split()[0]} -> {text}")
+        return text
+
+    def _pasv(self) -> socket.socket:
+        text = self._expect("PASV", 227)
+        m = re.search(r"(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)", text)
+        if not m:
+            raise HylaFaxError(f"PASV reply not understood: {text}")
+        n = [int(x) for x in m.groups()]
+        try:
+            return socket.create_connection((".".join(map(str, n[:4])), n[4] * 256 + n[5]),
+                                            timeout=HYLAFAX_TIMEOUT_SEC)
+        except OSError as e:
+            raise HylaFaxError(f"hfaxd data connection: {e}") from e
+
+    def _retrying(self, fn):
+        # idempotent operations: one retry on a fresh session if the old one went stale
+        self._ensure()
+        try:
+            return fn()
+        except (HylaFaxError, OSError):
+            self._drop()
+            self._ensure()
+            try:
+                return fn()
+            except (HylaFaxError, OSError):
+                self._drop()
+                raise
+
+    # -- operations --
+    def list_sendq(self) -> Dict[int, Dict[str, str]]:
+        """
+        Same shape as parse_faxstat_sal().
+        """
+        def op() -> Dict[int, Dict[str, str]]:
+            self._expect(f'JOBFMT "{_HYLAFAX_JOBFMT}"', 200)
+            data = self._pasv()
+            try:
+                self._expect("LIST sendq", 125, 150)
+                chunks = []
+                while True:
+                    b = data.recv(65536)
+                    if not b:
+                        break
+                    chunks.append(b)
+            finally:
+                data.close()
+            code, text = self._reply()
+            if code != 226:
+                raise HylaFaxError(f"LIST sendq -> {text}")
+            return parse_hylafax_joblist(b"".join(chunks).decode("utf-8", errors="replace"))
+        with self._lock:
+            return self._retrying(op)
+
+    def kill(self, jid: int) -> str:
+        with self._lock:
+            return self._retrying(lambda: self._expect(f"JKILL {int(jid)}", 200))
+
+    def submit(self, number: str, document: Path, params: Optional[Dict[str, str]] = None) -> Tuple[int, str]:
+        """
+        Uploads `document` (STOT) and submits one job to `number`.
+        Returns (jid, reply text). Not retried: once JSUBM is sent the job may exist.
+        """
+        with self._lock:
+            return self._submit(number, document, params)
+
+    def _submit(self, number: str, document: Path, params: Optional[Dict[str, str]]) -> Tuple[int, str]:
+        self._ensure()
+        try:
+            self._expect("TYPE I", 200)
+            data = self._pasv()
+            try:
+                text = self._expect("STOT", 125, 150)
+                with document.open("rb") as f:
+                    data.sendfile(f)
+            finally:
+                data.close()
+            code, done = self._reply()
+            if code != 226:
+                raise HylaFaxError(f"STOT -> {done}")
+            m = re.search(r"FILE:\s*(\S+?)\)?\.?(?:\s|$)", text + "\n" + done)
+            if not m:
+                raise HylaFaxError(f"STOT: no server file name in reply: {done}")
+            server_doc = m.group(1)
+
+            self._expect("JNEW", 200)
+            self._expect(f'JPARM DIALSTRING "{number}"', 200, 213)
+            self._expect('JPARM NOTIFY "none"', 200, 213)
+            for k, v in (params or {}).items():
+                self._expect(f'JPARM {k} "{v}"', 200, 213)
+            self._expect(f"JPARM DOCUMENT {server_doc}", 200, 213)
+        except (HylaFaxError, OSError) as e:
+            self._drop()
+            raise HylaFaxError(f"submit aborted before JSUBM: {e}") from e
+
+        try:
+            code, text = self._cmd("JSUBM")
+        except (HylaFaxError, OSError) as e:
+            self._drop()
+            raise HylaFaxSubmitUnknown(f"JSUBM: {e}") from e
+        m = re.search(r"[Jj]ob\s+(\d+)", text)
+        if code != 200 or not m:
+            raise HylaFaxError(f"JSUBM -> {text}")
+        return int(m.group(1)), text
+
+class HylaFaxSubmitUnknown(HylaFaxError):
+    """
+    JSUBM was sent but its outcome is unknown; do not resubmit via CLI.
+    """
+
+def parse_hylafax_joblist(text: str) -> Dict[int, Dict[str, str]]:
+    rows: Dict[int, Dict[str, str]] = {}
+    keys = ("jid", "pri", "state", "owner", "number", "pages", "dials", "tts", "status")
+    for ln in (text or "").splitlines():
+        toks = [x.strip() for x in ln.split("|", len(keys) - 1)]
+        if len(toks) != len(keys) or not toks[0].isdigit():
             continue
+        row = dict(zip(keys, toks))
+        rows[int(row["jid"])] = row
+    return rows
+
+def hylafax_client() -> Optional[HylaFaxClient]:
+    global _hylafax_client
+    if not HYLAFAX_NATIVE_CLIENT:
+        return None
+    if _hylafax_client is None:
+        _hylafax_client = HylaFaxClient(FAX_HOST, HYLAFAX_PORT, FAXUSER, FAXPASS)
+    return _hylafax_client
+
+def has_active_hylafax_jobs() -> bool:
+    """
+    Only poll faxstat if at least one processing job has a JID and is not finalized.
+    """
+    for _, job in snapshot_jobs(PROC):
         hy = job.get("hylafax") or {}
-        if not hy.get("jid"):
+        if not hy.get("jid") or not job_on_this_node(job):
             continue
         if job.get("finalized_at") or job.get("end_time"):
             continue
         return True
     return False
 
-def refresh_faxstat_cache_if_needed() -> None:
-    global _last_faxstat_ts, _last_faxstat_rows
-
+def faxstat_refresh_due() -> bool:
     if not has_active_hylafax_jobs():
-        return
+        return False
+    return (time.time() - _last_faxstat_ts) >= FAXSTAT_REFRESH_SEC or not _last_faxstat_rows
 
-    now = time.time()
-    if (now - _last_faxstat_ts) < FAXSTAT_REFRESH_SEC and _last_faxstat_rows:
-        return
+def fetch_faxstat_rows() -> Optional[Dict[int, Dict[str, str]]]:
+    """
+    Blocking: sendq rows via hfaxd, else `faxstat -sal`. None if both failed.
+    """
+    client = hylafax_client()
+    if client is not None:
+        try:
+            return client.list_sendq()
+        except HylaFaxError as e:
+            log(f"hfaxd status list failed -> faxstat: {e}")
 
     env = os.environ.copy()
     env["FAXUSER"] = FAXUSER
 
     # -a (all jobs), -l (long), -s (sendq status). User wanted -sal style.
     cmd = [FAXSTAT_BIN, "-sal", "-h", FAX_HOST]
-    rc, so, se = run_cmd(cmd, env=env, timeout=10)
+    try:
+        rc, so, se = run_cmd(cmd, env=env, timeout=10)
+    except subprocess.TimeoutExpired:
+        log("faxstat timeout")
+        return None
     if rc != 0:
         # Keep old cache; log once per refresh attempt
         log(f"faxstat failed rc={rc} err='{se.strip()}' out='{so.strip()}'")
-        _last_faxstat_ts = now
-        return
+        return None
+    return parse_faxstat_sal(so)
+
+def store_faxstat_rows(rows: Optional[Dict[int, Dict[str, str]]], fetched_at: float) -> None:
+    global _last_faxstat_ts, _last_faxstat_rows
+    _last_faxstat_ts = fetched_at
+    if rows is not None:
+        _last_faxstat_rows = rows
 
-    _last_faxstat_rows = parse_faxstat_sal(so)
-    _last_faxstat_ts = now
+def refresh_faxstat_cache_if_needed() -> None:
+    if faxstat_refresh_due():
+        now = time.time()
+        store_faxstat_rows(fetch_faxstat_rows(), now)
+
+def write_live_status() -> None:
+    queue = _live_queue
+    if "submit" not in WORKER_ROLES:
+        # the forecast belongs to the submit process sharing this file
+        try:
+            queue = read_json(LIVE_STATUS_FILE).get("queue") or {}
+        except Exception:
+            queue = {}
+    tmp = LIVE_STATUS_FILE.with_name(f".{LIVE_STATUS_FILE.name}.tmp")
+    try:
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump({"updated_at": now_iso(), "jobs": _live_status, "queue": queue}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, LIVE_STATUS_FILE)
+    except Exception as e:
+        log(f"live status write failed: {e}")
 
 def update_processing_jobs_live() -> None:
+    refresh_faxstat_cache_if_needed()
+    apply_faxstat_live()
+
+def apply_faxstat_live() -> None:
     """
-    Updates job.json live fields for processing jobs with a jid.
-    Only writes when a faxstat row for that jid exists.
+    Updates the live fields of processing jobs with a jid from the cached faxstat rows.
+    Progress goes to LIVE_STATUS_FILE (only rewritten if some job changed);
+    job.json is only rewritten when live.state changes.
     """
-    refresh_faxstat_cache_if_needed()
+    jobs = [(jdir, job) for jdir, job in snapshot_jobs(PROC) if job_on_this_node(job)]
+    dirty = False
+    alive = {jdir.name for jdir, _ in jobs}
+    for name in [n for n in _live_status if n not in alive]:
+        del _live_status[name]
+        dirty = True
+
     if not _last_faxstat_rows:
+        if dirty:
+            write_live_status()
         return
 
     updated_at = now_iso()
 
-    for jdir in list_jobdirs(PROC):
-        jp = jdir / "job.json"
-        if not jp.exists():
-            continue
-        try:
-            job = read_json(jp)
-        except Exception:
-            continue
-
-        hy = job.get("hylafax") or {}
+    for jdir, cached in jobs:
+        hy = cached.get("hylafax") or {}
         jid = hy.get("jid")
         if not isinstance(jid, int):
             # sometimes jid stored as string
@@ -299,26 +1073,49 @@ def update_processing_jobs_live() -> None:
         if not row:
             continue
 
+        if row.get("state") == "R" and jid not in _first_running:
+            _first_running[jid] = time.monotonic()
+            dial = iso_age_sec(cached.get("submitted_at"))
+            if dial is not None:
+                METRICS.observe("kfx_stage_seconds", dial, stage="dialing")
+
         sent, total = parse_ratio(row.get("pages", ""))
         d_done, d_max = parse_ratio(row.get("dials", ""))
 
-        live = job.setdefault("live", {})
+        live: Dict[str, Any] = {
+            "progress": {"sent": sent if sent is not None else 0,
+                         "total": total if total is not None else 0,
+                         "raw": row.get("pages", "")},
+            "dials": {"done": d_done if d_done is not None else 0,
+                      "max": d_max if d_max is not None else 0,
+                      "raw": row.get("dials", "")},
+            "tts": row.get("tts", ""),
+            "state": row.get("state", ""),
+            "faxstat_status": row.get("status", ""),
+        }
+        prev = _live_status.get(jdir.name)
+        if prev is not None and all(prev.get(k) == v for k, v in live.items()):
+            continue
         live["updated_at"] = updated_at
-        live["progress"] = {"sent": sent if sent is not None else 0,
-                            "total": total if total is not None else 0,
-                            "raw": row.get("pages", "")}
-        live["dials"] = {"done": d_done if d_done is not None else 0,
-                         "max": d_max if d_max is not None else 0,
-                         "raw": row.get("dials", "")}
-        live["tts"] = row.get("tts", "")
-        live["state"] = row.get("state", "")
-        live["faxstat_status"] = row.get("status", "")
+        _live_status[jdir.name] = live
+        dirty = True
+
+        if (cached.get("live") or {}).get("state") == live["state"]:
+            continue
 
+        jp = jdir / "job.json"
+        try:
+            job = read_json(jp)
+        except Exception:
+            continue
+        job.setdefault("live", {}).update(live)
         try:
             write_json(jp, job)
         except Exception as e:
             log(f"live update failed for {jdir.name}: {e}")
 
+    if dirty:
+        write_live_status()
 
 # ----------------------------
 # Doneq parsing + report
@@ -366,11 +1163,12 @@ def parse_doneq_file(qfile: Path) -> DoneqInfo:
         raw=raw,
     )
 
-def build_report_pdf(job: Dict[str, Any], doneq: Optional[DoneqInfo], out_pdf: Path) -> None:
+def render_report_pdf(job: Dict[str, Any], doneq: Optional[DoneqInfo]) -> bytes:
     from reportlab.lib.pagesizes import A4
     from reportlab.pdfgen import canvas
 
-    c = canvas.Canvas(str(out_pdf), pagesize=A4)
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
     w, h = A4
 
     was_cancelled = bool((job.get("cancel") or {}).get("requested"))
@@ -440,48 +1238,326 @@ def build_report_pdf(job: Dict[str, Any], doneq: Optional[DoneqInfo], out_pdf: P
             pass
 
     c.setFont("Helvetica", 9)
-    c.drawString(50, 40, f"Erzeugt: {now_iso()}  |  kienzlefax-worker v1.2.4")
+    c.drawString(50, 40, f"Erzeugt: {now_iso()}  |  kienzlefax-worker v1.2.19")
     c.showPage()
     c.save()
+    return buf.getvalue()
+
+def merge_report_inproc(report: bytes, doc_pdf: Path, out_pdf: Path) -> None:
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    writer.append(PdfReader(io.BytesIO(report)))
+    writer.append(PdfReader(str(doc_pdf)))
+    with open(out_pdf, "wb") as f:
+        writer.write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+def write_archive_pdf(job: Dict[str, Any], doneq: Optional[DoneqInfo], doc_pdf: Optional[Path], out_pdf: Path) -> None:
+    """
+    Report page + document -> out_pdf, written in place (tmp + rename in the target dir).
+    Falls back to qpdf if pypdf is missing or cannot parse the document. doc_pdf None:
+    report page only (the document is in the archive store).
+    """
+    report = render_report_pdf(job, doneq)
+    tmp = out_pdf.with_name(f".{out_pdf.name}.tmp")
+    try:
+        if doc_pdf is None:
+            tmp.write_bytes(report)
+        else:
+            try:
+                merge_report_inproc(report, doc_pdf, tmp)
+            except Exception as e:
+                log(f"pypdf merge failed -> qpdf: {e}")
+                report_pdf = doc_pdf.with_name("report.pdf")
+                report_pdf.write_bytes(report)
+                merge_report_and_doc(report_pdf, doc_pdf, tmp)
+        os.replace(tmp, out_pdf)
+    finally:
+        try:
+            tmp.unlink()
+        except FileNotFoundError:
+            pass
 
 
 # ----------------------------
-# Lock (reboot-safe)
+# Per-job leases (flock on the job dir; released by the kernel if a worker dies)
 # ----------------------------
-def acquire_lock() -> None:
-    global _lock_fd
-    safe_mkdir(BASE)
+@dataclass
+class HeldLease:
+    action: str
+    fd: Optional[int] = None  # flock (single node)
+    token: int = 0  # lease file epoch (cluster)
+    beat: int = 0  # heartbeat counter written into the lease file (cluster)
+
+_LEASE_FILE = re.compile(r"\.lease\.(\d+)")
+
+def _lease_files(jdir: Path) -> list[Tuple[int, Path]]:
+    out = []
+    with os.scandir(jdir) as it:
+        for de in it:
+            m = _LEASE_FILE.fullmatch(de.name)
+            if m:
+                out.append((int(m.group(1)), Path(de.path)))
+    return sorted(out)
+
+def _held_jobdir(name: str) -> Optional[Path]:
+    for root in (PROC, QUEUE):
+        if (root / name).is_dir():
+            return root / name
+    return None
 
-    fd = os.open(str(LOCKFILE), os.O_CREAT | os.O_RDWR, 0o644)
+def _lease_stale(name: str, epoch: int, beat: Any) -> bool:
+    """
+    True once the heartbeat counter of lease `epoch` has not changed for
+    CLUSTER_LEASE_TTL_SEC, measured on this process's monotonic clock from the moment it
+    was first seen with that value. A lease seen for the first time is never stale.
+    """
+    now = time.monotonic()
+    seen = _lease_seen.get((name, epoch))
+    if seen is None or seen[0] != beat:
+        _lease_seen[(name, epoch)] = (beat, now)
+        return False
+    return now - seen[1] >= CLUSTER_LEASE_TTL_SEC
+
+def _cluster_lease(jdir: Path, action: str) -> Optional[int]:
+    """
+    Creates <jdir>/.lease.<n+1> exclusively if the newest lease .lease.<n> is released
+    or its heartbeat counter stood still for CLUSTER_LEASE_TTL_SEC (see _lease_stale).
+    Returns the token. O_EXCL create is atomic on NFS/CIFS, so of two nodes only one
+    gets a token.
+    """
+    try:
+        files = _lease_files(jdir)
+    except OSError:
+        return None
+    token = 1
+    if files:
+        epoch, path = files[-1]
+        try:
+            info = read_json(path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            info = {}  # being written right now, or garbage
+        if not info.get("released"):
+            if not _lease_stale(jdir.name, epoch, info.get("beat")):
+                return None
+            log(f"lease: {jdir.name} token {epoch} of {info.get('owner', '?')} expired, taking over")
+        _lease_seen.pop((jdir.name, epoch), None)
+        token = epoch + 1
+    path = jdir / f".lease.{token}"
+    try:
+        fd = os.open(str(path), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except OSError:
+        return None
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"node": CLUSTER_NODE_ID, "owner": WORKER_ID, "action": action,
+                   "token": token, "acquired_at": now_iso(), "beat": 0}, f)
+    return token
+
+def lease_job(jdir: Path, action: str) -> bool:
+    """
+    Takes the lease of `jdir` for `action` without blocking. False if another worker
+    (or another task of this one) holds it or the job dir is gone. The lock file moves
+    with the dir, so a lease taken in queue/ stays valid after the claim rename.
+    """
+    if jdir.name in _leases:
+        return False
+    if CLUSTER_NODE_ID:
+        token = _cluster_lease(jdir, action)
+        if token is None:
+            return False
+        _leases[jdir.name] = HeldLease(action, token=token)
+        return True
+    lock_path = jdir / JOB_LOCK_NAME
+    try:
+        fd = os.open(str(lock_path), os.O_CREAT | os.O_RDONLY | os.O_CLOEXEC, 0o644)
+    except OSError:
+        return False
     try:
         fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
-    except BlockingIOError:
+        # the dir may have been claimed/removed between open() and flock()
+        if os.stat(lock_path).st_ino != os.fstat(fd).st_ino:
+            raise FileNotFoundError(lock_path)
+    except OSError:
         os.close(fd)
-        raise SystemExit(f"{LOG_PREFIX}: already running (lock held: {LOCKFILE})")
+        return False
+    _leases[jdir.name] = HeldLease(action, fd=fd)
+    return True
 
-    # write pid for humans (not used for logic)
+def lease_current(name: str) -> bool:
+    """
+    Fencing check before side effects: in a cluster our token must still be the newest.
+    """
+    held = _leases.get(name)
+    if held is None or held.fd is not None:
+        return held is not None or not CLUSTER_NODE_ID
+    jdir = _held_jobdir(name)
     try:
-        os.ftruncate(fd, 0)
-        os.write(fd, f"{os.getpid()}\n".encode("ascii", errors="ignore"))
-        os.fsync(fd)
-    except Exception:
-        pass
-
-    _lock_fd = fd
+        files = _lease_files(jdir) if jdir else []
+    except OSError:
+        return False
+    return bool(files) and files[-1][0] == held.token
 
-def release_lock() -> None:
-    global _lock_fd
-    if _lock_fd is None:
-        return
+def release_job(name: str) -> None:
+    with _lease_beat_lock:
+        held = _leases.pop(name, None)
+        if held is None:
+            return
+        if held.fd is None:
+            jdir = _held_jobdir(name)
+            if jdir is not None and lease_current_token(jdir, held.token):
+                try:
+                    write_json(jdir / f".lease.{held.token}",
+                               {"node": CLUSTER_NODE_ID, "owner": WORKER_ID, "token": held.token,
+                                "released": True, "released_at": now_iso()})
+                except Exception as e:
+                    log(f"lease: release of {name} failed: {e}")
+            return
     try:
-        fcntl.flock(_lock_fd, fcntl.LOCK_UN)
+        fcntl.flock(held.fd, fcntl.LOCK_UN)
     except Exception:
         pass
     try:
-        os.close(_lock_fd)
+        os.close(held.fd)
     except Exception:
         pass
-    _lock_fd = None
+
+def lease_current_token(jdir: Path, token: int) -> bool:
+    try:
+        files = _lease_files(jdir)
+    except OSError:
+        return False
+    return bool(files) and files[-1][0] == token
+
+def release_all_leases() -> None:
+    for name in list(_leases):
+        release_job(name)
+
+def lease_heartbeat_loop() -> None:
+    """
+    Bumps the "beat" counter of every cluster lease held; other nodes judge expiry by
+    whether it changes, not by mtime (clock skew, attribute caching).
+    """
+    while True:
+        time.sleep(CLUSTER_HEARTBEAT_SEC)
+        for name in list(_leases):
+            with _lease_beat_lock:
+                held = _leases.get(name)
+                jdir = _held_jobdir(name) if held is not None and held.fd is None else None
+                if jdir is None or not lease_current_token(jdir, held.token):
+                    continue
+                held.beat += 1
+                try:
+                    write_json(jdir / f".lease.{held.token}",
+                               {"node": CLUSTER_NODE_ID, "owner": WORKER_ID, "action": held.action,
+                                "token": held.token, "beat": held.beat, "beat_at": now_iso()})
+                except Exception as e:
+                    log(f"lease: heartbeat of {name} failed: {e}")
+
+def lease_meta(action: str, name: str = "") -> Dict[str, Any]:
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    ttl = CLUSTER_LEASE_TTL_SEC if CLUSTER_NODE_ID else LEASE_TTL_SEC
+    meta: Dict[str, Any] = {"owner": WORKER_ID, "action": action, "acquired_at": now.isoformat(),
+                            "expires_at": datetime.fromtimestamp(now.timestamp() + ttl, timezone.utc).isoformat()}
+    held = _leases.get(name)
+    if CLUSTER_NODE_ID and held is not None:
+        meta["node"] = CLUSTER_NODE_ID
+        meta["token"] = held.token
+    return meta
+
+def job_node(job: Dict[str, Any]) -> str:
+    return str((job.get("hylafax") or {}).get("node") or "")
+
+def job_on_this_node(job: Dict[str, Any]) -> bool:
+    """
+    HylaFAX-side duties (faxstat, faxrm) belong to the node whose HylaFAX has the job.
+    """
+    return not CLUSTER_NODE_ID or job_node(job) in ("", CLUSTER_NODE_ID)
+
+def doneq_file(job: Dict[str, Any]) -> Path:
+    hy = job.get("hylafax") or {}
+    node = str(hy.get("node") or "")
+    if node:
+        return DONEQ_RELAY / node / f"q{hy.get('jid')}"
+    return HYLAFAX_DONEQ / f"q{hy.get('jid')}"
+
+def relay_doneq() -> None:
+    """
+    Cluster: copies the local doneq file of every processing job this node submitted
+    to DONEQ_RELAY/<node>/, where any node's finalizer can read it. Relay files of this
+    node that no processing job refers to any more are removed (finalized elsewhere
+    before the unlink, or left by a crash); a reused jid must not find an old result.
+    """
+    wanted: set[str] = set()
+    for _, job in snapshot_jobs(PROC):
+        hy = job.get("hylafax") or {}
+        if hy.get("jid") is None or job_node(job) != CLUSTER_NODE_ID:
+            continue
+        dst = doneq_file(job)
+        wanted.add(dst.name)
+        src = HYLAFAX_DONEQ / f"q{hy['jid']}"
+        if dst.exists() or not src.exists():
+            continue
+        try:
+            safe_mkdir(dst.parent)
+            tmp = dst.with_name(f".{dst.name}.{WORKER_ID.replace(':', '_')}.tmp")
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+        except Exception as e:
+            log(f"doneq relay q{hy['jid']} failed: {e}")
+    try:
+        with os.scandir(DONEQ_RELAY / CLUSTER_NODE_ID) as it:
+            stale = [Path(de.path) for de in it
+                     if de.name.startswith("q") and de.name not in wanted and de.is_file()]
+    except FileNotFoundError:
+        stale = []
+    for p in stale:
+        try:
+            p.unlink()
+            log(f"doneq relay: removed orphaned {p.name}")
+        except FileNotFoundError:
+            pass
+
+def doneq_ready(jdir: Path) -> bool:
+    job = read_job_cached(jdir)
+    return job is not None and (job.get("hylafax") or {}).get("jid") is not None and doneq_file(job).exists()
+
+def recover_leases() -> None:
+    """
+    Processing jobs whose claiming worker died before the submit (lease free or expired,
+    no HylaFAX jid, still "claimed") go back to the queue. Any other status means
+    submit_job got further (submitted without jid = outcome unknown, FAILED = recorded
+    outcome); those are never requeued, or the fax could go out twice.
+    """
+    for jdir in list_jobdirs(PROC):
+        cached = read_job_cached(jdir)
+        if cached is None or not cached.get("lease") or (cached.get("hylafax") or {}).get("jid") is not None:
+            continue
+        if not lease_job(jdir, "recover"):
+            continue
+        try:
+            job = read_json(jdir / "job.json")
+            lease = job.get("lease") or {}
+            if not lease or (job.get("hylafax") or {}).get("jid") is not None:
+                continue
+            owner = lease.get("owner", "?")
+            status = str(job.get("status") or "").lower()
+            if status != "claimed":
+                if status == "submitted":
+                    log(f"lease: {jdir.name} submitted by {owner} without jid, outcome unknown")
+                continue
+            job.pop("lease", None)
+            job["status"] = "queued"
+            write_json(jdir / "job.json", job)
+            jdir.rename(QUEUE / jdir.name)
+            log(f"lease: {jdir.name} claimed by {owner} (lease until {lease.get('expires_at', '?')}) -> back to queue")
+        except Exception as e:
+            log(f"lease: recovery of {jdir.name} failed: {e}")
+        finally:
+            release_job(jdir.name)
 
 
 # ----------------------------
@@ -500,6 +1576,13 @@ def mark_cancel_handled(job: Dict[str, Any]) -> None:
     c["handled_at"] = now_iso()
 
 def hylafax_cancel(jid: int) -> Tuple[int, str, str]:
+    client = hylafax_client()
+    if client is not None:
+        try:
+            return 0, client.kill(jid), ""
+        except HylaFaxError as e:
+            log(f"hfaxd JKILL {jid} failed -> faxrm: {e}")
+
     env = os.environ.copy()
     env["FAXUSER"] = FAXUSER
     cmd = [FAXRM_BIN, "-h", FAX_HOST, str(jid)]
@@ -549,25 +1632,28 @@ def write_failed_artifacts(jobdir: Path, job: Dict[str, Any], doneq: Optional[Do
     job.setdefault("result", {})
     job["result"]["reason"] = job["result"].get("reason") or ("cancelled" if cancel_requested(job) else "unknown")
 
-    report_pdf = jobdir / "report.pdf"
-    merged_pdf = jobdir / "merged.pdf"
-
     doc = jobdir / "doc.pdf"
     send_doc = doc.with_name(doc.stem + "_hdr.pdf")
     merge_doc = send_doc if send_doc.exists() else doc
 
-    build_report_pdf(job, doneq, report_pdf)
-    merge_report_and_doc(report_pdf, merge_doc, merged_pdf)
-
     out_pdf = FAIL_OUT / f"{base}__{jobid}__FAILED.pdf"
     out_json = FAIL_OUT / f"{base}__{jobid}.json"
 
-    shutil.move(str(merged_pdf), str(out_pdf))
+    write_archive_pdf(job, doneq, merge_doc, out_pdf)
     write_json(out_json, job)
+    archive_index(out_json)
     log(f"cancel/fail: written -> {out_pdf.name} + {out_json.name}")
 
 def finalize_cancel_in_queue(jdir: Path) -> None:
-    jp = jdir / "job.json"
+    if not lease_job(jdir, "cancel"):
+        return
+    try:
+        _finalize_cancel_in_queue(jdir)
+    finally:
+        release_job(jdir.name)
+
+def _finalize_cancel_in_queue(jdir: Path) -> None:
+    jp = jdir / "job.json"
     if not jp.exists():
         return
 
@@ -598,106 +1684,585 @@ def finalize_cancel_in_queue(jdir: Path) -> None:
             pass
         return
 
-    shutil.rmtree(jdir, ignore_errors=True)
+    remove_jobdir(jdir)
+    metrics_job_finished(job, "cancelled")
     log(f"queue-cancel: removed jobdir {jdir.name}")
 
-def handle_cancel_in_processing(jdir: Path) -> None:
+def pending_processing_cancel(jdir: Path) -> Optional[Dict[str, Any]]:
+    """
+    Fresh job.json of a processing job whose cancel is requested but not handled yet.
+    """
+    cached = read_job_cached(jdir)
+    if cached is None or not cancel_requested(cached) or cancel_handled(cached):
+        return None
+    if not job_on_this_node(cached):
+        return None
+
+    try:
+        job = read_json(jdir / "job.json")
+    except Exception:
+        return None
+
+    if not cancel_requested(job) or cancel_handled(job):
+        return None
+    return job
+
+def kill_for_cancel(job: Dict[str, Any], jid: int) -> None:
+    log(f"cancel requested -> faxrm jid={jid} job={job.get('job_id','')}")
+    try:
+        rc, so, se = hylafax_cancel(int(jid))
+        log(f"faxrm rc={rc} out='{so.strip()}' err='{se.strip()}'")
+    except subprocess.TimeoutExpired:
+        log(f"faxrm timeout for jid={jid}")
+
+def finish_processing_cancel(jdir: Path) -> None:
     jp = jdir / "job.json"
-    if not jp.exists():
-        return
     try:
         job = read_json(jp)
     except Exception:
         return
+    mark_cancel_handled(job)
+    try:
+        write_json(jp, job)
+    except Exception as e:
+        log(f"failed to write cancel.handled_at for {jdir.name}: {e}")
 
-    if not cancel_requested(job) or cancel_handled(job):
+def handle_cancel_in_processing(jdir: Path) -> None:
+    job = pending_processing_cancel(jdir)
+    if job is None or not lease_job(jdir, "cancel"):
         return
+    try:
+        jid = (job.get("hylafax") or {}).get("jid")
+        if jid:
+            kill_for_cancel(job, jid)
+            time.sleep(CANCEL_POSTWAIT_SEC)
 
-    jid = (job.get("hylafax") or {}).get("jid")
-    if jid:
-        log(f"cancel requested -> faxrm jid={jid} job={job.get('job_id','')}")
+        finish_processing_cancel(jdir)
+    finally:
+        release_job(jdir.name)
+
+
+# ----------------------------
+# Scheduler (per-recipient FIFO, shortest expected transmission first, priorities, line capacity)
+# ----------------------------
+@dataclass
+class SchedEntry:
+    name: str
+    number: str
+    prio: str
+    line: str  # "" = any modem
+    rank: float = 0.0  # expected line seconds + aging offset, smaller goes first
+    pages: Optional[int] = None  # doc.pdf page count, counted once per queued job
+    tx_sec: float = 0.0  # expected line seconds (recipient profile)
+
+def sched_rank(tx_sec: float, enqueued_epoch: float) -> float:
+    """
+    tx_sec - SCHED_AGING_FACTOR * waited, minus the term that is the same for all jobs
+    at any given time; the order of two ranks therefore never changes while they wait.
+    """
+    return tx_sec + SCHED_AGING_FACTOR * enqueued_epoch
+
+def queued_job_estimate(jdir: Path, job: Dict[str, Any], number: str,
+                        pages: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Page count and expected transmission time of a queued job. Taken from job["eta"]
+    if already there, otherwise derived from `pages` or doc.pdf. Not written back: the
+    web UI writes cancel.requested to job.json in queue/ without a lock, so the worker
+    leaves it alone until the claim (submit_job stores the eta).
+    """
+    eta = job.get("eta") or {}
+    if eta.get("tx_sec") is not None and "pages" in eta:
+        return eta
+    if pages is None:
+        pages = pdf_page_count(jdir / "doc.pdf")
+    eta = recipient_profiles().eta(number, pages)
+    eta.pop("done_at", None)
+    return eta
+
+def job_priority(job: Dict[str, Any]) -> str:
+    p = str((job.get("options") or {}).get("priority") or "").strip().lower()
+    return p if p in PRIORITIES else "normal"
+
+def job_line(job: Dict[str, Any]) -> str:
+    line = str((job.get("options") or {}).get("line") or "").strip()
+    return line if re.fullmatch(r"[A-Za-z0-9_.-]+", line) else ""
+
+def line_capacity(line: str) -> int:
+    return LINE_CAPACITY.get(line, MAX_INFLIGHT_PROCESSING)
+
+class Scheduler:
+    """
+    Queued jobs grouped as recipient -> (prio, line) -> FIFO of job dir names.
+    Rings per (prio, line) hold the recipients that have a job there and are not busy,
+    keyed by the rank of their oldest job; a heap per ring yields the smallest rank
+    (stale heap entries are skipped lazily). A recipient is parked (taken off all
+    rings) while one of its jobs is in processing, so a decision never walks past
+    busy numbers.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, SchedEntry] = {}
+        self._recipients: Dict[str, Dict[Tuple[str, str], deque[str]]] = {}
+        self._rings: Dict[str, Dict[str, Dict[str, float]]] = {p: {} for p in PRIORITIES}
+        self._heaps: Dict[Tuple[str, str], list[Tuple[float, str]]] = {}
+        self._busy: set[str] = set()
+        self._credits: Dict[str, int] = dict(PRIORITY_WEIGHTS)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def names(self) -> set[str]:
+        return set(self._entries)
+
+    def depth_by_priority(self) -> Dict[str, int]:
+        out = {p: 0 for p in PRIORITIES}
+        for e in self._entries.values():
+            out[e.prio] += 1
+        return out
+
+    def _ring(self, prio: str, line: str) -> Dict[str, float]:
+        return self._rings[prio].setdefault(line, {})
+
+    def _ring_put(self, prio: str, line: str, number: str) -> None:
+        rank = self._entries[self._recipients[number][(prio, line)][0]].rank
+        ring = self._ring(prio, line)
+        if ring.get(number) == rank:
+            return
+        ring[number] = rank
+        heap = self._heaps.setdefault((prio, line), [])
+        heapq.heappush(heap, (rank, number))
+        if len(heap) > 2 * len(ring) + 16:
+            heap[:] = [(r, n) for n, r in ring.items()]
+            heapq.heapify(heap)
+
+    def _ring_peek(self, prio: str, line: str) -> Optional[Tuple[float, str]]:
+        ring = self._ring(prio, line)
+        heap = self._heaps.get((prio, line)) or []
+        while heap:
+            rank, number = heap[0]
+            if ring.get(number) == rank:
+                return rank, number
+            heapq.heappop(heap)
+        return None
+
+    def _add(self, e: SchedEntry) -> None:
+        queues = self._recipients.setdefault(e.number, {})
+        q = queues.setdefault((e.prio, e.line), deque())
+        q.append(e.name)
+        self._entries[e.name] = e
+        if e.number not in self._busy and len(q) == 1:
+            self._ring_put(e.prio, e.line, e.number)
+
+    def _remove(self, e: SchedEntry) -> None:
+        self._entries.pop(e.name, None)
+        queues = self._recipients.get(e.number) or {}
+        q = queues.get((e.prio, e.line))
+        if q is None:
+            return
         try:
-            rc, so, se = hylafax_cancel(int(jid))
-            log(f"faxrm rc={rc} out='{so.strip()}' err='{se.strip()}'")
-        except subprocess.TimeoutExpired:
-            log(f"faxrm timeout for jid={jid}")
-        time.sleep(CANCEL_POSTWAIT_SEC)
+            q.remove(e.name)
+        except ValueError:
+            pass
+        if not q:
+            del queues[(e.prio, e.line)]
+            self._ring(e.prio, e.line).pop(e.number, None)
+        elif e.number not in self._busy:
+            self._ring_put(e.prio, e.line, e.number)
+        if not queues:
+            self._recipients.pop(e.number, None)
+
+    def _park(self, number: str) -> None:
+        if not number:
+            return
+        self._busy.add(number)
+        for prio, line in self._recipients.get(number) or {}:
+            self._ring(prio, line).pop(number, None)
+
+    def _unpark(self, number: str) -> None:
+        self._busy.discard(number)
+        for prio, line in self._recipients.get(number) or {}:
+            self._ring_put(prio, line, number)
+
+    def set_busy(self, busy: set[str]) -> None:
+        """
+        Parks/unparks by the difference to the numbers busy in processing/.
+        """
+        for number in self._busy - busy:
+            self._unpark(number)
+        for number in busy - self._busy:
+            self._park(number)
+
+    def update(self, jdir: Path, job: Dict[str, Any]) -> None:
+        """
+        Adds or refreshes one queued job. An unchanged job keeps its place; a cancelled
+        one is dropped.
+        """
+        if cancel_requested(job):
+            self.discard(jdir.name)
+            return
+        number = normalize_number(((job.get("recipient") or {}).get("number") or ""))
+        key = (number, job_priority(job), job_line(job))
+        cur = self._entries.get(jdir.name)
+        if cur is not None and (cur.number, cur.prio, cur.line) == key:
+            return
+        if cur is not None:
+            self._remove(cur)
+        age = iso_age_sec(job.get("created_at")) or 0.0
+        eta = queued_job_estimate(jdir, job, number, cur.pages if cur is not None else None)
+        tx_sec = float(eta.get("tx_sec") or 0)
+        self._add(SchedEntry(jdir.name, *key, rank=sched_rank(tx_sec, time.time() - age),
+                             pages=eta.get("pages"), tx_sec=tx_sec))
+
+    def discard(self, name: str) -> None:
+        e = self._entries.get(name)
+        if e is not None:
+            self._remove(e)
+
+    def sync(self, queued: list[Tuple[Path, Dict[str, Any]]], busy: set[str]) -> None:
+        """
+        Applies the difference to the current queue snapshot (from the job index) and the
+        set of numbers busy in processing/. Unchanged jobs keep their place.
+        """
+        self.set_busy(busy)
+        seen: set[str] = set()
+        for jdir, job in queued:
+            if not cancel_requested(job):
+                seen.add(jdir.name)
+            self.update(jdir, job)
+        for name in [n for n in self._entries if n not in seen]:
+            self._remove(self._entries[name])
+
+    def _pop(self, prio: str, line_free) -> Optional[SchedEntry]:
+        best: Optional[Tuple[float, str, str]] = None
+        for line, ring in self._rings[prio].items():
+            if not ring or not line_free(line):
+                continue
+            top = self._ring_peek(prio, line)
+            if top is not None and (best is None or top[0] < best[0]):
+                best = (top[0], top[1], line)
+        if best is None:
+            return None
+        _, number, line = best
+        e = self._entries[self._recipients[number][(prio, line)][0]]
+        self._remove(e)
+        self._park(number)
+        return e
+
+    def pick(self, line_free) -> Optional[SchedEntry]:
+        """
+        Next job: weighted round-robin over the priority classes, smallest rank (expected
+        line time, aged) over the recipients within a class, skipping lines for which
+        line_free(line) is False. The recipient is parked until set_busy() (from sync()
+        or an incremental refresh) reports it idle again.
+        """
+        for _ in range(2):
+            for prio in PRIORITIES:
+                if self._credits[prio] <= 0:
+                    continue
+                e = self._pop(prio, line_free)
+                if e is not None:
+                    self._credits[prio] -= 1
+                    return e
+            self._credits = dict(PRIORITY_WEIGHTS)
+        return None
+
+SCHEDULER = Scheduler()
 
-    mark_cancel_handled(job)
+
+# ----------------------------
+# Recipient profiles (learned per number from doneq)
+# ----------------------------
+# HylaFAX DESIREDBR index for JPARM
+_BR_INDEX = {2400: 0, 4800: 1, 7200: 2, 9600: 3, 12000: 4, 14400: 5}
+
+def parse_signalrate(s: Optional[str]) -> Optional[int]:
+    m = re.search(r"(\d+)", s or "")
+    return int(m.group(1)) if m else None
+
+def pdf_page_count(pdf: Path) -> Optional[int]:
     try:
-        write_json(jp, job)
+        from pypdf import PdfReader
+        return len(PdfReader(str(pdf)).pages)
+    except Exception:
+        pass
+    try:
+        n = len(re.findall(rb"/Type\s*/Page(?![s\w])", pdf.read_bytes()))
+        return n or None
+    except Exception:
+        return None
+
+class RecipientProfiles:
+    """
+    Transmission history per normalized number, persisted as one compact JSON file.
+    Several workers may share it: updates are read-modify-write under an flock on a
+    side file, and readers reload when the file changed. Feeds submit options and ETAs.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime_ns = 0
+        self.data: Dict[str, Dict[str, Any]] = {}
+        self._reload()
+
+    def _reload(self) -> None:
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+        try:
+            d = read_json(self.path)
+            if isinstance(d.get("numbers"), dict):
+                self.data = d["numbers"]
+            self._mtime_ns = mtime_ns
+        except Exception as e:
+            log(f"profiles: {self.path} unreadable ({e})")
+
+    def _save(self) -> None:
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        try:
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump({"updated_at": now_iso(), "numbers": self.data}, f,
+                          ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.path)
+            self._mtime_ns = self.path.stat().st_mtime_ns
+        except Exception as e:
+            log(f"profiles: write failed: {e}")
+
+    def get(self, number: str) -> Dict[str, Any]:
+        with self._lock:
+            self._reload()
+            return dict(self.data.get(number) or {})
+
+    def record(self, job: Dict[str, Any], doneq: DoneqInfo, outcome: str, tx_sec: Optional[float]) -> None:
+        number = normalize_number(((job.get("recipient") or {}).get("number") or ""))
+        if not number or outcome not in ("OK", "FAILED"):
+            return
+        opts = (job.get("hylafax") or {}).get("options") or {}
+        with self._lock, self.path.with_name(f".{self.path.name}.lock").open("a") as lf:
+            fcntl.flock(lf, fcntl.LOCK_EX)
+            self._reload()
+            p = self.data.setdefault(number, {"calls": 0, "ok": 0, "failed": 0, "transfer_fails": 0})
+            p["calls"] += 1
+            p["last_dataformat"] = doneq.raw.get("dataformat", "") if doneq.raw else ""
+            if outcome == "OK":
+                p["ok"] += 1
+                p["fail_streak"] = 0
+                p["last_ok_at"] = now_iso()
+                rate = parse_signalrate(doneq.signalrate)
+                if rate:
+                    p["last_good_signalrate"] = rate
+                pages = doneq.npages or doneq.totpages
+                if tx_sec and pages:
+                    spp = tx_sec / pages
+                    old = p.get("sec_per_page")
+                    p["sec_per_page"] = round(spp if old is None else 0.7 * old + 0.3 * spp, 1)
+                # the safer options worked: keep them for a while
+                p["degraded_until"] = (datetime.now(timezone.utc).timestamp() + PROFILE_DEGRADE_DAYS * 86400
+                                       if opts.get("degraded") else None)
+            else:
+                p["failed"] += 1
+                p["last_fail_at"] = now_iso()
+                # a fax session was up (signal rate known) but the document did not get through
+                if doneq.signalrate:
+                    p["transfer_fails"] += 1
+                    p["fail_streak"] = int(p.get("fail_streak") or 0) + 1
+            p["success_rate"] = round(p["ok"] / p["calls"], 3)
+            self._save()
+
+    def submit_options(self, number: str) -> Dict[str, Any]:
+        """
+        {} for numbers without trouble; otherwise {"degraded", "ecm", "fine", "max_bps"}.
+        """
+        p = self.get(number)
+        if not p:
+            return {}
+        until = p.get("degraded_until")
+        degraded = (int(p.get("fail_streak") or 0) >= PROFILE_DEGRADE_AFTER
+                    or bool(until and until > datetime.now(timezone.utc).timestamp()))
+        rate = p.get("last_good_signalrate")
+        if degraded:
+            return {"degraded": True, "ecm": False, "fine": False, "max_bps": min(rate or 9600, 9600)}
+        if int(p.get("fail_streak") or 0) > 0 and rate:
+            return {"max_bps": rate}
+        return {}
+
+    def eta(self, number: str, pages: Optional[int]) -> Dict[str, Any]:
+        spp = float(self.get(number).get("sec_per_page") or PROFILE_SEC_PER_PAGE)
+        tx = PROFILE_DIAL_SEC + spp * (pages or 1)
+        done = datetime.now(timezone.utc).timestamp() + tx
+        return {"pages": pages, "sec_per_page": spp, "tx_sec": int(tx),
+                "done_at": datetime.fromtimestamp(done, timezone.utc).replace(microsecond=0).isoformat()}
+
+def recipient_profiles() -> RecipientProfiles:
+    global _profiles
+    if _profiles is None:
+        _profiles = RecipientProfiles(PROFILE_FILE)
+    return _profiles
+
+def sendfax_option_args(opts: Dict[str, Any]) -> list[str]:
+    args: list[str] = []
+    if opts.get("ecm") is False:
+        args.append("-E")
+    if opts.get("fine") is False:
+        args.append("-l")
+    if opts.get("max_bps"):
+        args += ["-B", str(opts["max_bps"])]
+    return args
+
+def hylafax_option_params(opts: Dict[str, Any]) -> Dict[str, str]:
+    params: Dict[str, str] = {}
+    if opts.get("ecm") is False:
+        params["DESIREDEC"] = "0"
+    if opts.get("fine") is False:
+        params["VRES"] = "98"
+    if opts.get("max_bps"):
+        br = max((i for bps, i in _BR_INDEX.items() if bps <= int(opts["max_bps"])), default=0)
+        params["DESIREDBR"] = str(br)
+    return params
+
+def record_profile(job: Dict[str, Any], doneq: DoneqInfo, outcome: str) -> None:
+    try:
+        jid = int((job.get("hylafax") or {}).get("jid"))
+    except Exception:
+        jid = None
+    t_run = _first_running.get(jid) if jid is not None else None
+    tx_sec = time.monotonic() - t_run if t_run is not None else None
+    try:
+        recipient_profiles().record(job, doneq, outcome, tx_sec)
     except Exception as e:
-        log(f"failed to write cancel.handled_at for {jdir.name}: {e}")
+        log(f"profiles: record failed: {e}")
 
 
 # ----------------------------
 # Workflow: claim/submit/finalize
 # ----------------------------
+# processing jobs that occupy their number and line: name -> (number, line, status);
+# maintained by sync_scheduler() / sched_refresh()
+_sched_proc: Dict[str, Tuple[str, str, str]] = {}
+# job dir names reported by inotify since the last scheduler update
+_sched_dirty: set[str] = set()
+_sched_full_at: Optional[float] = None  # monotonic time of the last full sync
+_sched_events = False  # an inotify watcher feeds sched_note()
+
+def proc_slot(job: Dict[str, Any]) -> Optional[Tuple[str, str, str]]:
+    st = (job.get("status") or "").lower()
+    if st not in ("claimed", "submitted", "running"):
+        return None
+    return normalize_number(((job.get("recipient") or {}).get("number") or "")), job_line(job), st
+
 def get_busy_numbers() -> set[str]:
-    busy: set[str] = set()
-    for jdir in list_jobdirs(PROC):
-        jp = jdir / "job.json"
-        if not jp.exists():
-            continue
-        try:
-            job = read_json(jp)
-        except Exception:
-            continue
-        st = (job.get("status") or "").lower()
-        if st in ("claimed", "submitted", "running"):
-            num = normalize_number(((job.get("recipient") or {}).get("number") or ""))
-            if num:
-                busy.add(num)
-    return busy
+    return {num for num, _, _ in _sched_proc.values() if num}
+
+def sched_inflight() -> int:
+    return sum(1 for _, _, st in _sched_proc.values() if st in ("submitted", "running"))
 
 def count_inflight() -> int:
     n = 0
-    for jdir in list_jobdirs(PROC):
-        jp = jdir / "job.json"
-        if not jp.exists():
-            continue
-        try:
-            job = read_json(jp)
-        except Exception:
-            continue
+    for _, job in snapshot_jobs(PROC):
         st = (job.get("status") or "").lower()
         if st in ("submitted", "running"):
             n += 1
     return n
 
-def claim_next_job_skipping_busy(busy_numbers: set[str]) -> Optional[Path]:
-    for j in list_jobdirs(QUEUE):
-        jp = j / "job.json"
-        if not jp.exists():
+def line_load() -> Dict[str, int]:
+    load: Dict[str, int] = {}
+    for _, line, _ in _sched_proc.values():
+        load[line] = load.get(line, 0) + 1
+    return load
+
+def line_served(line: str) -> bool:
+    return SUBMIT_LINES is None or (line or "*") in SUBMIT_LINES
+
+def claim_conflict(target: Path, e: SchedEntry) -> Optional[str]:
+    """
+    Re-check after the claim rename, against processing/ as it is now: another worker
+    (process or node) may have claimed a job for the same number, or filled the line,
+    since our scheduler snapshot. Jobs still "queued" in processing/ are claims in
+    progress and count. Both sides of a simultaneous claim may back off, never both
+    proceed: each one's job is already in processing/ when it looks.
+    """
+    on_line = 0
+    for jdir, job in snapshot_jobs(PROC):
+        if jdir.name == target.name:
             continue
-        try:
-            job = read_json(jp)
-        except Exception:
+        if (job.get("status") or "queued").lower() not in ("queued", "claimed", "submitted", "running"):
             continue
+        if e.number and normalize_number(((job.get("recipient") or {}).get("number") or "")) == e.number:
+            return f"number {e.number} busy ({jdir.name})"
+        if job_line(job) == e.line:
+            on_line += 1
+    if on_line >= line_capacity(e.line):
+        return f"line {e.line or '*'} full ({on_line})"
+    return None
 
-        num = normalize_number(((job.get("recipient") or {}).get("number") or ""))
-        if num and num in busy_numbers:
-            continue
+def claim_next_job(load: Dict[str, int]) -> Optional[Path]:
+    """
+    Claims the job chosen by SCHEDULER (queue/ -> processing/) and counts it on its line.
+    The job's lease is held from here until release_job() after the submit. Several
+    submit workers share the spool, so the claim is undone when claim_conflict() finds
+    the number or the line taken meanwhile.
+    """
+    while True:
+        e = SCHEDULER.pick(lambda line: line_served(line) and load.get(line, 0) < line_capacity(line))
+        if e is None:
+            return None
 
-        target = PROC / j.name
+        j = QUEUE / e.name
+        target = PROC / e.name
+        if not lease_job(j, "submit"):
+            # another worker is on it
+            continue
         try:
             j.rename(target)
-            log(f"claimed {j.name} (num={num or 'n/a'})")
-            return target
-        except Exception as e:
-            log(f"claim rename failed for {j.name}: {e}")
+        except FileNotFoundError:
+            # NFS: a retransmitted rename reports ENOENT although the first one succeeded
+            if j.exists() or not target.is_dir():
+                release_job(e.name)
+                continue
+        except Exception as ex:
+            release_job(e.name)
+            log(f"claim rename failed for {j.name}: {ex}")
             continue
-    return None
+        conflict = claim_conflict(target, e)
+        if conflict:
+            try:
+                target.rename(j)
+            except Exception as ex:
+                # stranded in processing/ as "queued" would be worse than sending
+                log(f"claim of {e.name} conflicts ({conflict}), move back failed: {ex}")
+            else:
+                release_job(e.name)
+                log(f"claim of {e.name} undone: {conflict}")
+                METRICS.inc("kfx_claim_conflicts_total")
+                _sched_dirty.add(e.name)
+                continue
+        load[e.line] = load.get(e.line, 0) + 1
+        line = f", line={e.line}" if e.line else ""
+        log(f"claimed {j.name} (num={e.number or 'n/a'}, prio={e.prio}{line})")
+        return target
 
 def ensure_dirs() -> None:
     for p in (QUEUE, PROC, ARCH_OK, FAIL_IN, FAIL_OUT):
         safe_mkdir(p)
 
+def fail_unsubmittable(jp: Path, job: Dict[str, Any], reason: str) -> None:
+    # never sent: FAILED instead of "claimed", so recover_leases() does not requeue it
+    job["status"] = "FAILED"
+    job.setdefault("result", {})
+    job["result"]["reason"] = job["result"].get("reason") or reason
+    job["end_time"] = job.get("end_time") or now_iso()
+    write_json(jp, job)
+
 def submit_job(jobdir: Path) -> None:
     jp = jobdir / "job.json"
     doc = jobdir / "doc.pdf"
     if not jp.exists() or not doc.exists():
         log(f"submit: missing job.json or doc.pdf in {jobdir}")
+        if jp.exists():
+            fail_unsubmittable(jp, read_json(jp), "doc.pdf missing")
         return
 
     job = read_json(jp)
@@ -710,9 +2275,18 @@ def submit_job(jobdir: Path) -> None:
     number = normalize_number(rec.get("number") or "")
     if not number:
         log(f"submit: invalid number in {jobdir.name}")
+        fail_unsubmittable(jp, job, "invalid number")
         return
 
-    cmd = [SEND_FAX_BIN, "-n", "-d", number, str(send_doc)]
+    line = job_line(job)
+    profiles = recipient_profiles()
+    opts = profiles.submit_options(number)
+    cmd = [SEND_FAX_BIN, "-n", *sendfax_option_args(opts), "-d", number, str(send_doc)]
+    if line:
+        cmd[1:1] = ["-h", f"{line}@{FAX_HOST}"]
+    params = hylafax_option_params(opts)
+    if line:
+        params["MODEM"] = line
     env = os.environ.copy()
     env["FAXUSER"] = FAXUSER
 
@@ -720,7 +2294,47 @@ def submit_job(jobdir: Path) -> None:
     job["submitted_at"] = now_iso()
     job["started_at"] = job.get("started_at") or job["submitted_at"]
     job["status"] = "submitted"
+    job.setdefault("hylafax", {})["options"] = opts
+    if CLUSTER_NODE_ID:
+        job["hylafax"]["node"] = CLUSTER_NODE_ID
+    job["eta"] = profiles.eta(number, (job.get("eta") or {}).get("pages") or pdf_page_count(send_doc))
+    if not lease_current(jobdir.name):
+        log(f"submit: {jobdir.name} lease taken over by another worker, not sending")
+        return
     write_json(jp, job)
+    t_submit = time.monotonic()
+    if opts:
+        log(f"submit: {jobdir.name} profile options {opts}")
+
+    client = hylafax_client()
+    if client is not None:
+        try:
+            jid, reply = client.submit(number, send_doc, params or None)
+            METRICS.observe("kfx_stage_seconds", time.monotonic() - t_submit, stage="submit")
+            job = read_json(jp)
+            job.setdefault("hylafax", {})
+            job["hylafax"]["sendfax_rc"] = 0
+            job["hylafax"]["sendfax_out"] = reply.strip()
+            job["hylafax"]["sendfax_err"] = ""
+            job["hylafax"]["submitted_via"] = "hfaxd"
+            job["hylafax"]["jid"] = jid
+            write_json(jp, job)
+            log(f"submit: {jobdir.name} -> jid={jid} (hfaxd)")
+            return
+        except HylaFaxSubmitUnknown as e:
+            job = read_json(jp)
+            job["status"] = "FAILED"
+            job.setdefault("hylafax", {})
+            job["hylafax"]["sendfax_rc"] = -1
+            job["hylafax"]["sendfax_out"] = ""
+            job["hylafax"]["sendfax_err"] = str(e)
+            job.setdefault("result", {})
+            job["result"]["reason"] = job["result"].get("reason") or "hfaxd submit outcome unknown"
+            write_json(jp, job)
+            log(f"submit: {jobdir.name} JSUBM outcome unknown, not resubmitting: {e}")
+            return
+        except HylaFaxError as e:
+            log(f"submit: hfaxd failed for {jobdir.name} -> sendfax: {e}")
 
     try:
         rc, so, se = run_cmd(cmd, env=env, timeout=SEND_TIMEOUT_SEC)
@@ -737,6 +2351,7 @@ def submit_job(jobdir: Path) -> None:
         log(f"submit: sendfax timeout for {jobdir.name}")
         return
 
+    METRICS.observe("kfx_stage_seconds", time.monotonic() - t_submit, stage="submit")
     jid = parse_sendfax_jid(so, se)
     job = read_json(jp)
     job.setdefault("hylafax", {})
@@ -751,20 +2366,33 @@ def submit_job(jobdir: Path) -> None:
 
     write_json(jp, job)
 
-def finalize_job(jobdir: Path) -> bool:
+@dataclass
+class FinalizePlan:
+    jobdir: Path
+    job: Dict[str, Any]
+    doneq: DoneqInfo
+    outcome: str  # OK | FAILED | cancelled
+
+def plan_finalize(jobdir: Path) -> Optional[FinalizePlan]:
+    """
+    Returns what to finalize for `jobdir` once its doneq file exists (job.json result
+    fields already filled in), else None. Cheap; runs in the main process.
+    """
     jp = jobdir / "job.json"
     doc = jobdir / "doc.pdf"
-    if not jp.exists() or not doc.exists():
-        return False
+    if not doc.exists():
+        return None
 
-    job = read_json(jp)
+    job = read_job_cached(jobdir)
+    if job is None:
+        return None
     hy = job.get("hylafax") or {}
     jid = hy.get("jid")
 
     if jid is None:
-        return False
+        return None
 
-    qfile = HYLAFAX_DONEQ / f"q{jid}"
+    qfile = doneq_file(job)
     if not qfile.exists():
         claimed_at = job.get("claimed_at") or job.get("submitted_at")
         if claimed_at:
@@ -774,9 +2402,10 @@ def finalize_job(jobdir: Path) -> bool:
                     log(f"finalize: timeout waiting doneq for jid={jid} job={job.get('job_id','')}")
             except Exception:
                 pass
-        return False
+        return None
 
     doneq = parse_doneq_file(qfile)
+    job = read_json(jp)
 
     job.setdefault("result", {})
     job["result"]["statuscode"] = doneq.statuscode
@@ -796,61 +2425,302 @@ def finalize_job(jobdir: Path) -> bool:
     if was_cancelled:
         job["status"] = "FAILED"
         job["result"]["reason"] = job["result"].get("reason") or "cancelled"
-        try:
-            copy_original_to_fail_in(jobdir, job)
-        except Exception as e:
-            log(f"cancel finalize: copy original failed: {e}")
-        write_failed_artifacts(jobdir, job, doneq)
-        shutil.rmtree(jobdir, ignore_errors=True)
-        return True
+        return FinalizePlan(jobdir, job, doneq, "cancelled")
 
     if doneq.statuscode == 0:
         job["status"] = "OK"
         job["result"]["reason"] = "OK"
+        return FinalizePlan(jobdir, job, doneq, "OK")
+
+    job["status"] = "FAILED"
+    job["result"]["reason"] = job["result"].get("reason") or "unknown"
+    return FinalizePlan(jobdir, job, doneq, "FAILED")
+
+def execute_finalize(plan: FinalizePlan) -> float:
+    """
+    Writes the archive artifacts for `plan` (and their archive index rows) and removes
+    the job dir. Runs in the finalize pool (no METRICS / job index access here; the
+    archive index is its own SQLite file); returns seconds spent.
+    """
+    t0 = time.monotonic()
+    jobdir, job, doneq = plan.jobdir, plan.job, plan.doneq
+
+    if plan.outcome == "OK":
         src = job.get("source") or {}
         base = sanitize_basename(Path(src.get("filename_original") or "fax").stem)
         jobid = job.get("job_id") or jobdir.name
 
-        report_pdf = jobdir / "report.pdf"
-        merged_pdf = jobdir / "merged.pdf"
+        doc = jobdir / "doc.pdf"
         send_doc = doc.with_name(doc.stem + "_hdr.pdf")
         merge_doc = send_doc if send_doc.exists() else doc
 
-        build_report_pdf(job, doneq, report_pdf)
-        merge_report_and_doc(report_pdf, merge_doc, merged_pdf)
-
         out_pdf = ARCH_OK / f"{base}__{jobid}__OK.pdf"
         out_json = ARCH_OK / f"{base}__{jobid}.json"
         safe_mkdir(ARCH_OK)
-        shutil.move(str(merged_pdf), str(out_pdf))
+        write_archive_pdf(job, doneq, None if archive_store_doc(merge_doc, job) else merge_doc, out_pdf)
         write_json(out_json, job)
+        archive_index(out_json)
         log(f"finalize OK -> {out_pdf.name}")
-        shutil.rmtree(jobdir, ignore_errors=True)
-        return True
+    else:
+        what = "cancel" if plan.outcome == "cancelled" else "fail"
+        try:
+            copy_original_to_fail_in(jobdir, job)
+        except Exception as e:
+            log(f"{what} finalize: copy original failed: {e}")
+        write_failed_artifacts(jobdir, job, doneq)
 
-    job["status"] = "FAILED"
-    job["result"]["reason"] = job["result"].get("reason") or "unknown"
+    remove_jobdir(jobdir)
+    if job_node(job):
+        # relayed result is consumed; a later job with the same jid must not see it
+        try:
+            doneq_file(job).unlink()
+        except FileNotFoundError:
+            pass
+    return time.monotonic() - t0
+
+_finalize_pool: Optional[ProcessPoolExecutor] = None
+
+# config globals handed to pool children (set by main() args or overridden by the bench)
+_CHILD_CONFIG_TYPES = (str, int, float, bool, Path, tuple, set, frozenset, dict, type(None))
+
+def _finalize_child_init(config: Dict[str, Any]) -> None:
+    globals().update(config)
+
+def finalize_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Not forked: by the time the first batch arrives the metrics server, spool watcher and
+    HylaFaxClient threads are running, and a fork could copy one of their locks (METRICS,
+    client RLock) held. Forkserver children import the module fresh and get the config.
+    """
+    global _finalize_pool
+    if FINALIZE_WORKERS <= 1:
+        return None
+    if _finalize_pool is None:
+        config = {k: v for k, v in globals().items() if k.isupper() and isinstance(v, _CHILD_CONFIG_TYPES)}
+        _finalize_pool = ProcessPoolExecutor(max_workers=FINALIZE_WORKERS,
+                                             mp_context=multiprocessing.get_context("forkserver"),
+                                             initializer=_finalize_child_init, initargs=(config,))
+    return _finalize_pool
+
+def shutdown_finalize_pool() -> None:
+    global _finalize_pool
+    if _finalize_pool is not None:
+        _finalize_pool.shutdown(wait=True, cancel_futures=True)
+        _finalize_pool = None
+
+def finalize_jobdirs(jobdirs: list[Path]) -> int:
+    """
+    Finalizes every job in `jobdirs` whose doneq file exists. A single job runs inline;
+    a batch runs in parallel in the finalize pool. Returns the number finalized.
+    """
+    global _finalize_pool
+    plans: list[FinalizePlan] = []
+    for jdir in jobdirs:
+        # cluster leases are files: only take one when there is something to finalize
+        if CLUSTER_NODE_ID and not doneq_ready(jdir):
+            continue
+        if not lease_job(jdir, "finalize"):
+            continue
+        try:
+            plan = plan_finalize(jdir)
+        except Exception as e:
+            log(f"finalize exception {jdir.name}: {e}")
+            METRICS.inc("kfx_finalize_errors_total")
+            plan = None
+        if plan is not None:
+            plans.append(plan)
+        else:
+            release_job(jdir.name)
+    if not plans:
+        return 0
+
+    pool = finalize_pool() if len(plans) > 1 else None
+    futures: list[Tuple[FinalizePlan, Optional[Future]]] = []
+    for plan in plans:
+        futures.append((plan, pool.submit(execute_finalize, plan) if pool else None))
+
+    done = 0
+    for plan, fut in futures:
+        try:
+            dt = fut.result() if fut is not None else execute_finalize(plan)
+        except BrokenProcessPool as e:
+            log(f"finalize pool broken ({e}) -> recreating")
+            _finalize_pool = None
+            METRICS.inc("kfx_finalize_errors_total")
+            continue
+        except Exception as e:
+            log(f"finalize exception {plan.jobdir.name}: {e}")
+            METRICS.inc("kfx_finalize_errors_total")
+            continue
+        finally:
+            release_job(plan.jobdir.name)
+        METRICS.observe("kfx_stage_seconds", dt, stage="finalize")
+        record_profile(plan.job, plan.doneq, plan.outcome)
+        metrics_job_finished(plan.job, plan.outcome)
+        done += 1
+    sched_refresh({plan.jobdir.name for plan in plans})
+    if len(plans) > 1:
+        log(f"finalize batch: {done}/{len(plans)} jobs")
+    return done
+
+# ----------------------------
+# inotify (event-driven main loop)
+# ----------------------------
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+@dataclass
+class SpoolEvents:
+    timed_out: bool = False
+    spool_changed: bool = False
+    doneq_jids: set[int] = field(default_factory=set)
+    names: set[str] = field(default_factory=set)  # job dirs that arrived, left or changed
+    overflow: bool = False
+
+class SpoolWatcher:
+    """
+    Minimal inotify binding (ctypes) for QUEUE, PROC, their job dirs and HYLAFAX_DONEQ.
+    Raises OSError if inotify is not available.
+    """
+
+    ROOT_MASK = IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE
+    JOBDIR_MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+    # not IN_CREATE: the q file may still be empty then
+    DONEQ_MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify not supported")
+        self._libc = libc
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1: {os.strerror(err)}")
+        self.fd = fd
+        self._roots: set[int] = set()
+        self._doneq_wd: Optional[int] = None
+        self._job_wds: Dict[int, str] = {}
+        try:
+            for root in (QUEUE, PROC):
+                self._roots.add(self._add_watch(root, self.ROOT_MASK))
+        except OSError:
+            self.close()
+            raise
+        try:
+            self._doneq_wd = self._add_watch(HYLAFAX_DONEQ, self.DONEQ_MASK)
+        except OSError as e:
+            log(f"inotify: doneq not watched ({e}); finalize via rescans only")
+
+    def _add_watch(self, path: Path, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(path)), ctypes.c_uint32(mask))
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch {path}: {os.strerror(err)}")
+        return wd
+
+    def close(self) -> None:
+        try:
+            os.close(self.fd)
+        except Exception:
+            pass
+
+    def watch_jobdirs(self) -> None:
+        """
+        Job dirs are watched for job.json rewrites (e.g. cancel from the web UI).
+        The watch follows the inode, so a claim rename keeps it.
+        """
+        watched = set(self._job_wds.values())
+        for root in (QUEUE, PROC):
+            for jdir in list_jobdirs(root):
+                if jdir.name in watched:
+                    continue
+                try:
+                    self._job_wds[self._add_watch(jdir, self.JOBDIR_MASK)] = jdir.name
+                except OSError:
+                    continue
+
+    def wait(self, timeout: float) -> SpoolEvents:
+        try:
+            ready, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        except InterruptedError:
+            ready = []
+        if not ready:
+            return SpoolEvents(timed_out=True)
+        return self.drain()
+
+    def drain(self) -> SpoolEvents:
+        """
+        Reads all pending events without blocking.
+        """
+        ev = SpoolEvents()
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            off = 0
+            while off + _INOTIFY_EVENT.size <= len(buf):
+                wd, mask, _, nlen = _INOTIFY_EVENT.unpack_from(buf, off)
+                off += _INOTIFY_EVENT.size
+                name = buf[off:off + nlen].split(b"\0", 1)[0].decode("utf-8", errors="replace")
+                off += nlen
+                self._dispatch(ev, wd, mask, name)
+        return ev
+
+    def _dispatch(self, ev: SpoolEvents, wd: int, mask: int, name: str) -> None:
+        if mask & IN_Q_OVERFLOW:
+            ev.spool_changed = True
+            ev.overflow = True
+            return
+        if mask & IN_IGNORED:
+            self._job_wds.pop(wd, None)
+            return
+        if wd == self._doneq_wd:
+            m = re.fullmatch(r"q(\d+)", name)
+            if m:
+                ev.doneq_jids.add(int(m.group(1)))
+            return
+        if wd in self._roots:
+            ev.spool_changed = True
+            ev.names.add(name)
+            return
+        if wd in self._job_wds and name == "job.json":
+            ev.spool_changed = True
+            ev.names.add(self._job_wds[wd])
+
+def open_spool_watcher() -> Optional[SpoolWatcher]:
+    if not USE_INOTIFY:
+        return None
     try:
-        copy_original_to_fail_in(jobdir, job)
+        return SpoolWatcher()
     except Exception as e:
-        log(f"fail finalize: copy original failed: {e}")
-    write_failed_artifacts(jobdir, job, doneq)
-    shutil.rmtree(jobdir, ignore_errors=True)
-    return True
+        log(f"inotify unavailable -> polling every {POLL_INTERVAL_SEC}s ({e})")
+        return None
+
+def next_wakeup_sec() -> float:
+    # faxstat live refresh needs regular ticks while HylaFAX is sending
+    if has_active_hylafax_jobs():
+        return FAXSTAT_REFRESH_SEC
+    return IDLE_RESCAN_SEC
 
 
 # ----------------------------
 # Steps
 # ----------------------------
 def step_queue_cancels() -> None:
-    for jdir in list_jobdirs(QUEUE):
-        jp = jdir / "job.json"
-        if not jp.exists():
-            continue
-        try:
-            job = read_json(jp)
-        except Exception:
-            continue
+    for jdir, job in snapshot_jobs(QUEUE):
         if cancel_requested(job) and not cancel_handled(job):
             finalize_cancel_in_queue(jdir)
 
@@ -861,61 +2731,488 @@ def step_processing() -> None:
     for jdir in list_jobdirs(PROC):
         handle_cancel_in_processing(jdir)
 
-    for jdir in list_jobdirs(PROC):
-        try:
-            finalize_job(jdir)
-        except Exception as e:
-            log(f"finalize exception {jdir.name}: {e}")
+    if "finalize" in WORKER_ROLES:
+        finalize_jobdirs(list_jobdirs(PROC))
 
-def step_submit() -> None:
-    inflight = count_inflight()
-    if inflight >= MAX_INFLIGHT_PROCESSING:
-        return
+def step_cluster() -> None:
+    relay_doneq()
+    recover_leases()
+    # heartbeat observations of jobs that are gone
+    for key in [k for k in _lease_seen if _held_jobdir(k[0]) is None]:
+        del _lease_seen[key]
+
+def step_finalize_jids(jids: set[int]) -> None:
+    """
+    Finalizes exactly the processing jobs that own the HylaFAX jobs `jids`.
+    """
+    jdirs: list[Path] = []
+    for jid in sorted(jids):
+        name = _jid_index.get(jid)
+        if name and (PROC / name).is_dir():
+            jdirs.append(PROC / name)
+    finalize_jobdirs(jdirs)
+
+def sched_note(ev: SpoolEvents) -> None:
+    """
+    Records the job dirs an inotify batch touched for the next sync_scheduler().
+    """
+    global _sched_full_at
+    _sched_dirty.update(ev.names)
+    if ev.overflow:
+        _sched_full_at = None
+
+def sched_refresh(names: set[str]) -> None:
+    """
+    Re-reads the given job dirs wherever they are now (queue/, processing/ or gone) and
+    applies them to SCHEDULER and the processing slots.
+    """
+    for name in names:
+        job = read_job_cached(QUEUE / name) if (QUEUE / name).is_dir() else None
+        if job is not None:
+            _sched_proc.pop(name, None)
+            SCHEDULER.update(QUEUE / name, job)
+            continue
+        SCHEDULER.discard(name)
+        job = read_job_cached(PROC / name) if (PROC / name).is_dir() else None
+        slot = proc_slot(job) if job is not None else None
+        if slot is None:
+            _sched_proc.pop(name, None)
+        else:
+            _sched_proc[name] = slot
+    SCHEDULER.set_busy(get_busy_numbers())
+
+def queue_forecast(now: float) -> Dict[str, Dict[str, Any]]:
+    """
+    Expected start and finish of every queued job: replays SCHEDULER's decisions on a
+    copy in simulated time. Each line has LINE_CAPACITY slots, which the processing jobs
+    hold until their eta.done_at; a number stays parked until its job is through.
+    """
+    free: Dict[str, list[float]] = {}
+    parked: Dict[str, float] = {}  # number -> simulated end of its job
+
+    def slots(line: str) -> list[float]:
+        if line not in free:
+            free[line] = [now] * max(1, line_capacity(line))
+        return free[line]
+
+    for name, (number, line, _) in _sched_proc.items():
+        job = read_job_cached(PROC / name) or {}
+        age = iso_age_sec((job.get("eta") or {}).get("done_at"))
+        end = max(now, now - age) if age is not None else now
+        heapq.heapreplace(slots(line), end)
+        if number:
+            parked[number] = max(parked.get(number, now), end)
+
+    sim = copy.deepcopy(SCHEDULER)
+    sim.set_busy(set(parked))
+    out: Dict[str, Dict[str, Any]] = {}
+    t = now
+    while True:
+        e = sim.pick(lambda line: line_served(line) and slots(line)[0] <= t)
+        if e is None:
+            # next event: a number's job ends or a slot frees up
+            later = [end for end in parked.values() if end > t]
+            later += [heap[0] for heap in free.values() if heap[0] > t]
+            if not later:
+                break
+            t = min(later)
+            for number in [n for n, end in parked.items() if end <= t]:
+                del parked[number]
+            sim.set_busy(set(parked))
+            continue
+        end = t + e.tx_sec
+        heapq.heapreplace(slots(e.line), end)
+        if e.number:
+            parked[e.number] = end
+        out[e.name] = {"eta": {
+            "position": len(out) + 1,
+            "pages": e.pages,
+            "tx_sec": int(e.tx_sec),
+            "start_at": datetime.fromtimestamp(t, timezone.utc).replace(microsecond=0).isoformat(),
+            "done_at": datetime.fromtimestamp(end, timezone.utc).replace(microsecond=0).isoformat(),
+        }}
+    return out
+
+def publish_queue_forecast() -> None:
+    """
+    Refreshes the "queue" part of LIVE_STATUS_FILE when the queue changed (no more often
+    than the faxstat live refresh) or QUEUE_FORECAST_SEC passed; the file is only
+    rewritten if a value differs.
+    """
+    global _live_queue, _forecast_at
+    now = time.monotonic()
+    if _forecast_at is not None:
+        age = now - _forecast_at
+        if age < FAXSTAT_REFRESH_SEC or (age < QUEUE_FORECAST_SEC and SCHEDULER.names() == set(_live_queue)):
+            return
+    _forecast_at = now
+    forecast = queue_forecast(time.time())
+    if forecast != _live_queue:
+        _live_queue = forecast
+        write_live_status()
+
+def sync_scheduler() -> Dict[str, int]:
+    """
+    Brings SCHEDULER up to date; returns the current per-line load for claims.
+    Full stat-scan only without inotify, in a cluster, after an overflow or every
+    SCHED_RECONCILE_SEC; otherwise just the job dirs events reported.
+    """
+    global _sched_full_at
+    now = time.monotonic()
+    if (not _sched_events or CLUSTER_NODE_ID or _sched_full_at is None
+            or now - _sched_full_at >= SCHED_RECONCILE_SEC):
+        _sched_dirty.clear()
+        _sched_proc.clear()
+        for jdir, job in snapshot_jobs(PROC):
+            slot = proc_slot(job)
+            if slot is not None:
+                _sched_proc[jdir.name] = slot
+        SCHEDULER.sync(snapshot_jobs(QUEUE), get_busy_numbers())
+        _sched_full_at = now
+    elif _sched_dirty:
+        names = set(_sched_dirty)
+        _sched_dirty.clear()
+        sched_refresh(names)
+    for prio, n in SCHEDULER.depth_by_priority().items():
+        METRICS.set("kfx_sched_queued", n, priority=prio)
+    publish_queue_forecast()
+    return line_load()
+
+def claim_one(load: Dict[str, int]) -> Optional[Path]:
+    """
+    Claims the next job and marks it claimed. None if nothing is claimable or the
+    claimed job turned out to be cancelled (moved back to queue/).
+    """
+    jdir = claim_next_job(load)
+    if not jdir:
+        return None
+
+    try:
+        job = read_json(jdir / "job.json")
+        job["claimed_at"] = job.get("claimed_at") or now_iso()
+        wait = iso_age_sec(job.get("created_at"))
+        if wait is not None:
+            METRICS.observe("kfx_stage_seconds", wait, stage="queue_wait")
+        if cancel_requested(job):
+            target = QUEUE / jdir.name
+            try:
+                jdir.rename(target)
+                log(f"claimed-but-cancelled -> moved back to queue: {target.name}")
+            except Exception as e:
+                log(f"move back to queue failed for cancelled job {jdir.name}: {e}")
+            release_job(jdir.name)
+            sched_refresh({jdir.name})
+            return None
+        job["status"] = "claimed"  # pre-submit; the only state recover_leases() requeues
+        job["lease"] = lease_meta("submit", jdir.name)
+        write_json(jdir / "job.json", job)
+    except Exception:
+        pass
+    sched_refresh({jdir.name})
+    return jdir
 
-    busy = get_busy_numbers()
+def step_submit() -> None:
+    load = sync_scheduler()
+    inflight = sched_inflight()
     while inflight < MAX_INFLIGHT_PROCESSING:
-        jdir = claim_next_job_skipping_busy(busy)
+        jdir = claim_one(load)
         if not jdir:
             return
 
         try:
-            job = read_json(jdir / "job.json")
-            job["claimed_at"] = job.get("claimed_at") or now_iso()
-            if cancel_requested(job):
-                target = QUEUE / jdir.name
-                try:
-                    jdir.rename(target)
-                    log(f"claimed-but-cancelled -> moved back to queue: {target.name}")
-                except Exception as e:
-                    log(f"move back to queue failed for cancelled job {jdir.name}: {e}")
+            submit_job(jdir)
+        finally:
+            release_job(jdir.name)
+            sched_refresh({jdir.name})
+        inflight = sched_inflight()
+
+
+# ----------------------------
+# asyncio engine
+# ----------------------------
+class AsyncEngine:
+    """
+    Same steps as the serial loop, but every job action is its own task, so a slow
+    qpdf, a hung sendfax or a cancel wait no longer stalls the other jobs.
+    Index, scheduler and live status are only touched on the loop thread; blocking
+    work (HylaFAX calls, header script, report/merge) runs in threads or the finalize
+    pool, bounded per resource by ASYNC_LIMITS. A job has at most one task at a time.
+    """
+
+    def __init__(self, watcher: Optional["SpoolWatcher"]) -> None:
+        self.watcher = watcher
+        self.limits = {k: asyncio.Semaphore(max(1, n)) for k, n in ASYNC_LIMITS.items()}
+        self._busy: set[str] = set()
+        self._submitting = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._live_task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._timed_out = False
+        self._spool_changed = False
+        self._doneq_jids: set[int] = set()
+
+    # -- plumbing --
+    def wake(self) -> None:
+        self._wake.set()
+
+    def _on_timeout(self) -> None:
+        self._timed_out = True
+        self._wake.set()
+
+    def _spawn(self, name: str, coro) -> None:
+        self._busy.add(name)
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+
+        def done(t: asyncio.Task) -> None:
+            self._tasks.discard(t)
+            self._busy.discard(name)
+            if not t.cancelled() and t.exception() is not None:
+                log(f"task {name} failed: {t.exception()}")
+            self.wake()
+        task.add_done_callback(done)
+
+    def _on_inotify(self) -> None:
+        ev = self.watcher.drain()
+        sched_note(ev)
+        self._spool_changed |= ev.spool_changed
+        if CLUSTER_NODE_ID:
+            # jids are per node: relay, then let the full scan pick the jobs up
+            self._spool_changed |= bool(ev.doneq_jids)
+        else:
+            self._doneq_jids |= ev.doneq_jids
+        self.wake()
+
+    # -- per-job tasks --
+    async def _queue_cancel(self, jdir: Path) -> None:
+        async with self.limits["finalize"]:
+            await asyncio.to_thread(finalize_cancel_in_queue, jdir)
+
+    async def _processing_cancel(self, jdir: Path, job: Dict[str, Any]) -> None:
+        try:
+            jid = (job.get("hylafax") or {}).get("jid")
+            if jid:
+                async with self.limits["cancel"]:
+                    await asyncio.to_thread(kill_for_cancel, job, jid)
+                # timer on the loop; other jobs keep running meanwhile
+                await asyncio.sleep(CANCEL_POSTWAIT_SEC)
+            finish_processing_cancel(jdir)
+        finally:
+            release_job(jdir.name)
+
+    async def _finalize(self, plan: "FinalizePlan") -> None:
+        global _finalize_pool
+        async with self.limits["finalize"]:
+            loop = asyncio.get_running_loop()
+            try:
+                dt = await loop.run_in_executor(finalize_pool(), execute_finalize, plan)
+            except BrokenProcessPool as e:
+                log(f"finalize pool broken ({e}) -> recreating")
+                _finalize_pool = None
+                METRICS.inc("kfx_finalize_errors_total")
                 return
-            job["status"] = job.get("status") or "claimed"
-            write_json(jdir / "job.json", job)
-            num = normalize_number(((job.get("recipient") or {}).get("number") or ""))
-            if num:
-                busy.add(num)
-        except Exception:
-            pass
+            except Exception as e:
+                log(f"finalize exception {plan.jobdir.name}: {e}")
+                METRICS.inc("kfx_finalize_errors_total")
+                return
+            finally:
+                release_job(plan.jobdir.name)
+                sched_refresh({plan.jobdir.name})
+        METRICS.observe("kfx_stage_seconds", dt, stage="finalize")
+        record_profile(plan.job, plan.doneq, plan.outcome)
+        metrics_job_finished(plan.job, plan.outcome)
+
+    async def _submit(self, jdir: Path) -> None:
+        # the slot was reserved in _fill_submit_slots
+        try:
+            async with self.limits["submit"]:
+                await asyncio.to_thread(submit_job, jdir)
+        finally:
+            self._submitting -= 1
+            release_job(jdir.name)
+            sched_refresh({jdir.name})
+
+    async def _live(self) -> None:
+        now = time.time()
+        rows = await asyncio.to_thread(fetch_faxstat_rows)
+        store_faxstat_rows(rows, now)
+        apply_faxstat_live()
+
+    # -- scheduling --
+    def _try_finalize(self, jdir: Path) -> None:
+        if jdir.name in self._busy or (CLUSTER_NODE_ID and not doneq_ready(jdir)):
+            return
+        if not lease_job(jdir, "finalize"):
+            return
+        try:
+            plan = plan_finalize(jdir)
+        except Exception as e:
+            log(f"finalize exception {jdir.name}: {e}")
+            METRICS.inc("kfx_finalize_errors_total")
+            plan = None
+        if plan is None:
+            release_job(jdir.name)
+            return
+        self._spawn(jdir.name, self._finalize(plan))
 
-        submit_job(jdir)
-        inflight = count_inflight()
+    def _fill_submit_slots(self) -> None:
+        load = sync_scheduler()
+        while sched_inflight() + self._submitting < MAX_INFLIGHT_PROCESSING:
+            jdir = claim_one(load)
+            if not jdir:
+                return
+            self._submitting += 1
+            self._spawn(jdir.name, self._submit(jdir))
+
+    def tick(self, full_scan: bool) -> None:
+        finalizer = "finalize" in WORKER_ROLES
+        if full_scan:
+            if CLUSTER_NODE_ID:
+                step_cluster()
+            if finalizer:
+                for jdir, job in snapshot_jobs(QUEUE):
+                    if jdir.name not in self._busy and cancel_requested(job) and not cancel_handled(job):
+                        self._spawn(jdir.name, self._queue_cancel(jdir))
+
+            # live progress and faxrm of this node's calls run in every role
+            if (self._live_task is None or self._live_task.done()) and faxstat_refresh_due():
+                self._live_task = asyncio.create_task(self._live())
+            elif self._live_task is None or self._live_task.done():
+                apply_faxstat_live()
+
+            for jdir in list_jobdirs(PROC):
+                if jdir.name in self._busy:
+                    continue
+                job = pending_processing_cancel(jdir)
+                if job is not None:
+                    if lease_job(jdir, "cancel"):
+                        self._spawn(jdir.name, self._processing_cancel(jdir, job))
+                    continue
+                if finalizer:
+                    self._try_finalize(jdir)
+        elif finalizer:
+            jids, self._doneq_jids = self._doneq_jids, set()
+            for jid in sorted(jids):
+                name = _jid_index.get(jid)
+                if name and (PROC / name).is_dir():
+                    self._try_finalize(PROC / name)
+
+        if "submit" in WORKER_ROLES:
+            self._fill_submit_slots()
+        if full_scan:
+            prune_job_index()
+            metrics_tick()
+            if self.watcher:
+                self.watcher.watch_jobdirs()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        hylafax_client()
+        if self.watcher:
+            loop.add_reader(self.watcher.fd, self._on_inotify)
+        full_scan = True
+        try:
+            while True:
+                self.tick(full_scan)
+                timeout = next_wakeup_sec() if self.watcher else POLL_INTERVAL_SEC
+                timer = loop.call_later(timeout, self._on_timeout)
+                try:
+                    await self._wake.wait()
+                finally:
+                    timer.cancel()
+                self._wake.clear()
+                full_scan = self._timed_out or self._spool_changed or self.watcher is None
+                self._timed_out = False
+                self._spool_changed = False
+        finally:
+            if self.watcher:
+                loop.remove_reader(self.watcher.fd)
+            for t in list(self._tasks):
+                t.cancel()
 
 
 # ----------------------------
 # Main
 # ----------------------------
-def main() -> None:
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="kienzlefax HylaFAX worker")
+    ap.add_argument("--role", choices=("all", "submit", "finalize"), default="all",
+                    help="submit = claim and send, finalize = cancels, live status, reports")
+    ap.add_argument("--lines", default="",
+                    help="comma separated modems to claim jobs for ('*' = jobs without options.line)")
+    ap.add_argument("--node-id", default=CLUSTER_NODE_ID,
+                    help="clustered spool: unique name of this node (enables lease files)")
+    return ap.parse_args(argv)
+
+def main(argv: Optional[list[str]] = None) -> None:
+    global WORKER_ROLES, SUBMIT_LINES, CLUSTER_NODE_ID, LIVE_STATUS_FILE, _sched_events
+    args = parse_args(argv)
+    if args.role != "all":
+        WORKER_ROLES = (args.role,)
+    if args.lines:
+        SUBMIT_LINES = {s.strip() for s in args.lines.split(",") if s.strip()}
+    if args.node_id:
+        if not re.fullmatch(r"[A-Za-z0-9_.-]+", args.node_id):
+            raise SystemExit(f"{LOG_PREFIX}: invalid node id {args.node_id!r}")
+        CLUSTER_NODE_ID = args.node_id
+        # one live file per node (each sees only its own HylaFAX); the web UI merges them
+        LIVE_STATUS_FILE = LIVE_STATUS_FILE.with_name(f"{LIVE_STATUS_FILE.stem}.{CLUSTER_NODE_ID}.json")
+        threading.Thread(target=lease_heartbeat_loop, name="lease-heartbeat", daemon=True).start()
     ensure_dirs()
-    acquire_lock()
-    log("started (v1.2.4)")
+    log(f"started (v1.2.19) id={WORKER_ID} roles={','.join(WORKER_ROLES)}"
+        + (f" lines={','.join(sorted(SUBMIT_LINES))}" if SUBMIT_LINES is not None else "")
+        + (f" node={CLUSTER_NODE_ID}" if CLUSTER_NODE_ID else ""))
+    recover_leases()
+    header_module()
+    archive_index_sync()
+    start_metrics_server()
+    watcher = open_spool_watcher()
+    if watcher:
+        log("inotify active (queue, processing, doneq)")
+        _sched_events = True
+    full_scan = True
     try:
+        if ASYNC_ENGINE:
+            log(f"asyncio engine (limits {ASYNC_LIMITS})")
+            asyncio.run(AsyncEngine(watcher).run())
+            return
+        finalizer = "finalize" in WORKER_ROLES
         while True:
-            step_queue_cancels()
-            step_processing()
-            step_submit()
-            time.sleep(POLL_INTERVAL_SEC)
+            if full_scan:
+                if CLUSTER_NODE_ID:
+                    step_cluster()
+                if finalizer:
+                    step_queue_cancels()
+                # live progress and faxrm of this node's calls run in every role
+                step_processing()
+                if "submit" in WORKER_ROLES:
+                    step_submit()
+                prune_job_index()
+                metrics_tick()
+                if watcher:
+                    watcher.watch_jobdirs()
+
+            if watcher is None:
+                time.sleep(POLL_INTERVAL_SEC)
+                continue
+
+            ev = watcher.wait(next_wakeup_sec())
+            sched_note(ev)
+            if ev.doneq_jids and CLUSTER_NODE_ID:
+                # jids are per node: relay, then let the full scan pick the jobs up
+                ev.spool_changed = True
+            elif ev.doneq_jids and finalizer:
+                step_finalize_jids(ev.doneq_jids)
+            full_scan = ev.timed_out or ev.spool_changed
+            if ev.doneq_jids and not full_scan and "submit" in WORKER_ROLES:
+                step_submit()
     finally:
-        release_lock()
+        if watcher:
+            watcher.close()
+        if _hylafax_client is not None:
+            _hylafax_client.close()
+        shutdown_finalize_pool()
+        release_all_leases()
 
 if __name__ == "__main__":
     try:
@@ -3,11 +3,24 @@
  * kienzlefax.php
  * Producer Web-UI (sendet NICHT selbst).
  *
- * Version: 1.4.6
+ * Version: 1.4.8
  * Author: Dr. Thomas Kienzle
- * Stand: 2026-06-23
+ * Stand: 2026-10-17
  *
  * Changelog (komplett):
+ * - 1.4.8 (2026-10-17):
+ *   - Archiv-Ablage: Sendeberichte mit Dokumentverweis (KFX_ARCHIVE_DEDUP) und in Monatspakete
+ *     verdichtete Berichte (KFX_ARCHIVE_COMPACT_DAYS) erscheinen weiter im Sendeprotokoll; PDF
+ *     liefert das klassische Bericht+Dokument-PDF ueber kienzlefax-archive rebuild, JSON kommt
+ *     bei Paketen aus dem Paket (php-zip).
+ *
+ * - 1.4.7 (2026-10-17):
+ *   - Archiv: Sendeprotokoll, Fehlerberichte, Fehlerzaehler und die Fehlerbericht-Zuordnung beim
+ *     erneuten Senden lesen aus dem SQLite-Index des Workers (archive-index.sqlite, FTS5) statt
+ *     die Verzeichnisse bei jedem Seitenaufruf zu scannen. Ohne Index wie bisher per Verzeichnisscan.
+ *   - UI: Suchfeld im Sendeprotokoll (Name, Nummer, Datei, Fehlertext), sobald der Index vorhanden ist.
+ *   - Uebernehmen/Loeschen von Fehlerberichten haelt den Index direkt aktuell.
+ *
  * - 1.4.6 (2026-06-23):
  *   - UI: Eingangszaehler in der Sidebar kompakter dargestellt, damit der Eingaenge-Tab nicht zu breit wird.
  *
@@ -201,6 +214,12 @@ $DIR_FAX_INBOX  = '/var/spool/asterisk/fax';
 $DIR_SCAN_INBOX = '/srv/scan/ocr';
 
 $DB_PATH      = $BASE . '/phonebook.sqlite';
+$LIVE_STATUS_PATH = $BASE . '/live-status.json';
+$JOB_DB_PATH  = $BASE . '/jobs.sqlite';   // nur mit KFX_JOB_STORE=sqlite im Worker
+$ARCHIVE_DB_PATH = $BASE . '/archive-index.sqlite';   // vom Worker gepflegt (kfx_archive.py)
+$ARCHIVE_STORE_DIR = $BASE . '/archive-store';         // Dokumente je Inhalt + Monatspakete
+$ARCHIVE_CLI = '/usr/local/bin/kienzlefax-archive';
+$JOB_CHANGES_WAIT_SEC = 25;
 
 $SOURCE_CONFIG_PATH = $BASE . '/config/sources.json';
 
@@ -605,6 +624,164 @@ function read_json_file(string $path): ?array {
   return is_array($j) ? $j : null;
 }
 
+// Change counter of the worker's SQLite job index; null if the worker runs the
+// plain directory store (the UI then just polls).
+function read_job_change_seq(string $dbPath): ?int {
+  if (!is_file($dbPath)) return null;
+  try {
+    $db = new PDO('sqlite:' . $dbPath, null, null, [PDO::ATTR_ERRMODE => PDO::ERRMODE_EXCEPTION]);
+    $db->exec('PRAGMA busy_timeout = 2000');
+    $v = $db->query("SELECT value FROM meta WHERE key = 'change_seq'")->fetchColumn();
+    return ($v === false) ? null : (int)$v;
+  } catch (Throwable $e) {
+    return null;
+  }
+}
+
+// Index of sendeberichte/ + sendefehler/berichte/, maintained by the worker (kfx_archive.py).
+// null => no index (yet), callers fall back to scanning the directories.
+function archive_index_db(): ?PDO {
+  static $db = false;
+  if ($db !== false) return $db;
+  $db = null;
+  $path = $GLOBALS['ARCHIVE_DB_PATH'];
+  if (!is_file($path)) return null;
+  try {
+    $pdo = new PDO('sqlite:' . $path, null, null, [PDO::ATTR_ERRMODE => PDO::ERRMODE_EXCEPTION]);
+    $pdo->exec('PRAGMA busy_timeout = 2000');
+    $pdo->query('SELECT 1 FROM archive LIMIT 1');
+    $db = $pdo;
+  } catch (Throwable $e) {
+    $db = null;
+  }
+  return $db;
+}
+
+function archive_index_count(string $area): ?int {
+  $db = archive_index_db();
+  if ($db === null) return null;
+  try {
+    $st = $db->prepare('SELECT COUNT(*) FROM archive WHERE area = ?');
+    $st->execute([$area]);
+    return (int)$st->fetchColumn();
+  } catch (Throwable $e) {
+    return null;
+  }
+}
+
+// Newest first; rows ['json_file' => name (not path), 'pack' => monthly pack or ''],
+// null without index.
+function archive_index_list(string $area, int $limit, string $q = ''): ?array {
+  $db = archive_index_db();
+  if ($db === null) return null;
+
+  preg_match_all('/[\p{L}\p{N}_]+/u', $q, $m);
+  $words = $m[0];
+  $sql = 'SELECT a.json_file, a.pack FROM archive a';
+  $where = ['a.area = ?'];
+  $args = [$area];
+  try {
+    if (count($words) > 0) {
+      $fts = (string)$db->query("SELECT value FROM meta WHERE key = 'fts'")->fetchColumn() === '1';
+      if ($fts) {
+        $sql .= ' JOIN archive_fts f ON f.rowid = a.id';
+        $where[] = 'archive_fts MATCH ?';
+        $args[] = implode(' ', array_map(static fn($w) => '"' . $w . '"*', $words));
+      } else {
+        foreach ($words as $w) {
+          $like = '%' . addcslashes($w, '%_\\') . '%';
+          $cols = ['recipient_name', 'number', 'number_digits', 'source_file', 'status', 'reason', 'error', 'job_id'];
+          $where[] = '(' . implode(' OR ', array_map(static fn($c) => "a.$c LIKE ? ESCAPE '\\'", $cols)) . ')';
+          foreach ($cols as $_) $args[] = $like;
+        }
+      }
+    }
+    $sql .= ' WHERE ' . implode(' AND ', $where) . ' ORDER BY a.end_ts DESC, a.id DESC LIMIT ' . max(1, $limit);
+    $st = $db->prepare($sql);
+    $st->execute($args);
+    return array_values(array_filter($st->fetchAll(PDO::FETCH_ASSOC),
+      static fn($r) => is_string($r['json_file']) && $r['json_file'] !== '' && basename($r['json_file']) === $r['json_file']));
+  } catch (Throwable $e) {
+    return null;
+  }
+}
+
+// Monthly pack of a compacted sendebericht ('' = still in sendeberichte/).
+function archive_pack_of(string $jsonFn): string {
+  $db = archive_index_db();
+  if ($db === null) return '';
+  try {
+    $st = $db->prepare("SELECT pack FROM archive WHERE area = 'ok' AND json_file = ?");
+    $st->execute([$jsonFn]);
+    return (string)($st->fetchColumn() ?: '');
+  } catch (Throwable $e) {
+    return '';
+  }
+}
+
+function archive_pack_member(string $pack, string $member): ?string {
+  if ($pack === '' || basename($pack) !== $pack || !class_exists('ZipArchive')) return null;
+  $zip = new ZipArchive();
+  if ($zip->open($GLOBALS['ARCHIVE_STORE_DIR'] . '/packs/' . $pack) !== true) return null;
+  $data = $zip->getFromName($member);
+  $zip->close();
+  return ($data === false) ? null : $data;
+}
+
+function archive_pack_json(string $pack, string $jsonFn): ?array {
+  $raw = archive_pack_member($pack, $jsonFn);
+  if ($raw === null) return null;
+  $j = json_decode($raw, true);
+  return is_array($j) ? $j : null;
+}
+
+// Classic report + document PDF of a deduplicated or packed sendebericht, rebuilt by the CLI.
+function send_rebuilt_archive_pdf(string $jsonFn, string $downloadName): void {
+  $tmp = tempnam(sys_get_temp_dir(), 'kfx-rebuild-');
+  if ($tmp === false) { http_response_code(500); echo "No temp file"; exit; }
+  $cmd = [$GLOBALS['ARCHIVE_CLI'], '--base', $GLOBALS['BASE'], 'rebuild', $jsonFn, '-o', $tmp];
+  $proc = proc_open($cmd, [1 => ['pipe', 'w'], 2 => ['pipe', 'w']], $pipes);
+  if (!is_resource($proc)) { @unlink($tmp); http_response_code(500); echo "Rebuild failed"; exit; }
+  stream_get_contents($pipes[1]);
+  $err = trim((string)stream_get_contents($pipes[2]));
+  fclose($pipes[1]);
+  fclose($pipes[2]);
+  $rc = proc_close($proc);
+  if ($rc !== 0 || !is_file($tmp) || (int)filesize($tmp) === 0) {
+    @unlink($tmp);
+    http_response_code($rc === 1 ? 404 : 500);
+    echo "Rebuild failed" . ($err !== '' ? ': ' . $err : '');
+    exit;
+  }
+  header('Content-Type: application/pdf');
+  header('Content-Disposition: inline; filename="' . str_replace('"', '', $downloadName) . '"');
+  header('Content-Length: ' . (string)filesize($tmp));
+  readfile($tmp);
+  @unlink($tmp);
+  exit;
+}
+
+// Best-effort: the worker's next backfill repairs anything missed here.
+function archive_index_remove(string $area, string $jsonFn): void {
+  $db = archive_index_db();
+  if ($db === null) return;
+  try {
+    $st = $db->prepare('DELETE FROM archive WHERE area = ? AND json_file = ?');
+    $st->execute([$area, $jsonFn]);
+  } catch (Throwable $e) {
+  }
+}
+
+function archive_index_move_to_ok(string $jsonFn, string $newJson, string $newPdf): void {
+  $db = archive_index_db();
+  if ($db === null) return;
+  try {
+    $st = $db->prepare("UPDATE archive SET area = 'ok', json_file = ?, pdf_file = ? WHERE area = 'failed' AND json_file = ?");
+    $st->execute([$newJson, $newPdf, $jsonFn]);
+  } catch (Throwable $e) {
+  }
+}
+
 function is_aborted_job(array $j): bool {
   if (isset($j['cancel']) && is_array($j['cancel'])) {
     $req = (bool)($j['cancel']['requested'] ?? false);
@@ -680,6 +857,7 @@ function move_failure_report_to_archive(string $jsonFn): bool {
 
   if (!@rename($jsonPath, $destJson)) return false;
 
+  $movedPdf = '';
   $pdfFn = failed_pdf_for_json($jsonFn);
   if ($pdfFn !== '') {
     $srcPdf = $GLOBALS['DIR_FAIL_REP'] . '/' . $pdfFn;
@@ -688,10 +866,11 @@ function move_failure_report_to_archive(string $jsonFn): bool {
       if (is_file($destPdf)) {
         $destPdf = $GLOBALS['DIR_ARCHIVE'] . '/' . preg_replace('/\.pdf\z/i', '', $pdfFn) . '.moved.' . random_suffix(6) . '.pdf';
       }
-      @rename($srcPdf, $destPdf);
+      if (@rename($srcPdf, $destPdf)) $movedPdf = basename($destPdf);
     }
   }
 
+  archive_index_move_to_ok($jsonFn, basename($destJson), $movedPdf);
   return true;
 }
 
@@ -703,6 +882,24 @@ function find_failure_report_for_resend_pdf(string $pdfFn): ?string {
   $exactPath = $GLOBALS['DIR_FAIL_REP'] . '/' . $exact;
   if (within_dir($exactPath, $GLOBALS['DIR_FAIL_REP']) && is_file($exactPath)) return $exact;
 
+  $db = archive_index_db();
+  if ($db !== null) {
+    try {
+      // same matching as below, oldest first
+      $like = addcslashes($stem . '__JOB-', '%_\\') . '%.json';
+      $st = $db->prepare("SELECT json_file FROM archive WHERE area = 'failed' AND "
+        . "(json_file = ? OR json_file LIKE ? ESCAPE '\\' OR source_file = ?) ORDER BY json_mtime, json_file");
+      $st->execute([$exact, $like, $pdfFn]);
+      foreach ($st->fetchAll(PDO::FETCH_COLUMN, 0) as $fn) {
+        $p = $GLOBALS['DIR_FAIL_REP'] . '/' . $fn;
+        if (basename((string)$fn) === $fn && within_dir($p, $GLOBALS['DIR_FAIL_REP']) && is_file($p)) return (string)$fn;
+      }
+      return null;
+    } catch (Throwable $e) {
+      // fall through to the directory scan
+    }
+  }
+
   $candidates = [];
   if (!is_dir($GLOBALS['DIR_FAIL_REP'])) return null;
   $dh = opendir($GLOBALS['DIR_FAIL_REP']);
@@ -880,6 +1077,7 @@ function build_active_jobs_payload(array $activePreview): array {
     $faxstat = '';
     $liveUpdatedAt = '';
     $asteriskFax = null;
+    $eta = null;
 
     if (is_array($live)) {
       $liveUpdatedAt = (string)($live['updated_at'] ?? '');
@@ -895,6 +1093,13 @@ function build_active_jobs_payload(array $activePreview): array {
       }
       $state = (string)($live['state'] ?? '');
       $faxstat = (string)($live['faxstat_status'] ?? '');
+      if ($where === 'queue' && isset($live['eta']) && is_array($live['eta'])) {
+        $eta = [
+          'position' => isset($live['eta']['position']) ? (int)$live['eta']['position'] : null,
+          'start_at' => (string)($live['eta']['start_at'] ?? ''),
+          'done_at' => (string)($live['eta']['done_at'] ?? ''),
+        ];
+      }
       if (isset($live['asterisk_fax']) && is_array($live['asterisk_fax'])) {
         $af = $live['asterisk_fax'];
         $asteriskFax = [
@@ -928,6 +1133,7 @@ function build_active_jobs_payload(array $activePreview): array {
       'created_at' => $createdAt,
       'submitted_at' => $submittedAt,
       'started_at' => $startedAt,
+      'eta' => $eta,
       'live' => $live ? [
         'updated_at' => $liveUpdatedAt,
         'progress' => ['sent' => $progressSent, 'total' => $progressTotal, 'raw' => $progressRaw],
@@ -988,6 +1194,11 @@ if ($download !== '') {
     send_file_pdf($path, $file);
   }
 
+  if ($type === 'okfull') {
+    if ($file === '' || $file !== basename($file) || !preg_match('/\A(.+)\.json\z/i', $file, $m)) { http_response_code(400); echo "Bad file"; exit; }
+    send_rebuilt_archive_pdf($file, $m[1] . '__OK.pdf');
+  }
+
   if ($type === 'failedpdf') {
     if ($file === '' || !preg_match('/\.pdf\z/i', $file)) { http_response_code(400); echo "Bad file"; exit; }
     $path = $GLOBALS['DIR_FAIL_REP'] . '/' . $file;
@@ -998,6 +1209,15 @@ if ($download !== '') {
   if ($type === 'jsonok') {
     if ($file === '' || !preg_match('/\.json\z/i', $file)) { http_response_code(400); echo "Bad file"; exit; }
     $path = $GLOBALS['DIR_ARCHIVE'] . '/' . $file;
+    if (!is_file($path) && $file === basename($file)) {
+      $raw = archive_pack_member(archive_pack_of($file), $file);
+      if ($raw !== null) {
+        header('Content-Type: application/json; charset=utf-8');
+        header('Content-Disposition: inline; filename="' . str_replace('"', '', $file) . '"');
+        echo $raw;
+        exit;
+      }
+    }
     if (!within_dir($path, $GLOBALS['DIR_ARCHIVE'])) { http_response_code(400); echo "Bad path"; exit; }
     send_file_text($path, $file, 'application/json');
   }
@@ -1268,6 +1488,7 @@ if ($action === 'fail_cleanup') {
       if ($op === 'delete') {
         $ok = true;
         if (!@unlink($jsonPath)) $ok = false;
+        else archive_index_remove('failed', $jsonFn);
         if ($pdfFn !== '') {
           $pdfPath = $DIR_FAIL_REP . '/' . $pdfFn;
           if (within_dir($pdfPath, $DIR_FAIL_REP) && is_file($pdfPath)) {
@@ -1336,6 +1557,20 @@ $view = (string)($_GET['view'] ?? '');
 $src  = (string)($_GET['src'] ?? $DEFAULT_SOURCE);
 if ($view === '' && !isset($ALLOW_SOURCES[$src])) $src = $DEFAULT_SOURCE;
 
+// -------------------- AJAX (Long-Poll Job-Aenderungen) --------------------
+if ((string)($_GET['ajax'] ?? '') === 'changes') {
+  $since = (int)($_GET['since'] ?? -1);
+  $seq = read_job_change_seq($JOB_DB_PATH);
+  $deadline = microtime(true) + $JOB_CHANGES_WAIT_SEC;
+  while ($seq !== null && $seq === $since && microtime(true) < $deadline) {
+    usleep(500000);
+    $seq = read_job_change_seq($JOB_DB_PATH);
+  }
+  header('Content-Type: application/json; charset=utf-8');
+  echo json_encode(['seq' => $seq]) . "\n";
+  exit;
+}
+
 // -------------------- Sidebar Data --------------------
 $queueJobs = list_job_dirs($DIR_QUEUE);
 $procJobs  = list_job_dirs($DIR_PROC);
@@ -1344,17 +1579,46 @@ function read_job_meta(string $jobDir): ?array {
   return read_json_file($jobDir . '/job.json');
 }
 
+// Live progress comes from the worker's compact status file; job.json only
+// carries live state changes. Queued jobs get their forecast (eta: position,
+// start_at, done_at) from the "queue" part of the same file.
+// Clustered workers write one file per node (live-status.<node>.json).
+function read_live_status_jobs(): array {
+  $path = (string)$GLOBALS['LIVE_STATUS_PATH'];
+  $files = glob(preg_replace('/\.json$/', '', $path) . '.*.json') ?: [];
+  array_unshift($files, $path);
+  $jobs = [];
+  foreach ($files as $f) {
+    $j = read_json_file($f);
+    if (!is_array($j)) continue;
+    foreach (['queue', 'jobs'] as $part) {
+      if (isset($j[$part]) && is_array($j[$part])) $jobs = array_merge($jobs, $j[$part]);
+    }
+  }
+  return $jobs;
+}
+
+function merge_live_status(?array $meta, array $liveStatus, string $jid): ?array {
+  if (!is_array($meta) || !isset($liveStatus[$jid]) || !is_array($liveStatus[$jid])) return $meta;
+  $live = (isset($meta['live']) && is_array($meta['live'])) ? $meta['live'] : [];
+  $meta['live'] = array_merge($live, $liveStatus[$jid]);
+  return $meta;
+}
+
 $activePreview = [];
+$liveStatus = (count($procJobs) + count($queueJobs)) > 0 ? read_live_status_jobs() : [];
 foreach (array_reverse($procJobs) as $jid) {
   if (count($activePreview) >= $GLOBALS['MAX_ACTIVE_JOBS']) break;
-  $activePreview[] = ['id' => $jid, 'where' => 'processing', 'meta' => read_job_meta($GLOBALS['DIR_PROC'] . '/' . $jid)];
+  $meta = merge_live_status(read_job_meta($GLOBALS['DIR_PROC'] . '/' . $jid), $liveStatus, $jid);
+  $activePreview[] = ['id' => $jid, 'where' => 'processing', 'meta' => $meta];
 }
 foreach (array_reverse($queueJobs) as $jid) {
   if (count($activePreview) >= $GLOBALS['MAX_ACTIVE_JOBS']) break;
-  $activePreview[] = ['id' => $jid, 'where' => 'queue', 'meta' => read_job_meta($GLOBALS['DIR_QUEUE'] . '/' . $jid)];
+  $meta = merge_live_status(read_job_meta($GLOBALS['DIR_QUEUE'] . '/' . $jid), $liveStatus, $jid);
+  $activePreview[] = ['id' => $jid, 'where' => 'queue', 'meta' => $meta];
 }
 
-$failCount = count_json_files($DIR_FAIL_REP, 999);
+$failCount = archive_index_count('failed') ?? count_json_files($DIR_FAIL_REP, 999);
 $hasFails = ($failCount > 0);
 $inboxFaxSummary = summarize_inbox_pdfs($DIR_FAX_INBOX);
 $inboxScanSummary = summarize_inbox_pdfs($DIR_SCAN_INBOX);
@@ -1695,6 +1959,8 @@ foreach ($contacts as $c) {
               } elseif ($where === 'queue') {
                 $hm = hhmm_from_iso($createdAt);
                 $line2 = 'queued' . ($hm !== '' ? (' · erstellt ' . $hm) : '');
+                $startHm = hhmm_from_iso(is_array($live) && is_array($live['eta'] ?? null) ? (string)($live['eta']['start_at'] ?? '') : '');
+                if ($startHm !== '') $line2 .= ' · Start ~' . $startHm;
               } else {
                 $line2 = ($where !== '' ? $where : 'aktiv');
               }
@@ -1915,6 +2181,8 @@ foreach ($contacts as $c) {
       <?php
         $showAll = isset($_GET['all']) && ((string)$_GET['all'] === '1');
         $limit = $showAll ? 500 : $MAX_ARCHIVE_LIST;
+        $q = trim((string)($_GET['q'] ?? ''));
+        $indexed = archive_index_list('ok', $limit, $q);
       ?>
       <div style="display:flex; justify-content:space-between; align-items:end; gap:12px; flex-wrap:wrap;">
         <h2 class="section-title" style="margin:0;">✅ Sendeprotokoll (letzte <?=$showAll ? $limit : $MAX_ARCHIVE_LIST?>)</h2>
@@ -1927,9 +2195,28 @@ foreach ($contacts as $c) {
         </div>
       </div>
 
+      <?php if (archive_index_db() !== null): ?>
+        <form method="get" class="checkline" style="align-items:center; margin:10px 0;">
+          <input type="hidden" name="view" value="sendelog">
+          <?php if ($showAll): ?><input type="hidden" name="all" value="1"><?php endif; ?>
+          <input type="text" name="q" value="<?=h($q)?>" placeholder="Suche: Name, Nummer, Datei, Fehler" style="max-width:360px;">
+          <button class="btn ghost small" type="submit">🔎 Suchen</button>
+          <?php if ($q !== ''): ?><a class="btn ghost small" href="?view=sendelog<?=$showAll ? '&amp;all=1' : ''?>">✖ zurücksetzen</a><?php endif; ?>
+        </form>
+      <?php endif; ?>
+
       <?php
         $items = [];
-        if (is_dir($DIR_ARCHIVE)) {
+        if ($indexed !== null) {
+          foreach ($indexed as $row) {
+            $e = $row['json_file'];
+            $pack = (string)$row['pack'];
+            $j = ($pack !== '') ? archive_pack_json($pack, $e) : read_json_file($DIR_ARCHIVE . '/' . $e);
+            if (!is_array($j)) continue; // stale row (the worker's backfill drops it) or no php-zip
+            $end = (string)($j['end_time'] ?? $j['completed_at'] ?? $j['updated_at'] ?? '');
+            $items[] = ['json' => $e, 'data' => $j, 'ts' => parse_iso_time($end) ?? 0, 'pack' => $pack];
+          }
+        } elseif (is_dir($DIR_ARCHIVE)) {
           $dh = opendir($DIR_ARCHIVE);
           if ($dh !== false) {
             while (($e = readdir($dh)) !== false) {
@@ -1986,7 +2273,9 @@ foreach ($contacts as $c) {
               $pages = extract_pages($j);
 
               $pdf = '';
-              if (preg_match('/\A(.+)\.json\z/i', $it['json'], $m)) {
+              // packed or report page + stored document: classic PDF is rebuilt on download
+              $rebuild = (($it['pack'] ?? '') !== '') || !empty($j['archive_store']['doc']);
+              if (!$rebuild && preg_match('/\A(.+)\.json\z/i', $it['json'], $m)) {
                 $stem = $m[1];
                 $cand = $stem . '__OK.pdf';
                 if (is_file($DIR_ARCHIVE . '/' . $cand)) $pdf = $cand;
@@ -2003,7 +2292,8 @@ foreach ($contacts as $c) {
               <td class="nowrap"><?=h($dur ?: '—')?></td>
               <td class="nowrap"><?=h($pages ?: '—')?></td>
               <td class="right nowrap">
-                <?php if ($pdf !== ''): ?><a class="btn ghost small" href="?download=okpdf&amp;file=<?=h($pdf)?>">📄 PDF</a><?php else: ?><span class="mut">—</span><?php endif; ?>
+                <?php if ($rebuild): ?><a class="btn ghost small" href="?download=okfull&amp;file=<?=h($it['json'])?>">📄 PDF</a>
+                <?php elseif ($pdf !== ''): ?><a class="btn ghost small" href="?download=okpdf&amp;file=<?=h($pdf)?>">📄 PDF</a><?php else: ?><span class="mut">—</span><?php endif; ?>
                 <a class="btn ghost small" href="?download=jsonok&amp;file=<?=h($it['json'])?>">🧾 JSON</a>
               </td>
             </tr>
@@ -2027,7 +2317,16 @@ foreach ($contacts as $c) {
 
       <?php
         $fails = [];
-        if (is_dir($DIR_FAIL_REP)) {
+        $indexed = archive_index_list('failed', $MAX_FAIL_LIST);
+        if ($indexed !== null) {
+          foreach ($indexed as $row) {
+            $e = $row['json_file'];
+            $j = read_json_file($DIR_FAIL_REP . '/' . $e);
+            if (!is_array($j)) continue;
+            $t = (string)($j['end_time'] ?? $j['updated_at'] ?? $j['created_at'] ?? '');
+            $fails[] = ['json' => $e, 'data' => $j, 'ts' => parse_iso_time($t) ?? 0];
+          }
+        } elseif (is_dir($DIR_FAIL_REP)) {
           $dh = opendir($DIR_FAIL_REP);
           if ($dh !== false) {
             while (($e = readdir($dh)) !== false) {
@@ -2539,7 +2838,16 @@ foreach ($contacts as $c) {
             hm = pad2(d.getHours()) + ':' + pad2(d.getMinutes());
           }
         }
-        return 'queued' + (hm ? (' · erstellt ' + hm) : '');
+        let startHm = '';
+        const sa = job.eta ? safeText(job.eta.start_at) : '';
+        if (sa) {
+          const t = Date.parse(sa);
+          if (!isNaN(t)) {
+            const d = new Date(t);
+            startHm = pad2(d.getHours()) + ':' + pad2(d.getMinutes());
+          }
+        }
+        return 'queued' + (hm ? (' · erstellt ' + hm) : '') + (startHm ? (' · Start ~' + startHm) : '');
       }
 
       return where || 'aktiv';
@@ -2705,8 +3013,34 @@ foreach ($contacts as $c) {
       }
     }
 
+    // Mit SQLite-Jobindex im Worker: sofort nachladen, sobald sich ein Job aendert.
+    async function waitForJobChanges(){
+      let seq = -1;
+      for (;;) {
+        if (document.visibilityState !== 'visible') {
+          await new Promise(r => setTimeout(r, 5000));
+          continue;
+        }
+        try {
+          const url = new URL(window.location.href);
+          url.searchParams.set('ajax', 'changes');
+          url.searchParams.set('since', String(seq));
+          url.searchParams.set('_', String(Date.now()));
+          const res = await fetch(url.toString(), {cache: 'no-store'});
+          if (!res.ok) return;
+          const j = await res.json();
+          if (typeof j.seq !== 'number') return;
+          if (seq >= 0 && j.seq !== seq) poll();
+          seq = j.seq;
+        } catch (e) {
+          return;
+        }
+      }
+    }
+
     poll();
     setInterval(poll, 5000);
+    waitForJobChanges();
   })();
 </script>
 